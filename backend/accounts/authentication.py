@@ -0,0 +1,181 @@
+# backend/accounts/authentication.py: OAuth2 bearer-token authentication with a per-process validation cache
+# - A validated token is remembered (user, scopes, expiry) so later requests skip the AccessToken/User lookup
+# - Entries live for at most OAUTH2_TOKEN_CACHE_TTL seconds and never past the token's own expiry
+# - The cache is bounded (LRU, OAUTH2_TOKEN_CACHE_SIZE entries) and evicted when a token is revoked or changed
+# - Other processes learn of that through a per-token revocation counter in the shared Django cache
+#   (caches[OAUTH2_TOKEN_CACHE_ALIAS]): an entry is only served while the counter still has the value
+#   read before the token was validated; with a per-process cache backend (the local-memory default),
+#   other workers keep serving a revoked token for up to OAUTH2_TOKEN_CACHE_TTL seconds
+# - aauthenticate() serves cache hits on the event loop for async views; misses validate in a worker thread
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from drf_spectacular.contrib.django_oauth_toolkit import DjangoOAuthToolkitScheme
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+
+
+def token_checksum(token):
+    # same digest as AccessToken.token_checksum
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def revocation_key(checksum):
+    return f"oauth2:revoked:{checksum}"
+
+
+def get_revocation_cache():
+    return caches[settings.OAUTH2_TOKEN_CACHE_ALIAS]
+
+
+def revoke(checksums):
+    """
+    Make every process validate these tokens again before serving them from its cache.
+    """
+    cache = get_revocation_cache()
+    for checksum in checksums:
+        key = revocation_key(checksum)
+        # a counter only has to outlive the entries cached before it changed
+        if not cache.add(key, 1, settings.OAUTH2_TOKEN_CACHE_TTL):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # expired in between
+                cache.add(key, 1, settings.OAUTH2_TOKEN_CACHE_TTL)
+
+
+class ValidatedToken:
+    """
+    What the permission classes need from an AccessToken, without the database row.
+    """
+    def __init__(self, access_token):
+        self.id = access_token.id
+        self.user_id = access_token.user_id
+        self.scope = access_token.scope
+        self.scopes = frozenset(access_token.scope.split())
+        self.expires = access_token.expires
+
+    def is_expired(self):
+        return timezone.now() >= self.expires
+
+    def allow_scopes(self, scopes):
+        return not scopes or self.scopes.issuperset(scopes)
+
+    def is_valid(self, scopes=None):
+        return not self.is_expired() and self.allow_scopes(scopes)
+
+
+class TokenCache:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, checksum):
+        with self.lock:
+            entry = self.entries.get(checksum)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[checksum]
+                return None
+            self.entries.move_to_end(checksum)
+            return entry[1], entry[2], entry[3]
+
+    def set(self, checksum, user, token, revision):
+        lifetime = min(
+            settings.OAUTH2_TOKEN_CACHE_TTL,
+            (token.expires - timezone.now()).total_seconds(),
+        )
+        if lifetime <= 0:
+            return
+        with self.lock:
+            self.entries[checksum] = (time.monotonic() + lifetime, user, token, revision)
+            self.entries.move_to_end(checksum)
+            while len(self.entries) > settings.OAUTH2_TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def evict(self, checksum):
+        with self.lock:
+            self.entries.pop(checksum, None)
+
+    def evict_user(self, user_id):
+        with self.lock:
+            for checksum in [key for key, entry in self.entries.items() if entry[2].user_id == user_id]:
+                del self.entries[checksum]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """
+    OAuth2Authentication that only hits the database the first time it sees a bearer token.
+    request.auth is a ValidatedToken on both cache hits and misses.
+    """
+    def authenticate(self, request):
+        header = request.META.get("HTTP_AUTHORIZATION", "")
+        scheme, _, token = header.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return super().authenticate(request)
+
+        checksum = token_checksum(token)
+        cached = token_cache.get(checksum)
+        if cached is not None:
+            user, validated, revision = cached
+            if get_revocation_cache().get(revocation_key(checksum)) == revision:
+                # callers may modify request.user, so never hand out the shared instance
+                return copy.copy(user), validated
+            # revoked or changed in another process
+            token_cache.evict(checksum)
+        return self.validate(request, checksum)
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views; the in-memory cache is safe to read on the event loop.
+        """
+        header = request.META.get("HTTP_AUTHORIZATION", "")
+        scheme, _, token = header.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return await sync_to_async(super().authenticate)(request)
+
+        checksum = token_checksum(token)
+        cached = token_cache.get(checksum)
+        if cached is not None:
+            user, validated, revision = cached
+            if await get_revocation_cache().aget(revocation_key(checksum)) == revision:
+                return copy.copy(user), validated
+            token_cache.evict(checksum)
+        # oauthlib's request validator is synchronous
+        return await sync_to_async(self.validate)(request, checksum)
+
+    def validate(self, request, checksum):
+        # read before the token, so a revocation while validating leaves the entry stale
+        revision = get_revocation_cache().get(revocation_key(checksum))
+        result = super().authenticate(request)
+        if result is None:
+            return None
+        user, access_token = result
+        validated = ValidatedToken(access_token)
+        token_cache.set(checksum, copy.copy(user), validated, revision)
+        return user, validated
+
+
+class CachedOAuth2Scheme(DjangoOAuthToolkitScheme):
+    target_class = "accounts.authentication.CachedOAuth2Authentication"
+
+    def get_security_requirement(self, auto_schema):
+        requirement = super().get_security_requirement(auto_schema)
+        # MethodScopedTokenHasScope resolves scopes to frozensets
+        if isinstance(requirement, dict):
+            return {name: sorted(scopes) for name, scopes in requirement.items()}
+        return requirement
@@ -1,3 +1,24 @@
-from django.db import models
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oauth2_provider.models import AccessToken
+from .authentication import revoke, token_cache
+
+User = get_user_model()
 
 # Create your models here.
+
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def evict_cached_token(sender, instance, **kwargs):
+    # covers revocation (the token row is deleted) and scope/expiry changes, here and in other processes
+    token_cache.evict(instance.token_checksum)
+    revoke([instance.token_checksum])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_user_tokens(sender, instance, **kwargs):
+    # cached tokens carry a copy of the user, which must not outlive profile or is_active changes
+    token_cache.evict_user(instance.pk)
+    revoke(AccessToken.objects.filter(user_id=instance.pk).values_list("token_checksum", flat=True))
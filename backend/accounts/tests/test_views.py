@@ -1,8 +1,13 @@
+import time
+from unittest import mock
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
 from rest_framework.test import APITestCase
 from oauth2_provider.models import Application, AccessToken
 from django.utils import timezone
 from datetime import timedelta
+from accounts.authentication import token_cache
 
 User = get_user_model()
 
@@ -100,3 +105,82 @@ class UserDetailViewTest(APITestCase):
         data = resp.json()
         self.assertEqual(data['first_name'], 'NewName')
         self.assertEqual(data['phone'], '12345')
+
+class TokenCacheTest(APITestCase):
+    url = '/accounts/user/'
+
+    def setUp(self):
+        token_cache.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='pass1234', first_name='Before')
+        self.app = Application.objects.create(
+            user=self.user,
+            name='cache_app',
+            client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        self.token = AccessToken.objects.create(
+            user=self.user,
+            application=self.app,
+            token='cached_token',
+            expires=timezone.now() + timedelta(hours=1),
+            scope='read:customers write:customers'
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.token}')
+
+    def test_token_lookup_cached(self):
+        # token + user lookup, then the customer profile
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_revoked_token_evicted(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.token.revoke()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def in_other_process(self):
+        # the signals there only reach this process through the shared cache
+        return mock.patch.multiple(token_cache, evict=mock.DEFAULT, evict_user=mock.DEFAULT)
+
+    def test_revocation_elsewhere_reaches_the_cache(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.in_other_process():
+            self.token.revoke()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_user_change_elsewhere_reaches_the_cache(self):
+        self.assertEqual(self.client.get(self.url).json()['first_name'], 'Before')
+        with self.in_other_process():
+            self.user.first_name = 'Elsewhere'
+            self.user.save()
+        self.assertEqual(self.client.get(self.url).json()['first_name'], 'Elsewhere')
+
+    def test_scope_change_evicted(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.token.scope = 'write:customers'
+        self.token.save()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_entry_never_outlives_token(self):
+        AccessToken.objects.filter(pk=self.token.pk).update(expires=timezone.now() + timedelta(seconds=2))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        deadline = next(iter(token_cache.entries.values()))[0]
+        self.assertLessEqual(deadline - time.monotonic(), 2)
+
+    def test_profile_update_visible(self):
+        self.assertEqual(self.client.get(self.url).json()['first_name'], 'Before')
+        self.client.put(self.url, {'first_name': 'After'}, format='json')
+        self.assertEqual(self.client.get(self.url).json()['first_name'], 'After')
+
+    @override_settings(OAUTH2_TOKEN_CACHE_SIZE=1)
+    def test_cache_bounded(self):
+        other = AccessToken.objects.create(
+            user=self.user, application=self.app, token='cached_token2',
+            expires=timezone.now() + timedelta(hours=1), scope='read:customers'
+        )
+        self.client.get(self.url)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {other.token}')
+        self.client.get(self.url)
+        self.assertEqual(len(token_cache.entries), 1)
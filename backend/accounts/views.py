@@ -10,8 +10,10 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import logout as django_logout
 from django.conf import settings
 from django.shortcuts import redirect
-from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from .authentication import CachedOAuth2Authentication
 from catalog.views import MethodScopedTokenHasScope
+from ecomm.asyncviews import AsyncViewMixin
+from sales.models import Customer
 from drf_spectacular.utils import extend_schema
 from .serializers import RegisterSerializer
 
@@ -52,19 +54,27 @@ class RegisterView(APIView):
         )
         return Response({"success": True, "user_id": user.id}, status=201)
 
-class UserDetail(APIView):
+class UserDetail(AsyncViewMixin, APIView):
     """
     Retrieve the current authenticated user's username and email.
     """
-    authentication_classes = [OAuth2Authentication]
+    authentication_classes = [CachedOAuth2Authentication]
     permission_classes = [IsAuthenticated, MethodScopedTokenHasScope]
     required_scopes = {'GET': ['read:customers'], 'PUT': ['write:customers']}
     
     def get(self, request):
         user = request.user
         # Include user and customer profile details
-        profile = getattr(user, 'customer', None)
-        return Response({
+        return Response(self.user_data(user, getattr(user, 'customer', None)))
+
+    async def aget(self, request):
+        # async view under ASGI (ecomm/asyncviews.py); the profile is fetched with the async ORM
+        user = request.user
+        return Response(self.user_data(user, await Customer.objects.filter(user=user).afirst()))
+
+    @staticmethod
+    def user_data(user, profile):
+        return {
             'username': user.username,
             'email': user.email,
             'first_name': user.first_name,
@@ -75,7 +85,7 @@ class UserDetail(APIView):
             'state': profile.state if profile else '',
             'postal_code': profile.postal_code if profile else '',
             'country': profile.country if profile else '',
-        })
+        }
 
     def put(self, request):
         user = request.user
@@ -95,18 +105,7 @@ class UserDetail(APIView):
             profile.postal_code = request.data.get('postal_code', profile.postal_code)
             profile.country = request.data.get('country', profile.country)
             profile.save()
-        return Response({
-            'username': user.username,
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'phone': profile.phone if profile else '',
-            'street_address': profile.street_address if profile else '',
-            'city': profile.city if profile else '',
-            'state': profile.state if profile else '',
-            'postal_code': profile.postal_code if profile else '',
-            'country': profile.country if profile else '',
-        })
+        return Response(self.user_data(user, profile))
 
 def public_logout(request):
     """
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
+
+    def ready(self):
+        from .search import create_search_extensions, create_search_indexes
+        pre_migrate.connect(create_search_extensions, sender=self)
+        post_migrate.connect(create_search_indexes, sender=self)
@@ -0,0 +1,275 @@
+# catalog/cache.py: response cache for catalog reads (categories, products)
+# - Entries are keyed by view, action, lookup kwargs and normalized query params
+# - Every key embeds a generation counter; any catalog write bumps it, orphaning all cached entries at once
+# - Stock-only changes (checkout) skip that: invalidate_stock() stamps the products changed, and an entry
+#   showing one of them is rebuilt on its next read; keys of requests filtering on stock embed a stock
+#   generation instead, as a stock change can move products across their pages
+# - Cached responses carry ETag/Last-Modified headers so clients can revalidate and get 304s; Last-Modified
+#   is the time of the latest catalog write (not the objects' updated_at, which spec, image and stock
+#   changes or deletions leave alone)
+# - alist/aretrieve do the same for async views (ecomm/asyncviews.py)
+# - Responses read from a replica shortly after a catalog write may predate it (replication lag), so they
+#   are only cached until DATABASE_REPLICA_PIN_SECONDS after the write (ecomm/replicas.py)
+
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from ecomm.replicas import reading_from_replica
+
+GENERATION_KEY = "catalog:generation"
+# time of the latest catalog write
+WRITTEN_KEY = "catalog:written"
+STOCK_GENERATION_KEY = "catalog:stock-generation"
+# in-process backends never wait on I/O, so async code calls them directly instead of via a<method>()
+INLINE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # seed from the clock so a flushed cache never reuses an old generation
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def acall(cache, method, *args):
+    """
+    cache.<method>(*args) from async code.
+    """
+    if isinstance(cache, INLINE_BACKENDS):
+        return getattr(cache, method)(*args)
+    return await getattr(cache, f"a{method}")(*args)
+
+
+async def aget_generation():
+    cache = get_cache()
+    generation = await acall(cache, "get", GENERATION_KEY)
+    if generation is None:
+        await acall(cache, "add", GENERATION_KEY, time.time_ns(), None)
+        generation = await acall(cache, "get", GENERATION_KEY)
+    return generation
+
+
+def stock_key(product_id):
+    # time (ns) of the product's latest stock change
+    return f"catalog:stock:{product_id}"
+
+
+def incr_generation(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_generation():
+    cache = get_cache()
+    cache.set(WRITTEN_KEY, time.time(), None)
+    incr_generation(cache, GENERATION_KEY)
+
+
+def bump_stock(product_ids):
+    cache = get_cache()
+    cache.set(WRITTEN_KEY, time.time(), None)
+    changed = time.time_ns()
+    cache.set_many({stock_key(product_id): changed for product_id in product_ids}, None)
+    incr_generation(cache, STOCK_GENERATION_KEY)
+
+
+def invalidate_catalog_cache():
+    """
+    Invalidate every cached catalog response.
+    Bumps now, so reads inside the writing transaction miss the cache, and again on
+    commit, so entries cached by concurrent readers before the commit are dropped too.
+    """
+    bump_generation()
+    transaction.on_commit(bump_generation)
+
+
+def invalidate_stock(product_ids):
+    """
+    Invalidate the cached catalog responses showing the stock of `product_ids`, and those filtering
+    on stock; now and again on commit, like invalidate_catalog_cache().
+    """
+    product_ids = list(product_ids)
+    bump_stock(product_ids)
+    transaction.on_commit(lambda: bump_stock(product_ids))
+
+
+def entry_timeout(written):
+    """
+    Cache timeout for a response just built, given the time of the latest catalog write.
+    """
+    lag_window = settings.DATABASE_REPLICA_PIN_SECONDS
+    if written is not None and time.time() - written < lag_window:
+        return lag_window
+    return settings.CATALOG_CACHE_TIMEOUT
+
+
+def normalize_query(query_dict):
+    """
+    Stable representation of the query string, independent of parameter order.
+    """
+    pairs = sorted(
+        (key, value)
+        for key, values in query_dict.lists()
+        for value in values
+    )
+    return urlencode(pairs)
+
+
+def last_modified(written):
+    """
+    Last-Modified timestamp of a response just built, given the time of the latest catalog write;
+    with no write on record (e.g. after a cache flush) the response is taken as new.
+    """
+    return int(written if written is not None else time.time())
+
+
+def stock_changed(versions, current):
+    """
+    Whether a product's stock changed since an entry recorded `versions` ({stock key: version or
+    None}), given the `current` versions as returned by get_many().
+    """
+    return any(current.get(key) != version for key, version in versions.items())
+
+
+class CachedReadMixin:
+    """
+    ViewSet mixin caching list/retrieve responses.
+    Authentication and permission checks still run on every request; only the
+    queryset and serializer work is skipped on a cache hit.
+    Set `cached_stock` on views whose objects are products showing their stock.
+    """
+    cached_stock = False
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.acached_response(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.acached_response(super().aretrieve, request, *args, **kwargs)
+
+    def filters_on_stock(self, request):
+        return self.cached_stock and any(name.startswith("stock") for name in request.query_params)
+
+    def stock_keys(self, data):
+        """
+        Stock version keys of the products in a response.
+        """
+        if not self.cached_stock:
+            return []
+        if isinstance(data, dict) and isinstance(data.get("results"), list):
+            objects = data["results"]
+        else:
+            objects = [data]
+        return [stock_key(obj["id"]) for obj in objects if isinstance(obj, dict) and "id" in obj]
+
+    def get_cache_key(self, request, generation=None, stock_generation=None):
+        lookup = "&".join(f"{key}={value}" for key, value in sorted(self.kwargs.items()))
+        raw = "|".join([
+            self.basename or type(self).__name__,
+            self.action,
+            lookup,
+            # paginated responses embed absolute next/previous links
+            request.build_absolute_uri("/"),
+            normalize_query(request.query_params),
+            str(stock_generation),
+        ])
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        if generation is None:
+            generation = get_generation()
+        return f"catalog:{generation}:{digest}"
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_cache()
+        stock_generation = cache.get(STOCK_GENERATION_KEY) if self.filters_on_stock(request) else None
+        key = self.get_cache_key(request, stock_generation=stock_generation)
+        entry = cache.get(key)
+        if entry is not None and entry["stock"] and stock_changed(entry["stock"], cache.get_many(list(entry["stock"]))):
+            entry = None
+        if entry is None:
+            started = time.time_ns()
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            written = cache.get(WRITTEN_KEY)
+            keys = self.stock_keys(response.data)
+            entry = self.cache_entry(key, response, written, cache.get_many(keys) if keys else {}, keys)
+            if self.cacheable(entry, started):
+                cache.set(key, entry, entry_timeout(written if reading_from_replica() else None))
+        else:
+            response = Response(entry["data"])
+        return self.conditional_response(request, response, entry)
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        cache = get_cache()
+        stock_generation = await acall(cache, "get", STOCK_GENERATION_KEY) if self.filters_on_stock(request) else None
+        key = self.get_cache_key(request, await aget_generation(), stock_generation)
+        entry = await acall(cache, "get", key)
+        if entry is not None and entry["stock"]:
+            if stock_changed(entry["stock"], await acall(cache, "get_many", list(entry["stock"]))):
+                entry = None
+        if entry is None:
+            started = time.time_ns()
+            response = await handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            written = await acall(cache, "get", WRITTEN_KEY)
+            keys = self.stock_keys(response.data)
+            versions = await acall(cache, "get_many", keys) if keys else {}
+            entry = self.cache_entry(key, response, written, versions, keys)
+            if self.cacheable(entry, started):
+                await acall(cache, "set", key, entry, entry_timeout(written if reading_from_replica() else None))
+        else:
+            response = Response(entry["data"])
+        return self.conditional_response(request, response, entry)
+
+    def cache_entry(self, key, response, written, versions, keys):
+        """
+        Cache entry for a response; `versions` are the current stock versions of its products' `keys`.
+        """
+        stock = {name: versions.get(name) for name in keys}
+        return {
+            "data": response.data,
+            # the key embeds the generation, so the ETag changes on every catalog write; the stock
+            # versions change it on a stock change
+            "etag": quote_etag(hashlib.md5(repr((key, sorted(stock.items()))).encode()).hexdigest()),
+            "last_modified": last_modified(written),
+            "stock": stock,
+        }
+
+    def cacheable(self, entry, started):
+        """
+        Whether an entry built from queries run after `started` (ns) may be cached: not when a
+        product's stock changed meanwhile, as the entry may predate the change yet carry its version.
+        """
+        return all(version is None or version < started for version in entry["stock"].values())
+
+    def conditional_response(self, request, response, entry):
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(entry["last_modified"])
+        return get_conditional_response(
+            request,
+            etag=entry["etag"],
+            last_modified=entry["last_modified"],
+            response=response,
+        )
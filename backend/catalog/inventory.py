@@ -0,0 +1,99 @@
+# catalog/inventory.py: a product's stock split over STOCK_SLOTS counter rows (StockSlot)
+# - Checkout takes stock from one slot that can cover the line, picked at random among those not
+#   locked by another checkout (FOR UPDATE SKIP LOCKED), so concurrent orders of a best-seller no
+#   longer queue on one row lock; only when no single slot is free and big enough does it lock all
+#   of the product's slots and drain them in slot order
+# - Product.stock stays the column the API reads and filters on (?stock__gte=): it is the cached sum
+#   of the slots, refreshed by a short UPDATE right after each checkout commits
+#   (ProductQuerySet.refresh_stock); the order.placed outbox handler repeats it in case that failed
+#   (sales/handlers.py)
+# - Editing stock (Product.save, ProductQuerySet.update) spreads the new total evenly over the slots;
+#   products inserted with bulk_create get their slots from Product.stock at their first checkout
+# - A new STOCK_SLOTS applies to a product at its next stock edit
+
+from django.conf import settings
+from django.db.models import Case, F, PositiveIntegerField, Subquery, Value, When
+from .models import Product, StockSlot
+
+
+def spread(total, count):
+    """
+    `total` split into `count` quantities that differ by at most one.
+    """
+    base, extra = divmod(total, count)
+    return [base + (slot < extra) for slot in range(count)]
+
+
+def reset_slots(stock, create_only=False):
+    """
+    Spread each product's stock, {product_id: stock}, over its slots. With create_only=True,
+    products whose slots exist already keep them.
+    """
+    count = max(1, settings.STOCK_SLOTS)
+    slots = [
+        StockSlot(product_id=product_id, slot=slot, qty=qty)
+        for product_id, total in stock.items()
+        for slot, qty in enumerate(spread(total, count))
+    ]
+    if create_only:
+        StockSlot.objects.bulk_create(slots, ignore_conflicts=True)
+        return
+    StockSlot.objects.bulk_create(
+        slots, update_conflicts=True, unique_fields=["product", "slot"], update_fields=["qty"],
+    )
+    StockSlot.objects.filter(product_id__in=stock, slot__gte=count).delete()
+
+
+def take_from_one_slot(product_id, qty):
+    """
+    Take `qty` from a random unlocked slot holding at least that much, in one UPDATE.
+    """
+    candidate = (
+        StockSlot.objects.filter(product_id=product_id, qty__gte=qty)
+        .order_by("?").select_for_update(skip_locked=True).values("pk")[:1]
+    )
+    return bool(StockSlot.objects.filter(pk=Subquery(candidate), qty__gte=qty).update(qty=F("qty") - qty))
+
+
+def take_from_all_slots(product_id, qty):
+    """
+    Lock every slot of the product and take `qty` from them in slot order, if they hold enough.
+    """
+    slots = StockSlot.objects.select_for_update().filter(product_id=product_id).order_by("slot")
+    current = list(slots.values_list("slot", "qty"))
+    if not current:
+        stock = Product.objects.filter(id=product_id).values_list("stock", flat=True).first()
+        if stock is None:
+            return False
+        # concurrent first checkouts insert the same rows; the later ones keep what the first wrote
+        reset_slots({product_id: stock}, create_only=True)
+        current = list(slots.values_list("slot", "qty"))
+    if sum(available for _, available in current) < qty:
+        return False
+    remaining, left = qty, {}
+    for slot, available in current:
+        taken = min(available, remaining)
+        if taken:
+            left[slot] = available - taken
+            remaining -= taken
+        if not remaining:
+            break
+    StockSlot.objects.filter(product_id=product_id, slot__in=left).update(qty=Case(
+        *[When(slot=slot, then=Value(value)) for slot, value in left.items()],
+        default=F("qty"),
+        output_field=PositiveIntegerField(),
+    ))
+    return True
+
+
+def take_stock(quantities):
+    """
+    Inside the checkout transaction: take {product_id: qty} from the products' slots, in product id
+    order so checkouts that fall back to locking every slot cannot deadlock. Returns the ids of the
+    products short of stock; the caller then rolls back.
+    """
+    unavailable = []
+    for product_id, qty in sorted(quantities.items()):
+        if not (take_from_one_slot(product_id, qty) or take_from_all_slots(product_id, qty)):
+            unavailable.append(product_id)
+    return unavailable
@@ -0,0 +1,91 @@
+import random
+import time
+from statistics import median
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from catalog.models import Category, Product
+from catalog.search import search_products, trigram_available
+
+# Small vocabulary so generated names/descriptions share words, like a real catalog
+WORDS = [
+    "laptop", "phone", "camera", "lamp", "desk", "chair", "bag", "sleeve", "wireless", "charger",
+    "speaker", "headphones", "monitor", "keyboard", "mouse", "cable", "stand", "cover", "case", "battery",
+    "portable", "gaming", "office", "kitchen", "garden", "steel", "leather", "cotton", "smart", "compact",
+]
+QUERIES = ["laptop", "lapt", "wireless charger", "leather bag", "gaming monitor stand", "zzzz"]
+
+
+def random_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+class Command(BaseCommand):
+    help = "Compare ILIKE search (DRF SearchFilter) with the full-text product search at several catalog sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument("--repeat", type=int, default=5, help="timed runs per query")
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--keep", action="store_true", help="keep the generated products instead of rolling back")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("bench_search needs Postgres")
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            category = Category.objects.create(name=f"bench-search-{rng.random()}")
+            created = 0
+            for size in sorted(options["sizes"]):
+                created = self.fill(category, created, size, rng, options["batch_size"])
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE catalog_product")
+                self.report(category, size, options["repeat"])
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+    def fill(self, category, created, size, rng, batch_size):
+        while created < size:
+            batch = min(batch_size, size - created)
+            Product.objects.bulk_create([
+                Product(
+                    category=category,
+                    name=random_text(rng, 3),
+                    slug=f"bench-search-{created + i}",
+                    description=random_text(rng, 25),
+                    price=rng.randint(1, 3000),
+                    stock=rng.randint(0, 250),
+                )
+                for i in range(batch)
+            ])
+            created += batch
+        return created
+
+    def timed(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            # a 12-row page, as the API would fetch
+            list(queryset.values_list("id", flat=True)[:12])
+            timings.append((time.perf_counter() - start) * 1000)
+        return median(timings)
+
+    def report(self, category, size, repeat):
+        products = Product.objects.filter(category=category)
+        self.stdout.write(self.style.NOTICE(f"{size:,} products (median ms for a 12-row page)"))
+        self.stdout.write(f"  {'query':<24}{'ilike':>10}{'fulltext':>10}{'trigram':>10}")
+        # "fulltext" is the API path: ranked matches; the API lists "trigram" matches when nothing matches
+        for text in QUERIES:
+            terms = text.split()
+            ilike = products
+            for term in terms:
+                ilike = ilike.filter(Q(name__icontains=term) | Q(description__icontains=term))
+            fulltext = search_products(products, text)
+            row = f"  {text:<24}{self.timed(ilike, repeat):>10.2f}{self.timed(fulltext, repeat):>10.2f}"
+            if trigram_available(connection.alias):
+                trigram = products.filter(name__trigram_word_similar=text)
+                row += f"{self.timed(trigram, repeat):>10.2f}"
+            else:
+                row += f"{'n/a':>10}"
+            self.stdout.write(row)
@@ -1,5 +1,12 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.text import slugify
+from .cache import invalidate_catalog_cache
 
 class Category(models.Model):
     name = models.CharField(max_length=120, unique=True)
@@ -17,6 +24,47 @@ class Category(models.Model):
         return self.name
 
 
+def first_image_url(prefix=""):
+    """
+    Subquery for a product's first image URL, its thumbnail.
+    `prefix` is the path to the product when it is joined into another model's query.
+    """
+    return Subquery(ProductImage.objects.filter(product=OuterRef(f"{prefix}pk")).order_by("id").values("url")[:1])
+
+
+class ProductQuerySet(models.QuerySet):
+    def summaries(self):
+        """
+        The columns of a line-item product summary, with the first image URL
+        annotated as `thumbnail` instead of prefetching every image.
+        """
+        return self.only("id", "slug", "name", "price", "stock").annotate(thumbnail=first_image_url())
+
+    def update(self, **kwargs):
+        if "stock" not in kwargs:
+            return super().update(**kwargs)
+        from .inventory import reset_slots
+        # a new stock total is spread over the stock slots again
+        ids = list(self.values_list("id", flat=True))
+        with transaction.atomic():
+            updated = super().update(**kwargs)
+            reset_slots(dict(self.model.objects.filter(id__in=ids).values_list("id", "stock")))
+        return updated
+
+    def refresh_stock(self):
+        """
+        Set stock to the sum of each product's stock slots (see catalog/inventory.py).
+        """
+        total = (
+            StockSlot.objects.filter(product=OuterRef("pk")).order_by()
+            .values("product").annotate(total=Sum("qty")).values("total")
+        )
+        with transaction.atomic():
+            # wait for concurrent refreshes, so the sums read below include what they saw
+            list(self.select_for_update().order_by("id").values_list("id", flat=True))
+            return super().update(stock=Coalesce(Subquery(total), F("stock")))
+
+
 class Product(models.Model):
     category    = models.ForeignKey(
         Category,
@@ -30,19 +78,77 @@ class Product(models.Model):
     stock       = models.PositiveIntegerField()
     created_at  = models.DateTimeField(auto_now_add=True)
     updated_at  = models.DateTimeField(auto_now=True)
+    # maintained by Postgres on every write, including bulk inserts and updates
+    search_vector = models.GeneratedField(
+        expression=SearchVector("name", weight="A", config="english")
+        + SearchVector("description", weight="B", config="english"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # ordering_fields with the id tie-breaker used by keyset pagination
+            models.Index(fields=["-created_at", "-id"], name="product_created_idx"),
+            models.Index(fields=["price", "id"], name="product_price_idx"),
+            # ?category= filtering (stock__gte is applied on top) with either ordering
+            models.Index(fields=["category", "-created_at", "-id"], name="product_cat_created_idx"),
+            models.Index(fields=["category", "price", "id"], name="product_cat_price_idx"),
+            GinIndex(fields=["search_vector"], name="product_search_vector_gin"),
+            # the pg_trgm name index is optional and created by catalog/search.py
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = instance.__dict__.get("stock")
+        return instance
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        stock_edited = (
+            "stock" not in self.get_deferred_fields()
+            and (update_fields is None or "stock" in update_fields)
+            and self.stock != getattr(self, "_loaded_stock", None)
+        )
+        if not stock_edited:
+            return super().save(*args, **kwargs)
+        from .inventory import reset_slots
+        # the stock slots are spread again only when stock itself was edited
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            reset_slots({self.pk: self.stock})
+        self._loaded_stock = self.stock
 
     def __str__(self):
         return self.name
 
 
+class StockSlot(models.Model):
+    """
+    One of a product's STOCK_SLOTS stock counters; checkout takes stock from the slots and
+    Product.stock is refreshed to their sum (see catalog/inventory.py).
+    """
+    product = models.ForeignKey(
+        Product,
+        related_name="stock_slots",
+        on_delete=models.CASCADE,
+    )
+    slot = models.PositiveSmallIntegerField()
+    qty = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ("product", "slot")
+
+    def __str__(self):
+        return f"{self.product_id} slot {self.slot}: {self.qty}"
+
+
 class ProductSpecification(models.Model):
     product = models.ForeignKey(
         Product,
@@ -65,4 +171,16 @@ class ProductImage(models.Model):
     url = models.URLField(blank=True, null=True)
 
     def __str__(self):
-        return f"{self.product.name} image: {self.url}"
\ No newline at end of file
+        return f"{self.product.name} image: {self.url}"
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductSpecification)
+@receiver(post_delete, sender=ProductSpecification)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_catalog_on_change(sender, instance, **kwargs):
+    invalidate_catalog_cache()
@@ -0,0 +1,146 @@
+# catalog/search.py: Postgres full-text search for products behind the standard `search` query param
+# - Matches against the stored, GIN-indexed Product.search_vector (name weighted above description)
+# - Every term is prefix-matched so partial words work for type-ahead
+# - Results are ranked unless the client asks for an explicit ?ordering=
+# - When nothing matches, falls back to trigram word similarity on the name to tolerate typos
+#   (only where the pg_trgm extension is available; the extension and its index are created on migrate)
+# - SearchFallbackMixin makes that call from the first page of matches the view fetched anyway, so a
+#   search that matches runs no extra query; only later pages of an empty search check for matches
+# - Ranked results have no keyset order to seek on, so ?cursor without ?ordering= is refused for them
+#   (see ecomm/pagination.py)
+
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connections, router
+from django.db.models import F
+from rest_framework import filters
+from rest_framework.exceptions import NotFound
+
+SEARCH_CONFIG = "english"
+
+
+TRIGRAM_INDEX_SQL = "CREATE INDEX IF NOT EXISTS product_name_trgm ON catalog_product USING gin (name gin_trgm_ops)"
+
+_trigram_available = {}
+
+
+def create_search_extensions(using, **kwargs):
+    """
+    pre_migrate hook: install pg_trgm when the server ships it (it is part of contrib).
+    """
+    connection = connections[using]
+    # read replicas get both through replication (see ecomm/replicas.py)
+    if connection.vendor != "postgresql" or not router.allow_migrate(using, "catalog"):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone():
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    _trigram_available.pop(using, None)
+
+
+def create_search_indexes(using, **kwargs):
+    """
+    post_migrate hook: the trigram index cannot live in Product.Meta.indexes since pg_trgm is optional.
+    """
+    if trigram_available(using) and router.allow_migrate(using, "catalog"):
+        with connections[using].cursor() as cursor:
+            cursor.execute(TRIGRAM_INDEX_SQL)
+
+
+def trigram_available(using):
+    if using not in _trigram_available:
+        connection = connections[using]
+        available = False
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                available = cursor.fetchone() is not None
+        _trigram_available[using] = available
+    return _trigram_available[using]
+
+
+def prefix_query(terms):
+    # terms are \w+ tokens, so they are safe to splice into a raw tsquery
+    return SearchQuery(" & ".join(f"{term}:*" for term in terms), search_type="raw", config=SEARCH_CONFIG)
+
+
+def search_products(queryset, text, similar=False):
+    """
+    Ranked full-text matches for `text`, or with similar=True trigram name matches (for when nothing
+    matches; requires pg_trgm).
+    """
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return queryset
+    if similar:
+        # %> uses the trigram index; the cut-off is pg_trgm.word_similarity_threshold
+        return (
+            queryset.filter(name__trigram_word_similar=text)
+            .annotate(similarity=TrigramWordSimilarity(text, "name"))
+            .order_by("-similarity", "-created_at")
+        )
+    query = prefix_query(terms)
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(rank=SearchRank(F("search_vector"), query))
+        .order_by("-rank", "-created_at")
+    )
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Full-text product search on Postgres; other databases keep SearchFilter's ILIKE behaviour.
+    On a view with SearchFallbackMixin, lists the trigram matches once the view found no full-text ones.
+    """
+    def filter_queryset(self, request, queryset, view):
+        if connections[queryset.db].vendor != "postgresql":
+            return super().filter_queryset(request, queryset, view)
+        text = " ".join(self.get_search_terms(request))
+        fallback = getattr(view, "trigram_fallback", None)
+        if fallback is None and re.search(r"\w", text) and hasattr(view, "trigram_fallback") \
+                and trigram_available(queryset.db):
+            view.trigram_fallback = False
+        return search_products(queryset, text, similar=bool(fallback))
+
+
+class SearchFallbackMixin:
+    """
+    ViewSet mixin for ProductSearchFilter: when a search has no full-text matches, list its trigram
+    matches instead, decided from the page of matches already fetched.
+    """
+    # None: no fallback possible; False: listing full-text matches; True: listing trigram matches
+    trigram_fallback = None
+
+    def first_page(self):
+        params = self.request.query_params
+        return not params.get("cursor") and params.get("page", "1") == "1"
+
+    def paginate_queryset(self, queryset):
+        try:
+            page = super().paginate_queryset(queryset)
+        except NotFound:
+            # past the last page of matches, unless there are none
+            if self.trigram_fallback is not False or queryset.exists():
+                raise
+        else:
+            if page or page is None or self.trigram_fallback is not False:
+                return page
+            if not self.first_page() and queryset.exists():
+                return page
+        self.trigram_fallback = True
+        return super().paginate_queryset(self.filter_queryset(self.get_queryset()))
+
+    async def apaginate_queryset(self, queryset):
+        try:
+            page = await super().apaginate_queryset(queryset)
+        except NotFound:
+            if self.trigram_fallback is not False or await queryset.aexists():
+                raise
+        else:
+            if page or page is None or self.trigram_fallback is not False:
+                return page
+            if not self.first_page() and await queryset.aexists():
+                return page
+        self.trigram_fallback = True
+        return await super().apaginate_queryset(await self.afilter_queryset(self.get_queryset()))
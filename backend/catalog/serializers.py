@@ -1,26 +1,45 @@
 from rest_framework import serializers
-from .models import Category, Product, ProductSpecification, ProductImage
+from ecomm.serializers import DynamicModelSerializer
+from .models import Category, Product, ProductSpecification, ProductImage, first_image_url
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicModelSerializer):
     class Meta:
         model = Category
         fields = "__all__"
 
-class ProductSpecificationSerializer(serializers.ModelSerializer):
+class ProductSpecificationSerializer(DynamicModelSerializer):
     class Meta:
         model = ProductSpecification
         fields = ["name", "value"]
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(DynamicModelSerializer):
     class Meta:
         model = ProductImage
         fields = ['url']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
     specifications = ProductSpecificationSerializer(many=True, read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
+    expandable_fields = {'category': lambda: CategorySerializer(read_only=True)}
 
     class Meta:
         model = Product
-        fields = ['id','category','name','slug','description','price','stock','created_at','updated_at','specifications','images']
\ No newline at end of file
+        fields = ['id','category','name','slug','description','price','stock','created_at','updated_at','specifications','images']
+
+class ProductSummarySerializer(DynamicModelSerializer):
+    """
+    Compact product for order and cart lines; querysets shaped by it annotate `thumbnail`.
+    """
+    thumbnail = serializers.SerializerMethodField()
+    field_annotations = {'thumbnail': first_image_url}
+
+    class Meta:
+        model = Product
+        fields = ['id', 'slug', 'name', 'thumbnail', 'price']
+
+    def get_thumbnail(self, obj):
+        if hasattr(obj, 'thumbnail'):
+            return obj.thumbnail
+        image = obj.images.order_by('id').first()
+        return image.url if image else None
@@ -0,0 +1,102 @@
+import threading
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from catalog.inventory import spread, take_from_one_slot, take_stock
+from catalog.models import Category, Product, StockSlot
+
+
+def slot_quantities(product):
+    return list(StockSlot.objects.filter(product=product).order_by("slot").values_list("qty", flat=True))
+
+
+@override_settings(STOCK_SLOTS=4)
+class StockSlotTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Slots")
+        self.product = Product.objects.create(name="Sliced", category=self.category, price=3, stock=10)
+
+    def test_spread(self):
+        self.assertEqual(spread(10, 4), [3, 3, 2, 2])
+        self.assertEqual(spread(2, 4), [1, 1, 0, 0])
+        self.assertEqual(spread(0, 1), [0])
+
+    def test_stock_edits_respread_slots(self):
+        self.assertEqual(slot_quantities(self.product), [3, 3, 2, 2])
+        self.product.stock = 5
+        self.product.save()
+        self.assertEqual(slot_quantities(self.product), [2, 1, 1, 1])
+        Product.objects.filter(pk=self.product.pk).update(stock=7)
+        self.assertEqual(slot_quantities(self.product), [2, 2, 2, 1])
+        with override_settings(STOCK_SLOTS=2):
+            Product.objects.filter(pk=self.product.pk).update(stock=7)
+        self.assertEqual(slot_quantities(self.product), [4, 3])
+
+    def test_other_edits_keep_slots(self):
+        take_stock({self.product.id: 3})
+        product = Product.objects.get(pk=self.product.pk)
+        product.name = "Renamed"
+        product.save()
+        self.assertEqual(sum(slot_quantities(self.product)), 7)
+
+    def test_take_from_one_slot_or_drain_all(self):
+        self.assertEqual(take_stock({self.product.id: 2}), [])
+        self.assertEqual(sum(slot_quantities(self.product)), 8)
+        # no slot holds 5 on its own: the slots are drained in order
+        self.assertEqual(take_stock({self.product.id: 5}), [])
+        self.assertEqual(sum(slot_quantities(self.product)), 3)
+        self.assertEqual(take_stock({self.product.id: 4}), [self.product.id])
+        self.assertEqual(sum(slot_quantities(self.product)), 3)
+
+    def test_refresh_stock_sums_slots(self):
+        take_stock({self.product.id: 4})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        Product.objects.filter(pk=self.product.pk).refresh_stock()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+
+    def test_bulk_created_products_get_slots_at_first_checkout(self):
+        product, = Product.objects.bulk_create([
+            Product(name="Bulk", slug="bulk", category=self.category, price=1, stock=6),
+        ])
+        self.assertEqual(slot_quantities(product), [])
+        self.assertEqual(take_stock({product.id: 1}), [])
+        self.assertEqual(sum(slot_quantities(product)), 5)
+
+
+class SlotContentionTest(TransactionTestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Contended")
+
+    def take_while_locked(self):
+        """
+        Take one unit in a second connection while this one holds a slot of the product.
+        """
+        product = Product.objects.create(name="Hot", category=self.category, price=1, stock=10)
+        result = {}
+
+        def other_checkout():
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL lock_timeout = '500ms'")
+                    result["taken"] = take_stock({product.id: 1}) == []
+            except OperationalError:
+                result["taken"] = False
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            self.assertTrue(take_from_one_slot(product.id, 1))
+            thread = threading.Thread(target=other_checkout)
+            thread.start()
+            thread.join()
+        return result["taken"]
+
+    @override_settings(STOCK_SLOTS=8)
+    def test_concurrent_checkouts_take_other_slots(self):
+        self.assertTrue(self.take_while_locked())
+
+    @override_settings(STOCK_SLOTS=1)
+    def test_one_slot_serializes_checkouts(self):
+        self.assertFalse(self.take_while_locked())
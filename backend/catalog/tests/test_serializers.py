@@ -1,6 +1,6 @@
 from django.test import TestCase
 from catalog.models import Category, Product
-from catalog.serializers import CategorySerializer, ProductSerializer
+from catalog.serializers import CategorySerializer, ProductSerializer, ProductSummarySerializer
 
 class CategorySerializerTest(TestCase):
     def test_serialization(self):
@@ -20,3 +20,16 @@ class ProductSerializerTest(TestCase):
         self.assertEqual(data["category"], self.cat.id)
         self.assertEqual(str(data["price"]), "19.99")
         self.assertEqual(data["stock"], 5)
+
+class ProductSummarySerializerTest(TestCase):
+    def test_thumbnail_annotated_or_loaded(self):
+        prod = Product.objects.create(name="Lamp", category=Category.objects.create(name="Home"), price=5, stock=1)
+        self.assertIsNone(ProductSummarySerializer(prod).data["thumbnail"])
+        prod.images.create(url="https://img.example/first.jpg")
+        prod.images.create(url="https://img.example/second.jpg")
+        summary = Product.objects.summaries().get(pk=prod.pk)
+        with self.assertNumQueries(0):
+            data = ProductSummarySerializer(summary).data
+        self.assertEqual(set(data), {"id", "slug", "name", "thumbnail", "price"})
+        self.assertEqual(data["thumbnail"], "https://img.example/first.jpg")
+        self.assertEqual(ProductSummarySerializer(prod).data["thumbnail"], "https://img.example/first.jpg")
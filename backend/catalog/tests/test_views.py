@@ -1,9 +1,16 @@
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from oauth2_provider.models import Application, AccessToken
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import time
+from unittest import mock, skipUnless
 from django.utils import timezone
 from datetime import timedelta
-from catalog.models import Category, Product
+from catalog.cache import get_generation, invalidate_stock
+from catalog.models import Category, Product, ProductSpecification, ProductImage
+from catalog.search import trigram_available
 
 User = get_user_model()
 
@@ -142,3 +149,309 @@ class ProductViewSetTest(APITestCase):
         data = {"name":"","category":"", "price":-1, "stock":-5}
         resp = self.client.post("/api/products/", data, format='json')
         self.assertEqual(resp.status_code, 400)
+
+class ProductQueryCountTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester3", password="pass3")
+        self.app = Application.objects.create(
+            user=self.user,
+            name="test_app3",
+            client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        self.read_token = AccessToken.objects.create(
+            user=self.user, application=self.app,
+            token="read_prod_q", expires=timezone.now() + timedelta(hours=1), scope="read:products"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.read_token.token}")
+        self.cat = Category.objects.create(name="Queries")
+
+    def create_products(self, count):
+        for i in range(count):
+            prod = Product.objects.create(
+                name=f"QProd{Product.objects.count()}", category=self.cat, price=10+i, stock=5
+            )
+            ProductSpecification.objects.create(product=prod, name="Color", value="Red")
+            ProductSpecification.objects.create(product=prod, name="Weight", value="1kg")
+            ProductImage.objects.create(product=prod, url="https://example.com/a.png")
+            ProductImage.objects.create(product=prod, url="https://example.com/b.png")
+
+    def test_list_query_count_independent_of_page_size(self):
+        self.create_products(2)
+        # token lookup, count, products, specifications, images
+        with self.assertNumQueries(5):
+            resp = self.client.get("/api/products/")
+        self.assertEqual(len(resp.json()["results"]), 2)
+        self.create_products(10)
+        # same queries minus the token lookup, which is cached after the first request
+        with self.assertNumQueries(4):
+            resp = self.client.get("/api/products/")
+        results = resp.json()["results"]
+        self.assertEqual(len(results), 12)
+        self.assertEqual(len(results[0]["specifications"]), 2)
+        self.assertEqual(len(results[0]["images"]), 2)
+
+    def test_retrieve_query_count(self):
+        self.create_products(1)
+        prod = Product.objects.get()
+        # token lookup, product, specifications, images
+        with self.assertNumQueries(4):
+            resp = self.client.get(f"/api/products/{prod.slug}/")
+        self.assertEqual(resp.json()["specifications"], [
+            {"name": "Color", "value": "Red"},
+            {"name": "Weight", "value": "1kg"},
+        ])
+
+    def test_sparse_fieldsets_shape_queries(self):
+        self.create_products(3)
+        self.client.get("/api/products/?fields=id")
+        # count, products and images: unrequested specifications are not prefetched
+        with self.assertNumQueries(3) as ctx:
+            resp = self.client.get("/api/products/?fields=id,name,images.url")
+        self.assertEqual(set(resp.json()["results"][0]), {"id", "name", "images"})
+        self.assertNotIn("description", ctx.captured_queries[1]["sql"])
+        with self.assertNumQueries(3):
+            resp = self.client.get("/api/products/?omit=description,specifications")
+        self.assertEqual(set(resp.json()["results"][0]) & {"description", "specifications"}, set())
+        # ?expand=category joins the category instead of rendering its pk
+        with self.assertNumQueries(2):
+            resp = self.client.get("/api/products/?fields=id,category&expand=category")
+        self.assertEqual(resp.json()["results"][0]["category"], {"id": self.cat.id, "name": "Queries", "slug": "queries"})
+
+class CatalogCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="tester4", password="pass4")
+        self.app = Application.objects.create(
+            user=self.user,
+            name="test_app4",
+            client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        self.read_token = AccessToken.objects.create(
+            user=self.user, application=self.app,
+            token="read_cache", expires=timezone.now() + timedelta(hours=1), scope="read:products"
+        )
+        self.write_token = AccessToken.objects.create(
+            user=self.user, application=self.app,
+            token="write_cache", expires=timezone.now() + timedelta(hours=1), scope="write:products"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.read_token.token}")
+        self.cat = Category.objects.create(name="Cached")
+        self.prod = Product.objects.create(name="Cached Prod", category=self.cat, price=10, stock=5)
+
+    def test_list_served_from_cache(self):
+        first = self.client.get("/api/products/?ordering=price&category=" + str(self.cat.id))
+        # with the token cached too, a hit (even with params in another order) runs no queries
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/products/?category=" + str(self.cat.id) + "&ordering=price")
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    def test_distinct_params_not_shared(self):
+        self.client.get("/api/products/")
+        resp = self.client.get("/api/products/?stock__gte=100")
+        self.assertEqual(resp.json()["results"], [])
+
+    def test_write_invalidates(self):
+        self.client.get(f"/api/products/{self.prod.slug}/")
+        self.client.get("/api/categories/")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.write_token.token}")
+        resp = self.client.put(
+            f"/api/products/{self.prod.slug}/",
+            {"name": "Renamed", "slug": self.prod.slug, "category": self.cat.id, "price": 12, "stock": 5},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 200)
+        ProductSpecification.objects.create(product=self.prod, name="Color", value="Blue")
+        Category.objects.create(name="Fresh")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.read_token.token}")
+        data = self.client.get(f"/api/products/{self.prod.slug}/").json()
+        self.assertEqual(data["name"], "Renamed")
+        self.assertEqual(data["specifications"], [{"name": "Color", "value": "Blue"}])
+        names = [c["name"] for c in self.client.get("/api/categories/").json()["results"]]
+        self.assertIn("Fresh", names)
+
+    def test_conditional_requests(self):
+        resp = self.client.get(f"/api/products/{self.prod.slug}/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("Last-Modified", resp)
+        resp = self.client.get(f"/api/products/{self.prod.slug}/", HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(resp.status_code, 304)
+        resp = self.client.get(f"/api/products/{self.prod.slug}/", HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"])
+        self.assertEqual(resp.status_code, 304)
+        etag = resp["ETag"]
+        self.prod.stock = 1
+        self.prod.save()
+        resp = self.client.get(f"/api/products/{self.prod.slug}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["stock"], 1)
+
+    def test_last_modified_follows_catalog_writes(self):
+        url = f"/api/products/{self.prod.slug}/"
+        last_modified = self.client.get(url)["Last-Modified"]
+        # a spec edit leaves the product's updated_at alone, yet changes the response
+        with mock.patch("catalog.cache.time.time", return_value=time.time() + 5):
+            ProductSpecification.objects.create(product=self.prod, name="Size", value="L")
+        resp = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["specifications"], [{"name": "Size", "value": "L"}])
+        self.assertNotEqual(resp["Last-Modified"], last_modified)
+
+    def test_stock_changes_only_invalidate_their_products(self):
+        other = Product.objects.create(name="Untouched", category=self.cat, price=3, stock=5)
+        urls = ["/api/products/", f"/api/products/{self.prod.slug}/", f"/api/products/{other.slug}/",
+                "/api/products/?stock__gte=3"]
+        etags = [self.client.get(url)["ETag"] for url in urls]
+        generation = get_generation()
+        # as checkout does
+        Product.objects.filter(pk=self.prod.pk).update(stock=2)
+        invalidate_stock([self.prod.id])
+        self.assertEqual(get_generation(), generation)
+        with self.assertNumQueries(0):
+            resp = self.client.get(urls[2])
+        self.assertEqual(resp["ETag"], etags[2])
+        resp = self.client.get(urls[0])
+        self.assertNotEqual(resp["ETag"], etags[0])
+        self.assertEqual({item["name"]: item["stock"] for item in resp.json()["results"]},
+                         {"Cached Prod": 2, "Untouched": 5})
+        self.assertEqual(self.client.get(urls[1]).json()["stock"], 2)
+        self.assertEqual([item["name"] for item in self.client.get(urls[3]).json()["results"]], ["Untouched"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(urls[0]).status_code, 200)
+
+    def test_permissions_checked_on_hit(self):
+        self.client.get("/api/products/")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.write_token.token}")
+        self.assertEqual(self.client.get("/api/products/").status_code, 403)
+
+class ProductKeysetPaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="tester5", password="pass5")
+        self.app = Application.objects.create(
+            user=self.user,
+            name="test_app5",
+            client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        self.read_token = AccessToken.objects.create(
+            user=self.user, application=self.app,
+            token="read_keyset", expires=timezone.now() + timedelta(hours=1), scope="read:products"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.read_token.token}")
+        self.cat = Category.objects.create(name="Keyset")
+        # repeated prices exercise the id tie-breaker
+        for i in range(25):
+            Product.objects.create(name=f"Key{i}", category=self.cat, price=10 + i % 4, stock=i)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()
+            self.assertNotIn("count", data)
+            ids.extend(item["id"] for item in data["results"])
+            url = data["next"]
+        return ids
+
+    def test_walks_every_product_in_order(self):
+        ids = self.walk("/api/products/?ordering=price&cursor=&page_size=4")
+        expected = list(Product.objects.order_by("price", "id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+        ids = self.walk("/api/products/?ordering=-created_at&cursor=&page_size=7")
+        expected = list(Product.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_previous_link(self):
+        first = self.client.get("/api/products/?ordering=-price&cursor=&page_size=5").json()
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        back = self.client.get(second["previous"]).json()
+        self.assertEqual(back["results"], first["results"])
+
+    def test_filters_apply(self):
+        ids = self.walk("/api/products/?ordering=price&stock__gte=20&cursor=&page_size=2")
+        self.assertEqual(len(ids), 5)
+
+    def test_page_size_cap_and_counts(self):
+        resp = self.client.get("/api/products/?cursor=&page_size=1000&count=exact")
+        data = resp.json()
+        self.assertEqual(data["count"], 25)
+        self.assertEqual(len(data["results"]), 25)
+        resp = self.client.get("/api/products/?cursor=&count=estimate")
+        self.assertIsInstance(resp.json()["count"], int)
+        # page-number mode keeps the count and honours page_size as well
+        data = self.client.get("/api/products/?page_size=20").json()
+        self.assertEqual((data["count"], len(data["results"])), (25, 20))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/products/?cursor=bogus").status_code, 404)
+        first = self.client.get("/api/products/?ordering=price&cursor=&page_size=5").json()
+        # a cursor is only valid for the ordering it was issued for
+        next_cursor = first["next"].split("cursor=")[1].split("&")[0]
+        resp = self.client.get(f"/api/products/?ordering=created_at&cursor={next_cursor}")
+        self.assertEqual(resp.status_code, 404)
+
+@skipUnless(connection.vendor == "postgresql", "full-text search needs Postgres")
+class ProductSearchTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="tester6", password="pass6")
+        self.app = Application.objects.create(
+            user=self.user,
+            name="test_app6",
+            client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        self.read_token = AccessToken.objects.create(
+            user=self.user, application=self.app,
+            token="read_search", expires=timezone.now() + timedelta(hours=1), scope="read:products"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.read_token.token}")
+        cat = Category.objects.create(name="Search")
+        self.bag = Product.objects.create(name="Laptop bag", category=cat, price=30, stock=1,
+                                          description="Padded sleeve")
+        self.laptop = Product.objects.create(name="Gaming laptop", category=cat, price=900, stock=1,
+                                             description="Fast laptop with a large laptop screen")
+        Product.objects.create(name="Desk lamp", category=cat, price=20, stock=1, description="Warm light")
+
+    def search(self, params):
+        return [item["name"] for item in self.client.get(f"/api/products/?{params}").json()["results"]]
+
+    def test_ranked_prefix_search(self):
+        # "lapt" is a prefix; the product mentioning laptops most often ranks first
+        self.assertEqual(self.search("search=lapt"), ["Gaming laptop", "Laptop bag"])
+        self.assertEqual(self.search("search=padded"), ["Laptop bag"])
+        self.assertEqual(self.search("search=laptop%20sleeve"), ["Laptop bag"])
+
+    def test_explicit_ordering_overrides_rank(self):
+        self.assertEqual(self.search("search=laptop&ordering=price"), ["Laptop bag", "Gaming laptop"])
+
+    def test_vector_follows_updates(self):
+        self.bag.name = "Camera bag"
+        self.bag.save()
+        self.assertEqual(self.search("search=camera"), ["Camera bag"])
+
+    def test_trigram_fallback(self):
+        if not trigram_available(connection.alias):
+            self.skipTest("pg_trgm is not installed")
+        self.assertEqual(self.search("search=desk%20lanp"), ["Desk lamp"])
+        Product.objects.create(name="Desk lamp shade", category=self.bag.category, price=5, stock=1)
+        cache.clear()
+        self.assertEqual(len(self.search("search=desk%20lanp&page_size=1&page=2")), 1)
+        resp = self.client.get("/api/products/?search=lapt&page=2")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_search_runs_no_extra_query(self):
+        for params in ["search=lapt", "search=desk%20lanp"]:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(f"/api/products/?{params}").status_code, 200)
+            self.assertFalse([query for query in queries if 'SELECT 1 AS "a"' in query["sql"]], params)
+
+    def test_cursor_needs_an_explicit_ordering(self):
+        resp = self.client.get("/api/products/?search=lapt&cursor=")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("cursor", resp.json())
+        self.assertEqual(self.search("search=lapt&ordering=price&cursor="), ["Laptop bag", "Gaming laptop"])
@@ -1,12 +1,22 @@
 # catalog/views.py: API endpoints for Category and Product management
 # - Secured via OAuth2 scopes (read:products/write:products) using MethodScopedTokenHasScope
 # - Provides CRUD operations with filtering, search, and ordering
+# - list/retrieve responses are cached (see catalog/cache.py) and invalidated on catalog writes
+# - ?fields=/?omit=/?expand= select the response shape, which also shapes the queryset (see ecomm/serializers.py)
+# - list/retrieve skip the serializers and render values() rows (see ecomm/fastread.py)
+# - Under ASGI, category list and product list/retrieve run as async views (see ecomm/asyncviews.py)
+# - GETs read from a replica when replicas are configured (see ecomm/replicas.py)
 
 from rest_framework.viewsets import ModelViewSet
 from .models import Category, Product
 from .serializers import CategorySerializer, ProductSerializer
-from oauth2_provider.contrib.rest_framework import TokenHasScope, OAuth2Authentication
+from oauth2_provider.contrib.rest_framework import TokenHasScope
+from accounts.authentication import CachedOAuth2Authentication
 from rest_framework.permissions import IsAuthenticated # Import IsAuthenticated
+from .cache import CachedReadMixin
+from ecomm.asyncviews import AsyncViewMixin
+from ecomm.fastread import FastReadMixin
+from ecomm.replicas import ReplicaReadMixin
 
 # This custom permission class ensures that get_scopes correctly returns a list of scopes
 # for the current request method when view.required_scopes is defined as a dictionary.
@@ -15,8 +25,19 @@ from rest_framework.permissions import IsAuthenticated # Import IsAuthenticated
 class MethodScopedTokenHasScope(TokenHasScope):
     """
     Custom permission class to handle OAuth2 scopes for different request methods.
+    Scopes are resolved once per view class and method, then served from a frozenset.
     """
+    resolved_scopes = {}
+
     def get_scopes(self, request, view):
+        key = (type(view), request.method)
+        try:
+            return self.resolved_scopes[key]
+        except KeyError:
+            scopes = self.resolved_scopes[key] = frozenset(self.resolve_scopes(request, view))
+            return scopes
+
+    def resolve_scopes(self, request, view):
         # Attempt to get the dictionary of required scopes from the view.
         # Default to an empty dictionary if 'required_scopes' is not present.
         required_scopes_attr = getattr(view, 'required_scopes', {})
@@ -35,13 +56,13 @@ class MethodScopedTokenHasScope(TokenHasScope):
         # default to an empty list, indicating no specific scopes are required by this logic.
         return []
 
-class CategoryViewSet(ModelViewSet):
+class CategoryViewSet(CachedReadMixin, FastReadMixin, AsyncViewMixin, ReplicaReadMixin, ModelViewSet):
     """
     Manage product categories for the store:
     - GET: list & retrieve (requires 'read:products')
     - POST/PUT/DELETE: create, update, delete (requires 'write:products')
     """
-    authentication_classes = [OAuth2Authentication]
+    authentication_classes = [CachedOAuth2Authentication]
     permission_classes = [IsAuthenticated, MethodScopedTokenHasScope]
     required_scopes = {
         'GET': ['read:products'],
@@ -56,17 +77,21 @@ class CategoryViewSet(ModelViewSet):
 from rest_framework.viewsets import ModelViewSet
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
+from ecomm.pagination import OptionalKeysetPagination
 from .models import Product
+from .search import ProductSearchFilter, SearchFallbackMixin
 from .serializers import ProductSerializer
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(CachedReadMixin, SearchFallbackMixin, FastReadMixin, AsyncViewMixin, ReplicaReadMixin,
+                     ModelViewSet):
     """
     Manage products:
     - GET: list & retrieve (requires 'read:products')
     - POST/PUT/DELETE: create, update, delete (requires 'write:products')
     Supports search and ordering filters.
+    Pass ?cursor to switch from page numbers to keyset pagination.
     """
-    authentication_classes = [OAuth2Authentication]
+    authentication_classes = [CachedOAuth2Authentication]
     permission_classes = [IsAuthenticated, MethodScopedTokenHasScope]
     required_scopes = {
         'GET': ['read:products'],
@@ -74,18 +99,24 @@ class ProductViewSet(ModelViewSet):
         'PUT': ['write:products'],
         'DELETE': ['write:products'],
     }
-    queryset = Product.objects.select_related("category").all()
+    # the rendered fields decide the columns, joins and prefetches (ShapedQuerysetMixin);
+    # list/retrieve render values() rows directly (FastReadMixin)
+    queryset = Product.objects.all()
     serializer_class = ProductSerializer
     lookup_field = "slug"
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_fields = {
         'category': ['exact'],
         'stock': ['gte'],
     }
-    search_fields = ["name", "description"]   # search by these fields
+    search_fields = ["name", "description"]   # search by these fields (full-text on Postgres)
     ordering_fields = ["price", "created_at"] # allow ordering
+    pagination_class = OptionalKeysetPagination
+    # checkout only invalidates the cached responses showing the products ordered
+    cached_stock = True
 
     # /api/products/?category=3
     # /api/products/?price=499
     # /api/products/?search=laptop
     # /api/products/?ordering=price
+    # /api/products/?ordering=price&cursor=&page_size=50
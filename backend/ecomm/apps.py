@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from prometheus_client import REGISTRY
+
+
+class EcommConfig(AppConfig):
+    name = 'ecomm'
+
+    def ready(self):
+        from .dbpool import PoolCollector
+        REGISTRY.register(PoolCollector())
@@ -0,0 +1,10 @@
+"""
+URL configuration for requests served over ASGI (see ecomm/middleware.py).
+
+Same routes as ecomm.urls, with the views named in ecomm.asyncviews.ASYNC_VIEWS served by
+their async handlers.
+"""
+from .asyncviews import async_patterns
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = async_patterns(sync_urlpatterns)
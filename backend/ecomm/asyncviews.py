@@ -0,0 +1,152 @@
+# ecomm/asyncviews.py: async request path for the hot read endpoints, served under ASGI
+# - AsyncViewMixin gives a DRF view async handlers (alist/aretrieve/aget...) that use the async ORM;
+#   authentication, permission and scope checks run on the event loop
+# - async_view() wraps a routed DRF view: methods with an async handler are awaited, the others
+#   run the unchanged sync view in a worker thread
+# - ecomm/asgi_urls.py swaps the views named in ASYNC_VIEWS for async_view()s; requests arriving
+#   over ASGI are routed through it (ecomm/middleware.py), WSGI keeps the sync views
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.urls import URLPattern, URLResolver
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, mixins
+from rest_framework.settings import api_settings
+
+# url names served by async handlers under ASGI
+ASYNC_VIEWS = {'products-list', 'products-detail', 'categories-list', 'cart-list', 'user-detail'}
+
+# query params no filter backend looks up in the database
+LOOP_SAFE_PARAMS = frozenset({
+    'fields', 'omit', 'expand', 'page', 'page_size', 'cursor', 'count',
+    api_settings.ORDERING_PARAM, api_settings.URL_FORMAT_OVERRIDE,
+})
+
+
+class AsyncViewMixin:
+    """
+    APIView mixin: an async counterpart of dispatch() for the handlers named a<handler>.
+    """
+    async def adispatch(self, request, handler, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        await self.aperform_authentication(request)
+        # request.user is resolved, so the sync checks below stay off the database
+        self.initial(request, *args, **kwargs)
+
+    async def aperform_authentication(self, request):
+        """
+        Request._authenticate(), awaiting authenticators that have an aauthenticate().
+        """
+        for authenticator in request.authenticators:
+            aauthenticate = getattr(authenticator, 'aauthenticate', None)
+            try:
+                if aauthenticate is not None:
+                    user_auth_tuple = await aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    async def afilter_queryset(self, queryset):
+        # django-filter validates model choices against the database and search may probe for
+        # matches, so requests carrying such params filter in a worker thread
+        if self.request.query_params.keys() - LOOP_SAFE_PARAMS:
+            return await sync_to_async(self.filter_queryset)(queryset)
+        return self.filter_queryset(queryset)
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if not hasattr(self.paginator, 'apaginate_queryset'):
+            # a stock DRF paginator: count and fetch in a worker thread
+            return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def aget_object(self):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        # no async rendering for this request: serialize model instances in a worker thread
+        return await sync_to_async(mixins.ListModelMixin.list)(self, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await sync_to_async(mixins.RetrieveModelMixin.retrieve)(self, request, *args, **kwargs)
+
+
+def async_view(callback):
+    """
+    Async version of a DRF view function (from as_view() or a router): methods whose handler has
+    an async a<handler> counterpart are dispatched on the event loop, others by `callback` in a thread.
+    """
+    cls = callback.cls
+    initkwargs = callback.initkwargs
+    actions = getattr(callback, 'actions', None)
+    if actions is not None and 'get' in actions and 'head' not in actions:
+        actions = {**actions, 'head': actions['get']}
+    sync_view = sync_to_async(callback)
+
+    async def view(request, *args, **kwargs):
+        method = request.method.lower()
+        name = actions.get(method) if actions is not None else method
+        self = cls(**initkwargs)
+        handler = getattr(self, f'a{name}', None) if name else None
+        if handler is None:
+            return await sync_view(request, *args, **kwargs)
+        if actions is not None:
+            # as ViewSetMixin.as_view()
+            self.action_map = actions
+            for bound_method, action in actions.items():
+                setattr(self, bound_method, getattr(self, action))
+        self.setup(request, *args, **kwargs)
+        return await self.adispatch(request, handler, *args, **kwargs)
+
+    view.cls = cls
+    view.initkwargs = initkwargs
+    if actions is not None:
+        view.actions = actions
+    return csrf_exempt(view)
+
+
+def async_patterns(patterns, names=ASYNC_VIEWS):
+    """
+    `patterns` with the views named in `names` replaced by their async_view(), at any include depth.
+    """
+    replaced = []
+    for entry in patterns:
+        if isinstance(entry, URLResolver):
+            children = async_patterns(entry.url_patterns, names)
+            if children != entry.url_patterns:
+                entry = URLResolver(entry.pattern, children, entry.default_kwargs, entry.app_name, entry.namespace)
+        elif isinstance(entry, URLPattern) and entry.name in names:
+            entry = URLPattern(entry.pattern, async_view(entry.callback), entry.default_args, entry.name)
+        replaced.append(entry)
+    return replaced
@@ -0,0 +1,68 @@
+# ecomm/dbpool.py: Prometheus metrics for the psycopg connection pools (settings.DB_POOL)
+# - PoolCollector reads each pool's get_stats() when /metrics is scraped: size, in-use and idle
+#   connections, waiting requests, checkouts, time spent waiting and failed checkouts
+# - Registered by ecomm.apps.EcommConfig; databases without a pool export nothing
+# - Connection counts and query latency come from the django_prometheus database engine
+
+from django.db import connections
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from django_prometheus.conf import NAMESPACE
+
+# gauge name -> (help, value from the pool stats)
+GAUGES = {
+    'size': ('Connections currently open in the pool', lambda stats: stats.get('pool_size', 0)),
+    'in_use': ('Connections checked out of the pool',
+               lambda stats: stats.get('pool_size', 0) - stats.get('pool_available', 0)),
+    'idle': ('Connections waiting in the pool', lambda stats: stats.get('pool_available', 0)),
+    'min_size': ('Configured minimum pool size', lambda stats: stats.get('pool_min', 0)),
+    'max_size': ('Configured maximum pool size', lambda stats: stats.get('pool_max', 0)),
+    'requests_waiting': ('Checkouts currently waiting for a connection', lambda stats: stats.get('requests_waiting', 0)),
+}
+# counter name -> (help, value from the pool stats); psycopg keeps these cumulative until pop_stats()
+COUNTERS = {
+    'checkouts': ('Connections requested from the pool', lambda stats: stats.get('requests_num', 0)),
+    'checkouts_queued': ('Checkouts that had to wait for a connection', lambda stats: stats.get('requests_queued', 0)),
+    'checkout_wait_seconds': ('Time spent waiting for a connection',
+                              lambda stats: stats.get('requests_wait_ms', 0) / 1000),
+    'checkout_errors': ('Checkouts that timed out or failed', lambda stats: stats.get('requests_errors', 0)),
+    'connections': ('Connections opened by the pool', lambda stats: stats.get('connections_num', 0)),
+    'connection_errors': ('Failed connection attempts by the pool', lambda stats: stats.get('connections_errors', 0)),
+    'connections_lost': ('Pooled connections found broken', lambda stats: stats.get('connections_lost', 0)),
+}
+
+
+def pool_stats(databases=connections):
+    """
+    {alias: stats} for every database connection (in `databases`) that uses a connection pool.
+    """
+    stats = {}
+    for alias in databases:
+        connection = databases[alias]
+        if connection.vendor != 'postgresql' or not connection.settings_dict['OPTIONS'].get('pool'):
+            continue
+        # pools open on the first checkout; until then their stats are only the configuration
+        if not connection.pool.closed:
+            stats[alias] = connection.pool.get_stats()
+    return stats
+
+
+class PoolCollector:
+    """
+    prometheus_client collector exporting pool_stats() as django_db_pool_* metrics.
+    """
+    def __init__(self, databases=connections):
+        self.databases = databases
+
+    def collect(self):
+        prefix = f'{NAMESPACE}_django_db_pool' if NAMESPACE else 'django_db_pool'
+        stats = pool_stats(self.databases)
+        for name, (documentation, value) in GAUGES.items():
+            family = GaugeMetricFamily(f'{prefix}_{name}', documentation, labels=['alias'])
+            for alias, pool in stats.items():
+                family.add_metric([alias], value(pool))
+            yield family
+        for name, (documentation, value) in COUNTERS.items():
+            family = CounterMetricFamily(f'{prefix}_{name}', documentation, labels=['alias'])
+            for alias, pool in stats.items():
+                family.add_metric([alias], value(pool))
+            yield family
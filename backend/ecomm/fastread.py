@@ -0,0 +1,253 @@
+# ecomm/fastread.py: fast read-only rendering for list/retrieve, bypassing per-object serializer work
+# - A ReadPlan is compiled once per serializer class and response shape (?fields=/?omit=/?expand=)
+#   from the serializer's resolved fields, then cached; past PLAN_CACHE_SIZE shapes the oldest plan is
+#   dropped, so clients cycling through ?fields= values cannot evict every plan at once
+# - Rows come from values() (no model instances); nested single relations are joined into the same
+#   row, annotations included, and collections are fetched with one values() query per relation and
+#   grouped in Python
+# - Each value is formatted by an unbound copy of the serializer field, so the output matches the
+#   serializer exactly; anything the plan cannot express makes the view fall back to the serializer
+# - arender()/alist()/aretrieve() do the same through the async ORM (ecomm/asyncviews.py)
+
+import copy
+import threading
+from collections import defaultdict
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from .serializers import DynamicFieldsMixin, ShapedQuerysetMixin
+
+PLAN_CACHE_SIZE = 256
+SHAPE_PARAMS = ('fields', 'omit', 'expand')
+
+
+class Unsupported(Exception):
+    """
+    The serializer renders something a ReadPlan cannot reproduce.
+    """
+
+
+def formatter(field):
+    """
+    The field's to_representation, on an unbound copy so cached plans do not keep the request alive.
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        # values() already yields the key
+        return None
+    if isinstance(field, serializers.SerializerMethodField):
+        # its row_values entry computes what the method returns
+        return None
+    return copy.deepcopy(field).to_representation
+
+
+class ReadPlan:
+    """
+    How to render one serializer from values() rows.
+    Nested single relations share the parent's row, under `prefix`.
+    """
+    def __init__(self, serializer, prefix=''):
+        if not isinstance(serializer, DynamicFieldsMixin):
+            raise Unsupported(type(serializer).__name__)
+        self.model = serializer.Meta.model
+        self.prefix = prefix
+        self.pk = prefix + self.model._meta.pk.name
+        self.columns = {self.pk}
+        self.annotations = {}
+        # (output name, kind, payload) in field order
+        self.steps = []
+        for name, field in serializer.fields.items():
+            if not field.write_only:
+                self.compile_field(serializer, name, field)
+
+    def compile_field(self, serializer, name, field):
+        prefix = self.prefix
+        if name in serializer.field_annotations:
+            self.annotations[prefix + name] = serializer.field_annotations[name](prefix)
+            self.steps.append((name, 'value', (prefix + name, None)))
+            return
+        if name in serializer.row_values:
+            required = [prefix + column for column in serializer.field_requires[name]]
+            self.columns.update(required)
+            self.steps.append((name, 'computed', (required, serializer.row_values[name], formatter(field))))
+            return
+        if field.source == '*' or len(field.source_attrs) != 1:
+            raise Unsupported(name)
+        attr = field.source_attrs[0]
+        try:
+            model_field = self.model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise Unsupported(name)
+        if not model_field.is_relation:
+            self.columns.add(prefix + attr)
+            self.steps.append((name, 'value', (prefix + attr, formatter(field))))
+            return
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if not isinstance(nested, serializers.BaseSerializer):
+            if not isinstance(field, serializers.PrimaryKeyRelatedField) or not model_field.concrete:
+                raise Unsupported(name)
+            self.columns.add(prefix + attr)
+            self.steps.append((name, 'value', (prefix + attr, None)))
+            return
+        if model_field.many_to_many:
+            raise Unsupported(name)
+        if model_field.concrete:
+            # joined: the nested columns and annotations come with the parent row
+            child = ReadPlan(nested, f'{prefix}{attr}__')
+            self.columns.add(prefix + attr)
+            self.columns.update(child.columns)
+            self.annotations.update(child.annotations)
+            self.steps.append((name, 'joined', child))
+            return
+        if not model_field.one_to_many:
+            raise Unsupported(name)
+        # reverse FK: one query for every parent row, grouped on the key back to the parent
+        child = ReadPlan(nested)
+        back = model_field.field.name
+        child.columns.add(back)
+        self.steps.append((name, 'many', (back, child)))
+
+    def values(self, queryset, extra=()):
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset.values(*sorted(self.columns | self.annotations.keys() | set(extra)))
+
+    def related(self, rows):
+        """
+        Fetch the collections for `rows`, keyed by step name.
+        """
+        loaded = {}
+        for name, kind, payload in self.steps:
+            if kind == 'joined':
+                loaded[name] = payload.related(rows)
+            elif kind == 'many':
+                back, plan = payload
+                ids = [row[self.pk] for row in rows]
+                fetched = list(plan.values(plan.model._default_manager.filter(**{f'{back}__in': ids})))
+                grouped = defaultdict(list)
+                for row, data in zip(fetched, plan.render(fetched)):
+                    grouped[row[back]].append(data)
+                loaded[name] = grouped
+        return loaded
+
+    async def arelated(self, rows):
+        loaded = {}
+        for name, kind, payload in self.steps:
+            if kind == 'joined':
+                loaded[name] = await payload.arelated(rows)
+            elif kind == 'many':
+                back, plan = payload
+                ids = [row[self.pk] for row in rows]
+                fetched = [row async for row in plan.values(plan.model._default_manager.filter(**{f'{back}__in': ids}))]
+                grouped = defaultdict(list)
+                for row, data in zip(fetched, await plan.arender(fetched)):
+                    grouped[row[back]].append(data)
+                loaded[name] = grouped
+        return loaded
+
+    def render(self, rows):
+        loaded = self.related(rows)
+        return [self.render_row(row, loaded) for row in rows]
+
+    async def arender(self, rows):
+        loaded = await self.arelated(rows)
+        return [self.render_row(row, loaded) for row in rows]
+
+    def render_row(self, row, loaded):
+        data = {}
+        for name, kind, payload in self.steps:
+            if kind == 'value':
+                key, fmt = payload
+                value = row[key]
+                data[name] = value if value is None or fmt is None else fmt(value)
+            elif kind == 'computed':
+                required, compute, fmt = payload
+                value = compute(*(row[key] for key in required))
+                data[name] = value if value is None or fmt is None else fmt(value)
+            elif kind == 'joined':
+                data[name] = None if row[payload.pk] is None else payload.render_row(row, loaded[name])
+            else:
+                data[name] = loaded[name].get(row[self.pk], [])
+        return data
+
+
+_plans = {}
+# taken to add or drop plans; lookups go without it
+_plans_lock = threading.Lock()
+_MISSING = object()
+
+
+def get_read_plan(view, serializer_class=None):
+    """
+    The cached plan for the view's serializer (or `serializer_class`) and the request's shape params, or None.
+    """
+    request = view.request
+    # shape params only trim fields on safe requests
+    key = (type(view), serializer_class, request.method in SAFE_METHODS,
+           *(request.query_params.get(name, '') for name in SHAPE_PARAMS))
+    plan = _plans.get(key, _MISSING)
+    if plan is not _MISSING:
+        return plan
+    if serializer_class is None:
+        serializer = view.get_serializer()
+    else:
+        serializer = serializer_class(context=view.get_serializer_context())
+    try:
+        plan = ReadPlan(serializer)
+    except Unsupported:
+        plan = None
+    with _plans_lock:
+        if key not in _plans and len(_plans) >= PLAN_CACHE_SIZE:
+            del _plans[next(iter(_plans))]
+        _plans[key] = plan
+    return plan
+
+
+class FastReadMixin(ShapedQuerysetMixin):
+    """
+    ViewSet mixin: list/retrieve render values() rows through a ReadPlan instead of the serializer.
+    Set `fast_read = False` on a view to always use the serializer.
+    """
+    fast_read = True
+    read_plan = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.fast_read and request.method in SAFE_METHODS and self.action in ('list', 'retrieve'):
+            self.read_plan = get_read_plan(self)
+
+    def filter_queryset(self, queryset):
+        if self.read_plan is None:
+            return super().filter_queryset(queryset)
+        # skip ShapedQuerysetMixin: the plan selects its own columns
+        queryset = super(ShapedQuerysetMixin, self).filter_queryset(queryset)
+        # keyset pagination reads the ordering field off the last row
+        return self.read_plan.values(queryset, extra=getattr(self, 'ordering_fields', None) or ())
+
+    def list(self, request, *args, **kwargs):
+        if self.read_plan is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.read_plan.render(page))
+        return Response(self.read_plan.render(list(queryset)))
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.read_plan is None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(self.read_plan.render([self.get_object()])[0])
+
+    async def alist(self, request, *args, **kwargs):
+        if self.read_plan is None:
+            return await super().alist(request, *args, **kwargs)
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(await self.read_plan.arender(page))
+        return Response(await self.read_plan.arender([row async for row in queryset]))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        if self.read_plan is None:
+            return await super().aretrieve(request, *args, **kwargs)
+        return Response((await self.read_plan.arender([await self.aget_object()]))[0])
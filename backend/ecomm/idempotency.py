@@ -0,0 +1,87 @@
+# ecomm/idempotency.py: Idempotency-Key support for POST endpoints that clients retry
+# - @idempotent on a view method: a request carrying an Idempotency-Key header runs once per user,
+#   endpoint and key; repeats within IDEMPOTENCY_TTL get the stored response back (status and data,
+#   with an Idempotent-Replayed: true header) without running the view again
+# - Each key is one cache entry (caches[IDEMPOTENCY_CACHE_ALIAS]) holding a (fingerprint, status, data)
+#   tuple and expiring by itself; the fingerprint is a hash of the path and payload, so reusing a key
+#   for a different request is refused with 422
+# - A repeat that arrives while the first request still runs waits for its response instead of running
+#   too (an in-flight marker taken with cache.add); after IDEMPOTENCY_LOCK_TIMEOUT it gets a 409
+# - Server errors (5xx, exceptions) are not stored, so the client's retry runs the request again
+# - Needs a cache shared by all workers (e.g. Redis) to hold across processes
+
+import hashlib
+import json
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.01
+
+
+def get_cache():
+    return caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+
+
+def cache_key(request, key):
+    digest = hashlib.sha256(f'{request.path}\n{key}'.encode()).hexdigest()[:40]
+    return f'idempotency:{request.user.pk}:{digest}'
+
+
+def fingerprint(request):
+    """
+    A hash of what the request asks for: its path, query string and parsed payload.
+    """
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.get_full_path(), data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def replay(stored, request_fingerprint):
+    stored_fingerprint, status, data = stored
+    if stored_fingerprint != request_fingerprint:
+        return Response({'error': f'{HEADER} was already used for a different request'}, status=422)
+    return Response(data, status=status, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view_method):
+    """
+    Decorator for a view method (after authentication) that honours the Idempotency-Key header.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}, status=400)
+        cache = get_cache()
+        entry = cache_key(request, key)
+        marker = f'{entry}:running'
+        request_fingerprint = fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_TIMEOUT
+        # the marker expires by itself should the request running the key die
+        while not cache.add(marker, True, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            stored = cache.get(entry)
+            if stored is not None:
+                return replay(stored, request_fingerprint)
+            if time.monotonic() > deadline:
+                return Response({'error': f'A request with this {HEADER} is still in progress'}, status=409)
+            time.sleep(POLL_INTERVAL)
+        try:
+            stored = cache.get(entry)
+            if stored is not None:
+                return replay(stored, request_fingerprint)
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code < 500:
+                cache.set(entry, (request_fingerprint, response.status_code, response.data), settings.IDEMPOTENCY_TTL)
+            return response
+        finally:
+            cache.delete(marker)
+    return wrapper
@@ -0,0 +1,62 @@
+# ecomm/middleware.py: project middleware
+# - AsyncURLConfMiddleware: with settings.ASYNC_VIEWS_ENABLED, requests served over ASGI resolve against
+#   settings.ASYNC_URLCONF, where the hot read endpoints are async views (ecomm/asyncviews.py); otherwise,
+#   and for WSGI requests, ROOT_URLCONF applies
+# - ReplicaPinMiddleware: after a user's successful write, their reads stay on the primary database for a
+#   while (ecomm/replicas.py)
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework.permissions import SAFE_METHODS
+from .replicas import pin_user
+
+
+class AsyncURLConfMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if settings.ASYNC_VIEWS_ENABLED and isinstance(request, ASGIRequest):
+            request.urlconf = settings.ASYNC_URLCONF
+        # in async mode this returns get_response's coroutine for the handler to await
+        return self.get_response(request)
+
+
+class ReplicaPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.wrote(request, response):
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.wrote(request, response):
+            # request.user may still be the lazy session user, which loads from the database
+            await sync_to_async(self.pin)(request)
+        return response
+
+    def wrote(self, request, response):
+        return settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400
+
+    def pin(self, request):
+        # DRF views replace request.user with the user their authentication found
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_user(user)
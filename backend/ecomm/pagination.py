@@ -0,0 +1,279 @@
+# ecomm/pagination.py: pagination classes shared by the catalog and sales APIs
+# - PageSizePagination: the default page-number pagination, with a client-selectable page size up to a cap
+# - KeysetPagination: opt-in keyset ("seek") pagination over the view's ordering field plus an id tie-breaker,
+#   so deep pages cost the same as the first one and no COUNT(*) runs unless asked for; a queryset ordered
+#   by a computed value (e.g. search rank) is refused rather than paged in another order
+# - OptionalKeysetPagination: page numbers by default, keyset when the request carries a `cursor` param
+# - Each class also has apaginate_queryset(), which fetches the page with the async ORM (ecomm/asyncviews.py)
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.settings import api_settings
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PageSizePagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset with the count and the page fetched through the async ORM.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached_property; preset it so page() does not query
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+def estimate_count(queryset):
+    """
+    Planner row estimate on Postgres (no scan), exact count elsewhere.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count()
+
+
+async def aestimate_count(queryset):
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(await queryset.order_by().aexplain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return await queryset.acount()
+
+
+def row_value(obj, name):
+    # pages hold model instances, or values() rows on the fast read path
+    return obj[name] if isinstance(obj, dict) else getattr(obj, name)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination seeking on (ordering field, id).
+    The ordering field is whatever OrderingFilter (or the queryset) ordered by, as long as
+    it is one of the view's `ordering_fields`; otherwise pages are ordered by `-id`, except that an
+    ordering by an annotation (search rank) is a 400.
+    Pass `count=exact` for an exact total or `count=estimate` for the planner's estimate.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    tie_breaker = 'id'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset, view):
+        order_by = list(queryset.query.order_by or queryset.query.get_meta().ordering)
+        allowed = set(getattr(view, 'ordering_fields', None) or []) | {self.tie_breaker}
+        if order_by and isinstance(order_by[0], str) and order_by[0].lstrip('-') in allowed:
+            return order_by[0].lstrip('-'), order_by[0].startswith('-')
+        if order_by and isinstance(order_by[0], str) and order_by[0].lstrip('-') in queryset.query.annotations:
+            field = order_by[0].lstrip('-')
+            raise ValidationError({self.cursor_query_param: [
+                f'Results ordered by {field} cannot be paged with a cursor; pass ordering= or use page numbers.'
+            ]})
+        return self.tie_breaker, True
+
+    def encode_cursor(self, obj, reverse):
+        value = row_value(obj, self.field)
+        if self.field == self.tie_breaker:
+            value = None
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        else:
+            value = str(value)
+        payload = {
+            'f': self.field,
+            'v': value,
+            'id': row_value(obj, self.tie_breaker),
+            'r': reverse,
+        }
+        return urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, request, queryset):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(raw.encode()))
+            if payload['f'] != self.field:
+                raise ValueError
+            model_field = queryset.model._meta.get_field(self.field)
+            value = None if payload['v'] is None else model_field.to_python(payload['v'])
+            return value, int(payload['id']), bool(payload['r'])
+        except Exception:
+            raise NotFound('Invalid cursor')
+
+    def seek(self, value, pk, descending):
+        op = 'lt' if descending else 'gt'
+        if self.field == self.tie_breaker:
+            return Q(**{f'{self.tie_breaker}__{op}': pk})
+        return Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'{self.tie_breaker}__{op}': pk})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor = self.prepare(queryset, request, view)
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == 'exact':
+            self.count = queryset.count()
+        elif count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        return self.finish(list(self.page_queryset(queryset, cursor)), cursor)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        cursor = self.prepare(queryset, request, view)
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == 'exact':
+            self.count = await queryset.acount()
+        elif count_mode == 'estimate':
+            self.count = await aestimate_count(queryset)
+        return self.finish([row async for row in self.page_queryset(queryset, cursor)], cursor)
+
+    def prepare(self, queryset, request, view):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size_value = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset, view)
+        cursor = self.decode_cursor(request, queryset)
+        self.reverse = bool(cursor and cursor[2])
+        self.count = None
+        return cursor
+
+    def page_queryset(self, queryset, cursor):
+        # walking backwards flips the direction, then the page is flipped back
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        ordering = [f'{prefix}{self.field}']
+        if self.field != self.tie_breaker:
+            ordering.append(f'{prefix}{self.tie_breaker}')
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            queryset = queryset.filter(self.seek(cursor[0], cursor[1], descending))
+        return queryset[:self.page_size_value + 1]
+
+    def finish(self, rows, cursor):
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if self.reverse:
+            rows.reverse()
+        self.page = rows
+        self.has_next = has_more if not self.reverse else bool(cursor)
+        self.has_previous = bool(cursor) if not self.reverse else has_more
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[-1], False))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.page[0], True))
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'description': 'Only present when `count=exact` or `count=estimate` is passed.'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Keyset cursor; pass it empty to start keyset pagination from the first page.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results per page (max {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Include a total count: `exact` or `estimate` (keyset mode only).',
+                'schema': {'type': 'string', 'enum': ['exact', 'estimate']},
+            },
+        ]
+
+
+class OptionalKeysetPagination(BasePagination):
+    """
+    Page-number pagination unless the request opts into keyset pagination with `?cursor`.
+    """
+    def __init__(self):
+        self.page_number = PageSizePagination()
+        self.keyset = KeysetPagination()
+        self.active = self.page_number
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset.cursor_query_param in request.query_params:
+            self.active = self.keyset
+        return self.active.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        if self.keyset.cursor_query_param in request.query_params:
+            self.active = self.keyset
+        return await self.active.apaginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.active.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        page_params = self.page_number.get_schema_operation_parameters(view)
+        names = {param['name'] for param in page_params}
+        return page_params + [
+            param for param in self.keyset.get_schema_operation_parameters(view)
+            if param['name'] not in names
+        ]
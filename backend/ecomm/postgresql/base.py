@@ -0,0 +1,26 @@
+# ecomm/postgresql/base.py: the django_prometheus PostgreSQL engine, made safe for connection pools
+# - django_prometheus wraps a connection's cursor factory in get_new_connection(); a pooled connection
+#   comes back there on every checkout, so its cursors ended up wrapped once per checkout (and every
+#   query counted that many times). Each connection is wrapped once here.
+
+from weakref import WeakSet
+from django_prometheus.db.backends.common import get_postgres_cursor_class
+from django_prometheus.db.backends.postgresql import base as prometheus_base
+from django_prometheus.db.common import ExportingCursorWrapper
+
+# cursor factories that already export metrics (dropped with the last connection using them)
+EXPORTING = WeakSet()
+
+
+class DatabaseWrapper(prometheus_base.DatabaseWrapper):
+    def get_new_connection(self, *args, **kwargs):
+        if not self.pool:
+            return super().get_new_connection(*args, **kwargs)
+        # DatabaseWrapperMixin counts the checkout as a new connection and its failures
+        conn = super(prometheus_base.DatabaseWrapper, self).get_new_connection(*args, **kwargs)
+        if conn.cursor_factory not in EXPORTING:
+            conn.cursor_factory = ExportingCursorWrapper(
+                conn.cursor_factory or get_postgres_cursor_class(), self.alias, self.vendor
+            )
+            EXPORTING.add(conn.cursor_factory)
+        return conn
@@ -0,0 +1,49 @@
+# ecomm/renderers.py: JSON renderer built on orjson, a drop-in for DRF's JSONRenderer
+# - Produces the same bytes as JSONRenderer for compact UTF-8 output (the API default);
+#   indented (browsable API), ASCII-only or non-strict output uses JSONRenderer unchanged
+# - Decimal, datetime, date, time, timedelta and UUID are handled as DRF's JSONEncoder
+#   does (datetimes trimmed to milliseconds with a "Z" suffix); anything orjson cannot encode,
+#   such as integers beyond 64 bits, is rendered by JSONRenderer
+# - Known difference: floats below 1e-4 or from 1e16 are written without an exponent sign or
+#   padding (1e16, not 1e+16) and NaN/Infinity become null; the API renders no floats
+# - Enabled through REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"]; without orjson installed it
+#   behaves exactly like JSONRenderer
+
+from decimal import Decimal
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+OPTIONS = 0
+if orjson is not None:
+    # datetimes and dataclasses go through default() so they match DRF's JSONEncoder
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing identical bytes through orjson.
+    """
+    def __init__(self):
+        self.encoder = self.encoder_class()
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            # as JSONEncoder; serializer fields have already turned decimals into strings
+            return float(obj)
+        return self.encoder.default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or orjson is None or self.ensure_ascii or not self.strict or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or '', renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes the JavaScript line terminators, valid JSON but not valid JS
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
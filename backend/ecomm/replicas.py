@@ -0,0 +1,85 @@
+# ecomm/replicas.py: read-replica routing for catalog and order-history reads
+# - settings.DATABASE_REPLICAS lists the replica aliases (built from DB_REPLICAS); when empty every
+#   query goes to default
+# - Views with ReplicaReadMixin (products, categories, orders) read from a random replica on GET/HEAD/OPTIONS
+# - ReplicaRouter sends writes, select_for_update() (a write query to Django), reads inside a transaction
+#   and reads after a write in the same request to default; replicas are never migrated
+# - ReplicaPinMiddleware pins a user to default for DATABASE_REPLICA_PIN_SECONDS after a successful
+#   POST/PUT/PATCH/DELETE of theirs, so their next reads (e.g. orders after checkout) see their own writes;
+#   pins live in the default cache, so they need a shared cache with several workers
+
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# replica serving the current request's reads, if any
+read_alias = ContextVar('replica_read_alias', default=None)
+# set once the current request routed a query to default for writing
+wrote = ContextVar('replica_wrote', default=False)
+
+
+def reading_from_replica():
+    """
+    Whether reads in the current request go to a replica.
+    """
+    return read_alias.get() is not None and not wrote.get()
+
+
+def pin_key(user):
+    return f'replica:pin:{user.pk}'
+
+
+def pin_user(user):
+    cache.set(pin_key(user), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(pin_key(user)) is not None
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the replica chosen for the request, everything else to default.
+    """
+    def db_for_read(self, model, **hints):
+        if not reading_from_replica() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the primary's data, so objects from any of them may be related
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    APIView mixin: safe requests read from a replica unless the user is pinned to the primary.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # authenticated by now, so a pinned user can be recognized
+        if request.method in SAFE_METHODS and settings.DATABASE_REPLICAS and not is_pinned(request.user):
+            self.replica_tokens = (read_alias.set(random.choice(settings.DATABASE_REPLICAS)), wrote.set(False))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        tokens = getattr(self, 'replica_tokens', None)
+        if tokens is not None:
+            read_alias.reset(tokens[0])
+            wrote.reset(tokens[1])
+            self.replica_tokens = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,183 @@
+# ecomm/serializers.py: client-selected response shapes shared by the catalog and sales APIs
+# - ?fields=id,name,items.qty keeps only the listed fields; dotted paths reach into nested serializers
+# - ?omit=description,items.subtotal drops fields the same way
+# - ?expand=product swaps a compact nested field for its full form, wherever that field appears
+# - fields/omit only shape reads (safe methods); writes always validate against the full serializer
+# - The selected shape also drives the queryset (ShapedQuerysetMixin): only() the rendered columns,
+#   select_related() the rendered forward relations and prefetch_related() the rendered collections
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_paths(value):
+    """
+    "a,b.c,b.d" -> {"a": {}, "b": {"c": {}, "d": {}}}; an empty dict means the whole field.
+    """
+    tree = {}
+    for path in filter(None, (part.strip() for part in value.split(','))):
+        node = tree
+        for name in path.split('.'):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def expand_requested(request, name):
+    """
+    True when ?expand= (comma separated) asks for the full nested `name`.
+    """
+    if request is None:
+        return False
+    return name in request.query_params.get('expand', '').split(',')
+
+
+class QueryShape:
+    """
+    The columns and relations a serializer renders, applied to a queryset in one go.
+    """
+    def __init__(self):
+        self.only = set()
+        self.select = set()
+        self.prefetch = []
+        self.annotations = {}
+
+    def apply(self, queryset, only=True):
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        if only:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin implementing ?fields=, ?omit= and ?expand=, and describing the
+    queryset its (selected) fields need.
+    """
+    # name -> callable returning the full field that ?expand=name swaps in
+    expandable_fields = {}
+    # non-column field -> model fields it reads, e.g. a property
+    field_requires = {}
+    # name -> callable(prefix='') returning the expression annotated as `name`; `prefix` is the
+    # relation path when the serializer is joined into its parent's query (see ecomm/fastread.py)
+    field_annotations = {}
+    # name -> callable computing a non-column field from its field_requires values (see ecomm/fastread.py)
+    row_values = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None:
+            return fields
+        safe = request.method in SAFE_METHODS
+        for name, build in self.expandable_fields.items():
+            # a writable field keeps its input format on writes
+            if name in fields and (safe or fields[name].read_only) and expand_requested(request, name):
+                fields[name] = build()
+        if not safe:
+            return fields
+        path = self.field_path()
+        selected = self.selected_names(parse_paths(request.query_params.get('fields', '')), path)
+        if selected is not None:
+            fields = {name: field for name, field in fields.items() if name in selected}
+        omitted = self.omitted_names(parse_paths(request.query_params.get('omit', '')), path)
+        return {name: field for name, field in fields.items() if name not in omitted}
+
+    def field_path(self):
+        path, node = [], self
+        while node.parent is not None:
+            # list serializers bind their child with an empty field name
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return path[::-1]
+
+    @staticmethod
+    def selected_names(tree, path):
+        for name in path:
+            if not tree:
+                return None
+            tree = tree.get(name, {})
+        return set(tree) or None
+
+    @staticmethod
+    def omitted_names(tree, path):
+        for name in path:
+            tree = tree.get(name)
+            if not tree:
+                return set()
+        return {name for name, children in tree.items() if not children}
+
+    def query_shape(self, shape=None, prefix=''):
+        """
+        Collect what rendering self.fields needs into a QueryShape.
+        Relations rendered by a nested serializer are select_related (forward, single) or
+        prefetched with a queryset shaped by that serializer (collections, or serializers
+        needing annotations). Relations rendered as a primary key only load the column.
+        """
+        shape = shape or QueryShape()
+        model = self.Meta.model
+        shape.only.add(prefix + model._meta.pk.name)
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            shape.only.update(prefix + required for required in self.field_requires.get(name, ()))
+            if name in self.field_annotations:
+                shape.annotations[prefix + name] = self.field_annotations[name]()
+                continue
+            if field.source == '*':
+                continue
+            attr = field.source_attrs[0]
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # a property or method; field_requires lists what it reads
+                continue
+            if not model_field.is_relation:
+                shape.only.add(prefix + attr)
+                continue
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if model_field.many_to_many and not isinstance(nested, DynamicFieldsMixin):
+                shape.prefetch.append(prefix + attr)
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                # forward relation: the parent always needs the key column
+                shape.only.add(prefix + attr)
+            if not isinstance(nested, serializers.BaseSerializer):
+                continue
+            if not isinstance(nested, DynamicFieldsMixin):
+                shape.prefetch.append(prefix + attr)
+            elif model_field.concrete and not model_field.many_to_many and not nested.field_annotations.keys() & nested.fields.keys():
+                shape.select.add(prefix + attr)
+                nested.query_shape(shape, f'{prefix}{attr}__')
+            else:
+                child = nested.query_shape()
+                if model_field.one_to_many or model_field.one_to_one and not model_field.concrete:
+                    # reverse relation: prefetching matches rows on the key back to the parent
+                    child.only.add(model_field.field.name)
+                queryset = child.apply(model_field.related_model._default_manager.all())
+                shape.prefetch.append(Prefetch(prefix + attr, queryset=queryset))
+        return shape
+
+
+class DynamicModelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    pass
+
+
+class ShapedQuerysetMixin:
+    """
+    ViewSet mixin: shape the filtered queryset after the serializer the request will render.
+    Reads also restrict the loaded columns; writes load full rows so saves are not partial.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        shape = self.get_serializer().query_shape()
+        # keyset pagination reads the ordering field off the last row
+        shape.only.update(getattr(self, 'ordering_fields', None) or ())
+        return shape.apply(queryset, only=self.request.method in SAFE_METHODS)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 load_dotenv('.env')
@@ -50,12 +51,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "rest_framework",
     "oauth2_provider",
     "drf_spectacular",
     "catalog",
     "sales",
     "accounts",
+    "ecomm",
     "corsheaders",
     'django_prometheus',
     'prometheus_client',
@@ -75,15 +78,28 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = False
+# clients send Idempotency-Key on retried cart mutations and checkouts (ecomm/idempotency.py)
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "oauth2_provider.contrib.rest_framework.OAuth2Authentication",
+        "accounts.authentication.CachedOAuth2Authentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated", # IsAuthenticated / AllowAny
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # orjson-backed drop-ins for JSONRenderer/JSONParser (same bytes and data, see ecomm/renderers.py);
+    # use rest_framework.renderers.JSONRenderer / rest_framework.parsers.JSONParser to switch back
+    "DEFAULT_RENDERER_CLASSES": [
+        "ecomm.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "ecomm.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 12,
     'DEFAULT_FILTER_BACKENDS': [
@@ -106,6 +122,12 @@ OAUTH2_PROVIDER = {
     }
 }
 
+# Validated bearer tokens are cached per process (accounts/authentication.py); revocations reach the
+# other processes through the OAUTH2_TOKEN_CACHE_ALIAS cache, so several workers need a shared one
+OAUTH2_TOKEN_CACHE_ALIAS = "default"
+OAUTH2_TOKEN_CACHE_TTL = int(os.getenv("OAUTH2_TOKEN_CACHE_TTL", 30))  # seconds
+OAUTH2_TOKEN_CACHE_SIZE = int(os.getenv("OAUTH2_TOKEN_CACHE_SIZE", 10000))
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "E-commerce API",
     "DESCRIPTION": "API for E-commerce platform",
@@ -133,6 +155,7 @@ LOGIN_REDIRECT_URL = '/'
 
 MIDDLEWARE = [
     'django_prometheus.middleware.PrometheusBeforeMiddleware',
+    'ecomm.middleware.AsyncURLConfMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -140,12 +163,18 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ecomm.middleware.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_prometheus.middleware.PrometheusAfterMiddleware',
 ]
 
 ROOT_URLCONF = 'ecomm.urls'
+# requests served over ASGI when ASYNC_VIEWS_ENABLED; the hot read endpoints there are async views
+# (ecomm/asyncviews.py). Off by default: bench_api measured them at about half the throughput per core of
+# the sync views run by the ASGI handler's thread pool
+ASYNC_URLCONF = 'ecomm.asgi_urls'
+ASYNC_VIEWS_ENABLED = os.getenv("ASYNC_VIEWS", "").lower() in ("1", "true", "yes")
 
 TEMPLATES = [
     {
@@ -175,17 +204,117 @@ WSGI_APPLICATION = 'ecomm.wsgi.application'
 #     }
 # }
 
+# Connections are kept open between requests (DB_CONN_MAX_AGE seconds, checked before reuse).
+# DB_POOL=1 uses a psycopg 3 connection pool per process instead (DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE
+# connections, waiting at most DB_POOL_TIMEOUT seconds for one); pool stats are exported on /metrics
+# (ecomm/dbpool.py). The django_prometheus engine counts connections, queries and their latency.
+DB_POOL = os.getenv("DB_POOL", "").lower() in ("1", "true", "yes")
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "ecomm.postgresql",
         "NAME": os.getenv("DB_NAME"),
         "USER": os.getenv("DB_USER"),
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
+        # a pool replaces persistent connections, Django refuses both at once
+        "CONN_MAX_AGE": 0 if DB_POOL else int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "true").lower() in ("1", "true", "yes"),
+        "OPTIONS": {
+            "pool": {
+                "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+                "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+            },
+        } if DB_POOL else {},
+    }
+}
+
+# Read replicas (ecomm/replicas.py): DB_REPLICAS="[name@]host[:port],..." adds replica1, replica2, ... with the
+# primary's credentials (and database name unless given). Product, category and order GETs read from a random replica, except for a user's
+# requests within DB_REPLICA_PIN_SECONDS of their own write. Writes and select_for_update() use default.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(",")), 1):
+    name, _, location = replica.strip().rpartition("@")
+    host, _, port = location.partition(":")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host or DATABASES["default"]["HOST"],
+        "PORT": port or DATABASES["default"]["PORT"],
+        "NAME": name or DATABASES["default"]["NAME"],
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        # tests read the test database through the replica connections
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+DATABASE_ROUTERS = ["ecomm.replicas.ReplicaRouter"]
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv("DB_REPLICA_PIN_SECONDS", 10))
+
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache, redis://localhost:6379/1) when running several workers
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "ecomm"),
     }
 }
 
+# Catalog response cache (catalog/cache.py)
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 300))
+
+# Cart storage (sales/carts.py): "sales.carts.ModelCartStore" writes every change to Cart/CartItem,
+# "sales.carts.CacheCartStore" keeps carts in the cache and writes them back every CART_FLUSH_INTERVAL
+# seconds (0: only at checkout) and at checkout
+CART_STORE = os.getenv("CART_STORE", "sales.carts.ModelCartStore")
+CART_CACHE_ALIAS = "default"
+CART_CACHE_TIMEOUT = int(os.getenv("CART_CACHE_TIMEOUT", 14 * 24 * 3600))
+CART_FLUSH_INTERVAL = int(os.getenv("CART_FLUSH_INTERVAL", 30))
+# a cart lock expires after CART_LOCK_TIMEOUT seconds unless its holder renews it (checkout and flushes do)
+CART_LOCK_TIMEOUT = 5
+
+# Stock holds (sales/reservations.py): adding to a cart holds the stock for STOCK_HOLD_SECONDS (0: no holds);
+# available-to-sell counters live in the STOCK_CACHE_ALIAS cache and are rebuilt after STOCK_COUNTER_TIMEOUT
+STOCK_HOLD_SECONDS = int(os.getenv("STOCK_HOLD_SECONDS", 15 * 60))
+STOCK_CACHE_ALIAS = "default"
+STOCK_COUNTER_TIMEOUT = int(os.getenv("STOCK_COUNTER_TIMEOUT", 600))
+
+# Stock slots (catalog/inventory.py): each product's stock is split over STOCK_SLOTS rows so concurrent
+# checkouts of one product take different row locks; 1 keeps a single counter per product
+STOCK_SLOTS = int(os.getenv("STOCK_SLOTS", 8))
+
+# Idempotency-Key (ecomm/idempotency.py): responses are kept for IDEMPOTENCY_TTL seconds; a repeat waits up
+# to IDEMPOTENCY_LOCK_TIMEOUT seconds for the first request to finish
+IDEMPOTENCY_CACHE_ALIAS = "default"
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+# Outbox (sales/outbox.py): events written with orders and handled by manage.py process_outbox; failed
+# events are retried after OUTBOX_RETRY_DELAY seconds, doubling up to OUTBOX_MAX_RETRY_DELAY
+OUTBOX_HANDLERS = {
+    "order.placed": [
+        "sales.handlers.refresh_product_stock",
+        "sales.handlers.adjust_stock_counters",
+        "sales.handlers.send_order_confirmation",
+        "sales.handlers.record_order_analytics",
+    ],
+    "order.status_changed": ["sales.handlers.record_status_analytics"],
+}
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_LEASE_SECONDS = 60
+OUTBOX_RETRY_DELAY = 10
+OUTBOX_MAX_RETRY_DELAY = 3600
+OUTBOX_MAX_ATTEMPTS = 10
+
+# Bulk order status changes (sales/transitions.py) lock and update this many orders per transaction
+ORDER_TRANSITION_CHUNK_SIZE = 5000
+
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "orders@localhost")
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
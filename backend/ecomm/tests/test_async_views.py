@@ -0,0 +1,96 @@
+from datetime import timedelta
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from accounts.authentication import token_cache
+from catalog.cache import invalidate_catalog_cache
+from catalog.models import Category, Product, ProductImage
+from sales.models import Cart
+
+User = get_user_model()
+
+@override_settings(ASYNC_VIEWS_ENABLED=True)
+class AsyncViewTest(TestCase):
+    """
+    With ASYNC_VIEWS_ENABLED, requests through AsyncClient are served by ecomm.asgi_urls and must
+    answer exactly like the sync views do over WSGI.
+    """
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username="async", password="p", email="a@example.com")
+        app = Application.objects.create(user=self.user, name="async", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        self.token = AccessToken.objects.create(user=self.user, application=app, token="async",
+            expires=timezone.now() + timedelta(hours=1),
+            scope="read:products write:products read:cart read:customers")
+        self.category = Category.objects.create(name="Async")
+        for i in range(5):
+            product = Product.objects.create(name=f"Async item {i}", category=self.category, price=i + 1, stock=i)
+            ProductImage.objects.create(product=product, url=f"https://img.test/{i}.png")
+        cart = Cart.objects.create(user=self.user)
+        cart.items.create(product=product, qty=2, price=product.price)
+        self.headers = {"authorization": f"Bearer {self.token.token}"}
+
+    async def both(self, url):
+        await sync_to_async(invalidate_catalog_cache)()
+        sync = await sync_to_async(self.client.get)(url, headers=self.headers)
+        await sync_to_async(invalidate_catalog_cache)()
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertTrue(iscoroutinefunction(response.resolver_match.func), url)
+        return sync, response
+
+    async def test_responses_match_sync_views(self):
+        slug = await Product.objects.values_list("slug", flat=True).afirst()
+        for url in [
+            "/api/products/", "/api/products/?page=2&page_size=2", "/api/products/?ordering=-price",
+            "/api/products/?cursor=&page_size=2&count=exact", f"/api/products/?category={self.category.id}",
+            "/api/products/?category=999999", "/api/products/?search=item", "/api/products/?fields=id,name",
+            "/api/products/?page=99", f"/api/products/{slug}/", "/api/products/missing/",
+            "/api/categories/", "/api/cart/", "/api/cart/?expand=product", "/accounts/user/",
+        ]:
+            with self.subTest(url=url):
+                sync, response = await self.both(url)
+                self.assertEqual(response.status_code, sync.status_code)
+                self.assertEqual(response.content, sync.content)
+
+    async def test_keyset_pages(self):
+        ids, url = [], "/api/products/?ordering=price&cursor=&page_size=2"
+        while url:
+            data = (await self.async_client.get(url, headers=self.headers)).json()
+            ids.extend(product["id"] for product in data["results"])
+            url = data["next"]
+        expected = [pk async for pk in Product.objects.order_by("price", "id").values_list("id", flat=True)]
+        self.assertEqual(ids, expected)
+
+    async def test_authentication_and_scopes(self):
+        self.assertEqual((await self.async_client.get("/api/products/")).status_code, 401)
+        bad = {"authorization": "Bearer nope"}
+        self.assertEqual((await self.async_client.get("/api/cart/", headers=bad)).status_code, 401)
+        self.token.scope = "read:cart"
+        await self.token.asave()
+        token_cache.clear()
+        self.assertEqual((await self.async_client.get("/accounts/user/", headers=self.headers)).status_code, 403)
+        self.assertEqual((await self.async_client.get("/api/cart/", headers=self.headers)).status_code, 200)
+
+    async def test_writes_use_sync_views(self):
+        response = await self.async_client.post(
+            "/api/products/", {"category": self.category.id, "name": "Posted", "price": "3.00", "stock": 1},
+            content_type="application/json", headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Product.objects.filter(name="Posted").aexists())
+
+    async def test_cached_reads_revalidate(self):
+        first = await self.async_client.get("/api/products/", headers=self.headers)
+        again = await self.async_client.get(
+            "/api/products/", headers={**self.headers, "if-none-match": first["ETag"]},
+        )
+        self.assertEqual(again.status_code, 304)
+
+    @override_settings(ASYNC_VIEWS_ENABLED=False)
+    async def test_sync_views_by_default(self):
+        response = await self.async_client.get("/api/products/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(iscoroutinefunction(response.resolver_match.func))
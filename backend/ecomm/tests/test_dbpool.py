@@ -0,0 +1,57 @@
+from django.db import connections
+from django.test import TestCase
+from prometheus_client import CollectorRegistry
+from psycopg_pool import PoolTimeout
+from ecomm.dbpool import PoolCollector
+from ecomm.postgresql.base import DatabaseWrapper
+
+class PoolMetricsTest(TestCase):
+    """
+    A pooled connection to the test database, exported through a PoolCollector.
+    """
+    def setUp(self):
+        pooled = {**connections["default"].settings_dict, "CONN_MAX_AGE": 0,
+            "OPTIONS": {"pool": {"min_size": 0, "max_size": 1, "timeout": 0.2}}}
+        self.connection = DatabaseWrapper(pooled)
+        self.addCleanup(self.connection.close_pool)
+        self.addCleanup(self.connection.close)
+        self.registry = CollectorRegistry()
+        self.registry.register(PoolCollector({"default": self.connection}))
+
+    def metric(self, name):
+        return self.registry.get_sample_value(f"django_db_pool_{name}", {"alias": "default"})
+
+    def test_pool_metrics(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertEqual(self.metric("in_use"), 1)
+        self.assertEqual(self.metric("max_size"), 1)
+        # the only connection is taken: the next checkout waits and times out
+        with self.assertRaises(PoolTimeout):
+            self.connection.pool.getconn()
+        self.assertEqual(self.metric("checkout_errors_total"), 1)
+        self.assertGreater(self.metric("checkout_wait_seconds_total"), 0.1)
+        self.connection.close()
+        self.assertEqual(self.metric("in_use"), 0)
+        self.assertEqual(self.metric("idle"), 1)
+        self.assertEqual(self.metric("checkouts_total"), 2)
+        self.assertEqual(self.metric("connections_total"), 1)
+
+    def test_pooled_cursors_wrapped_once(self):
+        factories = []
+        for _ in range(3):
+            self.connection.ensure_connection()
+            factories.append(self.connection.connection.cursor_factory)
+            self.connection.close()
+        self.assertEqual(len(set(factories)), 1)
+
+    def test_no_pool_no_metrics(self):
+        registry = CollectorRegistry()
+        registry.register(PoolCollector(connections))
+        self.assertIsNone(registry.get_sample_value("django_db_pool_size", {"alias": "default"}))
+
+    def test_persistent_connections_by_default(self):
+        settings = connections["default"].settings_dict
+        self.assertGreater(settings["CONN_MAX_AGE"], 0)
+        self.assertTrue(settings["CONN_HEALTH_CHECKS"])
+        self.assertNotIn("pool", settings["OPTIONS"])
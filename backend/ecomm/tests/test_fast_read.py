@@ -0,0 +1,132 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APITestCase
+from catalog.cache import invalidate_catalog_cache
+from catalog.models import Category, Product, ProductImage, ProductSpecification
+from catalog.views import CategoryViewSet, ProductViewSet
+from ecomm import fastread
+from sales.models import Order, OrderItem
+from sales.views import OrderViewSet
+
+User = get_user_model()
+
+class FastReadParityTest(APITestCase):
+    """
+    Every URL must render the same JSON through a ReadPlan as through the serializer.
+    """
+    def setUp(self):
+        self.category = Category.objects.create(name="Parity")
+        empty = Category.objects.create(name="Empty")
+        self.products = []
+        for i in range(5):
+            product = Product.objects.create(
+                name=f"Parity laptop {i}", category=self.category if i else empty,
+                price=f"{i}9.5{i}", stock=i, description=f"Item {i} description",
+            )
+            # products 0 and 1 have no image
+            for j in range(i // 2):
+                ProductImage.objects.create(product=product, url=f"https://img.test/{i}/{j}.png")
+            ProductSpecification.objects.create(product=product, name="ram", value=f"{i}GB")
+            self.products.append(product)
+        user = User.objects.create_user(username="parity", password="p")
+        app = Application.objects.create(user=user, name="parity", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        token = AccessToken.objects.create(user=user, application=app, token="parity",
+            expires=timezone.now() + timedelta(hours=1), scope="read:products read:orders")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.token}")
+        Order.objects.create(customer=user.customer, status="pending")  # no items
+        self.order = Order.objects.create(customer=user.customer, status="paid")
+        for product in self.products[1:4]:
+            OrderItem.objects.create(order=self.order, product=product, qty=2, price=product.price)
+
+    def both(self, url):
+        """
+        (fast, serializer) responses for url, each rendered from scratch.
+        """
+        responses = []
+        for fast in (True, False):
+            invalidate_catalog_cache()
+            fastread._plans.clear()
+            with mock.patch.object(CategoryViewSet, "fast_read", fast), \
+                    mock.patch.object(ProductViewSet, "fast_read", fast), \
+                    mock.patch.object(OrderViewSet, "fast_read", fast):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            if fast:
+                # the fast response really came from a plan
+                self.assertNotIn(None, fastread._plans.values())
+            responses.append(response.content)
+        return responses
+
+    def assertParity(self, *urls):
+        for url in urls:
+            with self.subTest(url=url):
+                fast, slow = self.both(url)
+                self.assertEqual(fast, slow)
+
+    def test_products(self):
+        slug = self.products[3].slug
+        self.assertParity(
+            "/api/products/",
+            "/api/products/?page=2&page_size=2",
+            "/api/products/?ordering=-price",
+            "/api/products/?ordering=price&cursor=&page_size=2",
+            "/api/products/?search=laptop",
+            f"/api/products/?category={self.category.id}",
+            "/api/products/?fields=id,name,images",
+            "/api/products/?omit=description,images",
+            "/api/products/?expand=category",
+            "/api/products/?fields=id,category.name&expand=category",
+            f"/api/products/{slug}/",
+            f"/api/products/{slug}/?expand=category&omit=images",
+        )
+
+    def test_categories(self):
+        self.assertParity(
+            "/api/categories/",
+            "/api/categories/?fields=slug",
+            f"/api/categories/{self.category.slug}/",
+        )
+
+    def test_orders(self):
+        self.assertParity(
+            "/api/orders/",
+            "/api/orders/?cursor=&page_size=1",
+            "/api/orders/?status=paid",
+            "/api/orders/?expand=product",
+            "/api/orders/?fields=id,items.product.thumbnail,items.subtotal",
+            "/api/orders/?omit=items.product,customer",
+            f"/api/orders/{self.order.id}/",
+            f"/api/orders/{self.order.id}/?expand=product",
+        )
+
+    def test_cursor_pages_follow_fast_rows(self):
+        ids, url = [], "/api/products/?ordering=price&cursor=&page_size=2"
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(product["id"] for product in data["results"])
+            url = data["next"]
+        self.assertEqual(ids, list(Product.objects.order_by("price", "id").values_list("id", flat=True)))
+
+    def test_plans_are_cached_per_shape(self):
+        fastread._plans.clear()
+        invalidate_catalog_cache()
+        self.client.get("/api/products/?fields=id")
+        self.client.get("/api/products/?fields=id&page=1")
+        self.client.get("/api/products/?fields=name")
+        plans = [plan for key, plan in fastread._plans.items() if key[0] is ProductViewSet]
+        self.assertEqual(len(plans), 2)
+        # both shapes compile, i.e. neither falls back to the serializer
+        self.assertNotIn(None, plans)
+
+    def test_plan_cache_drops_its_oldest_plan(self):
+        fastread._plans.clear()
+        with mock.patch.object(fastread, "PLAN_CACHE_SIZE", 3):
+            for fields in ["id", "name", "price", "slug"]:
+                invalidate_catalog_cache()
+                self.assertEqual(self.client.get(f"/api/products/?fields={fields}").status_code, 200)
+        self.assertEqual(len(fastread._plans), 3)
+        self.assertEqual([key[3] for key in fastread._plans], ["name", "price", "slug"])
@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APITestCase
+from accounts.authentication import token_cache
+from catalog.models import Category, Product
+from sales.models import CartItem, Order
+from sales.views import CartViewSet
+
+User = get_user_model()
+
+def shopper(name):
+    user = User.objects.create_user(username=name, password="p")
+    app = Application.objects.create(user=user, name=name, client_type=Application.CLIENT_PUBLIC,
+        authorization_grant_type=Application.GRANT_PASSWORD)
+    AccessToken.objects.create(user=user, application=app, token=name,
+        expires=timezone.now()+timedelta(hours=1), scope="read:cart write:cart")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {name}")
+    return user, client
+
+class IdempotencyKeyTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user, self.client = shopper("retrier")
+        cat = Category.objects.create(name="Retries")
+        self.product = Product.objects.create(name="Retried", category=cat, price=5, stock=10)
+
+    def post(self, action, data=None, key=None, client=None):
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key is not None else {}
+        return (client or self.client).post(f"/api/cart/{action}/", data, format="json", **headers)
+
+    def test_retried_checkout_returns_the_first_order(self):
+        self.post("add", {"product_id": self.product.id, "qty": 2})
+        first = self.post("checkout", key="order-1")
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", first)
+        with self.assertNumQueries(0):
+            retry = self.post("checkout", key="order-1")
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+        # a new key is a new checkout, of what is now an empty cart
+        self.assertEqual(self.post("checkout", key="order-2").status_code, 400)
+
+    def test_retried_mutations_apply_once(self):
+        added = self.post("add", {"product_id": self.product.id, "qty": 1}, key="add-1")
+        self.post("add", {"product_id": self.product.id, "qty": 3})
+        # the retry answers with the first response and does not set qty back to 1
+        self.assertEqual(self.post("add", {"product_id": self.product.id, "qty": 1}, key="add-1").json(), added.json())
+        self.assertEqual(CartItem.objects.get().qty, 3)
+        item_id = CartItem.objects.get().id
+        removed = self.post("remove", {"item_id": item_id}, key="remove-1")
+        self.assertEqual(removed.status_code, 200)
+        self.assertEqual(self.post("remove", {"item_id": item_id}, key="remove-1").status_code, 200)
+        # without a key the repeat runs, and finds nothing to remove
+        self.assertEqual(self.post("remove", {"item_id": item_id}).status_code, 400)
+
+    def test_key_reused_for_another_request(self):
+        self.post("add", {"product_id": self.product.id, "qty": 1}, key="reused")
+        resp = self.post("add", {"product_id": self.product.id, "qty": 2}, key="reused")
+        self.assertEqual(resp.status_code, 422)
+        self.assertEqual(CartItem.objects.get().qty, 1)
+
+    def test_keys_are_per_user_and_endpoint(self):
+        _, other = shopper("other")
+        self.post("add", {"product_id": self.product.id, "qty": 1}, key="shared")
+        resp = self.post("add", {"product_id": self.product.id, "qty": 1}, key="shared", client=other)
+        self.assertNotIn("Idempotent-Replayed", resp)
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(self.post("checkout", key="shared").status_code, 200)
+
+    def test_invalid_keys(self):
+        for key in ["", "k" * 256]:
+            with self.subTest(length=len(key)):
+                self.assertEqual(self.post("add", {"product_id": self.product.id}, key=key).status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_server_errors_are_not_stored(self):
+        self.post("add", {"product_id": self.product.id, "qty": 1})
+        with mock.patch.object(CartViewSet, "place_order", return_value=Response(status=503)):
+            self.assertEqual(self.post("checkout", key="flaky").status_code, 503)
+        self.assertEqual(self.post("checkout", key="flaky").status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+class ConcurrentIdempotencyKeyTest(TransactionTestCase):
+    workers = 8
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user, self.client = shopper("impatient")
+        product = Product.objects.create(name="Popular", category=Category.objects.create(name="P"), price=3, stock=5)
+        self.client.post("/api/cart/add/", {"product_id": product.id, "qty": 1}, format="json")
+
+    def checkout(self, _):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer impatient")
+        try:
+            resp = client.post("/api/cart/checkout/", format="json", HTTP_IDEMPOTENCY_KEY="same-order")
+            return resp.status_code, resp.json()["id"]
+        finally:
+            connection.close()
+
+    def test_concurrent_duplicates_wait_for_the_first(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(self.checkout, range(self.workers)))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(set(results), {(200, Order.objects.get().id)})
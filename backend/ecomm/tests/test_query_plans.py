@@ -0,0 +1,117 @@
+from datetime import timedelta
+from unittest import skipUnless
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APITestCase
+from catalog.models import Category, Product
+from sales.models import Order
+
+User = get_user_model()
+
+@skipUnless(connection.vendor == "postgresql", "query plans are checked on Postgres")
+class QueryPlanTest(APITestCase):
+    """
+    Runs EXPLAIN on the main query behind each list endpoint and fails on a
+    sequential scan of the table being listed.
+    Sequential scans are disabled for the check (a test-sized table would
+    otherwise always be scanned), so the planner only picks one when no index
+    can serve the filter/ordering at all. Where some other index (e.g. a foreign
+    key's) could serve the query too, the plan must name the composite index.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = Category.objects.bulk_create([Category(name=f"Plan{i}", slug=f"plan{i}") for i in range(10)])
+        Product.objects.bulk_create([
+            Product(
+                category=cls.categories[i % 10], name=f"Plan product {i}", slug=f"plan-product-{i}",
+                price=1 + i % 500, stock=i % 50,
+            )
+            for i in range(3000)
+        ])
+        cls.user = User.objects.create_user(username="planner", password="p")
+        others = [User.objects.create_user(username=f"planner{i}", password="p") for i in range(20)]
+        statuses = ["pending", "paid", "shipped", "completed", "cancelled"]
+        Order.objects.bulk_create([
+            Order(customer=(cls.user if i % 21 == 0 else others[i % 20]).customer, status=statuses[i % 5])
+            for i in range(3000)
+        ])
+        app = Application.objects.create(
+            user=cls.user, name="plan_app", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        cls.token = AccessToken.objects.create(
+            user=cls.user, application=app, token="plan_token",
+            expires=timezone.now() + timedelta(hours=1), scope="read:products read:orders"
+        )
+
+    def setUp(self):
+        # bulk_create skips the catalog cache invalidation signals
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token.token}")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE catalog_product")
+            cursor.execute("ANALYZE sales_order")
+
+    def main_queries(self, url, table):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200, url)
+        queries = [q["sql"] for q in ctx.captured_queries if f'FROM "{table}"' in q["sql"] and "LIMIT" in q["sql"]]
+        self.assertTrue(queries, f"no paged query on {table} for {url}")
+        return queries
+
+    def plans(self, url, table):
+        plans = []
+        for sql in self.main_queries(url, table):
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {sql}")
+                plans.append("\n".join(row[0] for row in cursor.fetchall()))
+                cursor.execute("SET LOCAL enable_seqscan = on")
+        return plans
+
+    def assert_no_seq_scan(self, url, table):
+        for plan in self.plans(url, table):
+            self.assertNotIn(f"Seq Scan on {table}", plan, f"{url}\n{plan}")
+
+    def assert_uses_index(self, url, table, index):
+        for plan in self.plans(url, table):
+            self.assertIn(index, plan, f"{url}\n{plan}")
+
+    def test_product_list_plans(self):
+        category = self.categories[3].id
+        for url in [
+            "/api/products/",
+            "/api/products/?ordering=price",
+            "/api/products/?ordering=-price&page=5",
+            f"/api/products/?category={category}",
+            f"/api/products/?category={category}&stock__gte=10&ordering=price",
+            f"/api/products/?category={category}&stock__gte=10&ordering=-created_at",
+            "/api/products/?ordering=price&cursor=",
+            f"/api/products/?category={category}&ordering=-created_at&cursor=",
+        ]:
+            self.assert_no_seq_scan(url, "catalog_product")
+
+    def test_order_list_plans(self):
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        for url in [
+            "/api/orders/",
+            "/api/orders/?status=paid",
+            f"/api/orders/?status=shipped&created_at__gte={since}",
+            "/api/orders/?ordering=-created_at&cursor=",
+        ]:
+            self.assert_no_seq_scan(url, "sales_order")
+
+    def test_order_lists_use_the_composite_indexes(self):
+        # the customer_id foreign key index alone would also avoid a sequential scan
+        for url, index in [
+            ("/api/orders/", "order_customer_created_idx"),
+            ("/api/orders/?ordering=-created_at&cursor=", "order_customer_created_idx"),
+            ("/api/orders/?status=paid", "order_cust_status_idx"),
+            ("/api/orders/?status=shipped&ordering=-created_at&cursor=", "order_cust_status_idx"),
+        ]:
+            self.assert_uses_index(url, "sales_order", index)
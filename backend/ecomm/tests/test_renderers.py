@@ -0,0 +1,82 @@
+import io
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict
+from catalog.models import Category, Product
+from ecomm.parsers import ORJSONParser
+from ecomm.renderers import ORJSONRenderer
+
+@dataclass
+class Point:
+    x: int
+
+class ORJSONRendererTest(SimpleTestCase):
+    def assertSameBytes(self, data, media_type="application/json", context=None):
+        context = context or {}
+        expected = JSONRenderer().render(data, media_type, dict(context))
+        self.assertEqual(ORJSONRenderer().render(data, media_type, dict(context)), expected)
+
+    def test_values_match_json_renderer(self):
+        for value in [
+            None, True, 0, -7, 2**63 - 1, 1.5, "", "plain", "é€😀     \x00 \x1f \x7f \"\\/",
+            Decimal("19.99"), Decimal("0.000"),
+            datetime(2025, 1, 2, 3, 4, 5), datetime(2025, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc),
+            datetime(2025, 1, 2, 3, 4, 5, 120000, tzinfo=dt_timezone(timedelta(hours=-5))),
+            date(2025, 1, 2), time(3, 4, 5, 678901), timedelta(days=1, seconds=3),
+            uuid.UUID("12345678-1234-5678-1234-567812345678"), gettext_lazy("Not found."), b"bytes",
+            {1: "int key", "k": [1, (2, 3)]}, ReturnDict({"id": 1, "price": "2.00"}, serializer=None),
+        ]:
+            with self.subTest(value=value):
+                self.assertSameBytes({"value": value, "list": [value]})
+
+    def test_fallbacks_match_json_renderer(self):
+        # wider than 64 bits: orjson refuses, JSONRenderer renders it
+        self.assertSameBytes({"big": 2**70})
+        # indented output, as requested by the browsable API
+        self.assertSameBytes({"a": [1, {"b": 2}]}, "application/json; indent=4")
+        self.assertSameBytes({"a": 1}, context={"indent": 2})
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+        with self.assertRaises(TypeError):
+            ORJSONRenderer().render({"point": Point(1)})
+
+class ORJSONParserTest(SimpleTestCase):
+    def parse(self, parser, body):
+        try:
+            return parser.parse(io.BytesIO(body), "application/json", {})
+        except ParseError as exc:
+            return ("error", str(exc.detail))
+
+    def test_bodies_match_json_parser(self):
+        for body in [
+            b'{"product_id": 3, "qty": 2}', b'[1, 2.5, -0, 1e3, "x", null, true]', b'"\\u2028\\ud83d\\ude00"',
+            b'{"a": 1, "a": 2}', b'{"big": 123456789012345678901234567890}', b'"\\ud800"', b'[1e400]',
+            b'{"a": NaN}', b'{"a": 1,}', b'\xef\xbb\xbf{}', b'\xff', b'', b'  {"nested": {"list": [[]]}}  ',
+        ]:
+            with self.subTest(body=body):
+                expected = self.parse(JSONParser(), body)
+                self.assertEqual(self.parse(ORJSONParser(), body), expected)
+                self.assertEqual(type(self.parse(ORJSONParser(), body)), type(expected))
+
+class ORJSONApiTest(TestCase):
+    def test_api_responses_match_json_renderer(self):
+        user = get_user_model().objects.create_user(username="json", password="p")
+        app = Application.objects.create(user=user, name="json", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        token = AccessToken.objects.create(user=user, application=app, token="json",
+            expires=timezone.now() + timedelta(hours=1), scope="read:products")
+        cat = Category.objects.create(name="Json")
+        Product.objects.create(name="Json \u2028 product é", category=cat, price=Decimal("9.90"), stock=1)
+        response = self.client.get("/api/products/", HTTP_ACCEPT="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {token.token}")
+        self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+        self.assertEqual(response.content, JSONRenderer().render(response.data, "application/json", {}))
@@ -0,0 +1,120 @@
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from accounts.authentication import token_cache
+from catalog.cache import entry_timeout, invalidate_catalog_cache
+from catalog.models import Category, Product
+from ecomm.replicas import pin_key, read_alias, wrote
+from sales.models import Order
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    "replica" is a second connection to the test database, so the queries each connection ran
+    show where a request was routed.
+    """
+    databases = {"default", "replica"}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.settings["replica"] = {**connections["default"].settings_dict, "TEST": {"MIRROR": "default"}}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        token_cache.clear()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="replica", password="p")
+        app = Application.objects.create(user=self.user, name="replica", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        AccessToken.objects.create(user=self.user, application=app, token="replica",
+            expires=timezone.now() + timedelta(hours=1),
+            scope="read:products write:products read:orders read:cart write:cart")
+        self.product = Product.objects.create(name="Replicated", category=Category.objects.create(name="R"),
+            price=5, stock=10)
+        self.headers = {"authorization": "Bearer replica"}
+
+    def queries(self, method, url, data=None):
+        """
+        Tables each connection read while serving the request.
+        """
+        with CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections["replica"]) as replica:
+            response = getattr(self.client, method)(url, data, content_type="application/json", headers=self.headers)
+        self.assertLess(response.status_code, 400, response.content)
+        return [query["sql"] for query in primary], [query["sql"] for query in replica]
+
+    def assertReads(self, sql, table):
+        self.assertTrue(any(f'FROM "{table}"' in query for query in sql), sql)
+
+    def assertNoReads(self, sql, table):
+        self.assertFalse(any(f'FROM "{table}"' in query for query in sql), sql)
+
+    def test_catalog_reads_use_replica(self):
+        for url in ["/api/products/", f"/api/products/{self.product.slug}/", "/api/categories/"]:
+            with self.subTest(url=url):
+                invalidate_catalog_cache()
+                primary, replica = self.queries("get", url)
+                table = "catalog_category" if "categories" in url else "catalog_product"
+                self.assertReads(replica, table)
+                self.assertNoReads(primary, table)
+                # the token is always checked against the primary
+                self.assertNoReads(replica, "oauth2_provider_accesstoken")
+
+    def test_reads_stick_to_primary_after_own_write(self):
+        self.queries("post", "/api/cart/add/", {"product_id": self.product.id, "qty": 1})
+        primary, replica = self.queries("post", "/api/cart/checkout/")
+        self.assertEqual(replica, [])
+        self.assertTrue(any("FOR UPDATE" in query for query in primary))
+        primary, replica = self.queries("get", "/api/orders/")
+        self.assertReads(primary, "sales_order")
+        self.assertEqual(replica, [])
+        # once the pin expires, the order history is read from a replica again
+        cache.delete(pin_key(self.user))
+        primary, replica = self.queries("get", "/api/orders/")
+        self.assertReads(replica, "sales_order")
+        self.assertNoReads(primary, "sales_order")
+
+    def test_failed_writes_do_not_pin(self):
+        self.client.post("/api/cart/checkout/", headers=self.headers)
+        self.assertIsNone(cache.get(pin_key(self.user)))
+
+    def test_router(self):
+        # as set up by ReplicaReadMixin for a GET
+        tokens = read_alias.set("replica"), wrote.set(False)
+        self.addCleanup(read_alias.reset, tokens[0])
+        self.addCleanup(wrote.reset, tokens[1])
+        self.assertEqual(Product.objects.all().db, "replica")
+        self.assertEqual(Product.objects.select_for_update().db, DEFAULT_DB_ALIAS)
+        with transaction.atomic():
+            self.assertEqual(Product.objects.all().db, DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate("replica", "catalog"))
+        self.assertTrue(router.allow_relation(Order(), Product()))
+        # a write in the request sends its later reads to the primary
+        self.product.save()
+        self.assertEqual(Product.objects.all().db, DEFAULT_DB_ALIAS)
+
+    @override_settings(DATABASE_REPLICA_PIN_SECONDS=10, CATALOG_CACHE_TIMEOUT=300)
+    def test_replica_reads_cached_briefly_after_catalog_write(self):
+        # a replica may not have the write yet: cache its answer only until the lag window is over
+        self.assertEqual(entry_timeout(time.time() - 1), 10)
+        self.assertEqual(entry_timeout(time.time() - 60), 300)
+        self.assertEqual(entry_timeout(None), 300)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        primary, replica = self.queries("get", "/api/products/")
+        self.assertReads(primary, "catalog_product")
+        self.assertEqual(replica, [])
@@ -0,0 +1,45 @@
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+from catalog.models import Category, Product
+from catalog.serializers import ProductSerializer
+from ecomm.serializers import DynamicFieldsMixin, parse_paths
+
+class ParsePathsTest(TestCase):
+    def test_tree(self):
+        self.assertEqual(parse_paths("a, b.c,b.d,,"), {"a": {}, "b": {"c": {}, "d": {}}})
+        self.assertEqual(parse_paths(""), {})
+
+    def test_selection_at_each_depth(self):
+        tree = parse_paths("id,items.qty,customer")
+        self.assertEqual(DynamicFieldsMixin.selected_names(tree, []), {"id", "items", "customer"})
+        self.assertEqual(DynamicFieldsMixin.selected_names(tree, ["items"]), {"qty"})
+        # a field listed without children renders whole
+        self.assertIsNone(DynamicFieldsMixin.selected_names(tree, ["customer", "user"]))
+        omit = parse_paths("items.product,total")
+        self.assertEqual(DynamicFieldsMixin.omitted_names(omit, []), {"total"})
+        self.assertEqual(DynamicFieldsMixin.omitted_names(omit, ["items"]), {"product"})
+        self.assertEqual(DynamicFieldsMixin.omitted_names(omit, ["customer"]), set())
+
+class DynamicSerializerTest(TestCase):
+    def setUp(self):
+        cat = Category.objects.create(name="Shape")
+        self.product = Product.objects.create(name="Shaped", category=cat, price=3, stock=1)
+
+    def serializer(self, method, query=""):
+        factory = APIRequestFactory()
+        request = Request(getattr(factory, method)(f"/api/products/{query}"))
+        return ProductSerializer(self.product, context={"request": request})
+
+    def test_fields_only_shape_reads(self):
+        self.assertEqual(set(self.serializer("get", "?fields=id,name").data), {"id", "name"})
+        # writes validate against every field
+        self.assertIn("price", self.serializer("post", "?fields=id,name").fields)
+
+    def test_query_shape(self):
+        shape = self.serializer("get", "?fields=id,name,category,images").query_shape()
+        self.assertEqual(shape.only, {"id", "name", "category"})
+        self.assertEqual([prefetch.prefetch_to for prefetch in shape.prefetch], ["images"])
+        shape = self.serializer("get", "?fields=id,category&expand=category").query_shape()
+        self.assertEqual(shape.select, {"category"})
+        self.assertEqual(shape.only, {"id", "category", "category__id", "category__name", "category__slug"})
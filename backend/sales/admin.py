@@ -1,7 +1,10 @@
-from django.contrib import admin
+from collections import Counter
+from django.contrib import admin, messages
+from django.contrib.admin.utils import model_ngettext
 # Register your models here.
 # Register cart models
-from .models import Cart, CartItem, Customer, Order, OrderItem
+from .models import Cart, CartItem, Customer, Order, OrderItem, OutboxEvent
+from .transitions import INVALID, NOT_FOUND, TRANSITIONED, transition_orders
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -9,7 +12,9 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'updated_at')
+    list_display = ('user', 'total', 'created_at', 'updated_at')
+    list_select_related = ('user',)
+    readonly_fields = ('subtotal', 'total')
     inlines = [CartItemInline]
 
 @admin.register(CartItem)
@@ -24,11 +29,41 @@ class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
 
+def transition_action(status, label):
+    """
+    An admin action moving the selected orders to `status` (see sales/transitions.py).
+    """
+    def action(modeladmin, request, queryset):
+        results = transition_orders(list(queryset.values_list('id', flat=True)), status)
+        counts = Counter(result for result, _ in results.values())
+        moved = counts[TRANSITIONED]
+        message = f"{moved} {model_ngettext(modeladmin.opts, moved)} marked as {label.lower()}."
+        skipped = counts[INVALID] + counts[NOT_FOUND]
+        if skipped:
+            message += f" {skipped} could not move to {label.lower()} from their status."
+        modeladmin.message_user(request, message, messages.WARNING if skipped else messages.SUCCESS)
+    action.__name__ = f'mark_{status}'
+    return admin.action(description=f"Mark selected orders as {label.lower()}")(action)
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'customer', 'status', 'created_at', 'updated_at', 'total_amount')
+    list_display = ('id', 'customer', 'status', 'created_at', 'updated_at', 'total')
+    list_filter = ('status',)
+    list_select_related = ('customer__user',)
+    readonly_fields = ('subtotal', 'total')
     inlines = [OrderItemInline]
+    actions = [transition_action(status, label) for status, label in Order.STATUS_CHOICES if Order.sources(status)]
+
+    def get_readonly_fields(self, request, obj=None):
+        # status only moves through the actions, which follow Order.TRANSITIONS
+        return self.readonly_fields + ('status',) if obj is not None else self.readonly_fields
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('order', 'product', 'qty', 'price', 'subtotal')
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'created_at', 'attempts', 'available_at', 'processed_at', 'failed_at')
+    list_filter = ('topic',)
+    readonly_fields = ('created_at', 'completed', 'last_error')
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
+
+    def ready(self):
+        from catalog.models import Product
+        from .reservations import forget_counter
+        post_save.connect(forget_counter, sender=Product)
+        post_delete.connect(forget_counter, sender=Product)
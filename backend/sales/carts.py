@@ -0,0 +1,376 @@
+# sales/carts.py: where CartViewSet keeps cart lines, chosen by settings.CART_STORE
+# - ModelCartStore (the default) keeps them in Cart/CartItem rows; every change is a database write
+# - CacheCartStore keeps each cart as one cache entry and writes it to Cart/CartItem only from time
+#   to time (every CART_FLUSH_INTERVAL seconds, in a background thread) and before checkout, so
+#   browsing users cause no database writes; in a cache-held cart a line's id is its product's id
+# - Checkout always runs against the database rows: the store flushes first, and CartViewSet empties
+#   the rows in the checkout transaction, then the store forgets its copy
+# - Mutations of a cache-held cart take a per-user lock in the cache, so concurrent requests of one
+#   user do not lose each other's changes; it needs a cache shared by all workers (e.g. Redis)
+# - The lock holds a random token and is only released by its holder; it expires after
+#   CART_LOCK_TIMEOUT should the holder die, so checkout and flushes, which may wait on row locks for
+#   longer, keep renewing it from a thread until they are done
+# - The flusher thread closes broken or expired connections around each flush, as a request would, and
+#   requeues carts it could not write, so a database restart only delays their flush
+
+import atexit
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from decimal import Decimal
+from types import SimpleNamespace
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.db.models import Q, aprefetch_related_objects, prefetch_related_objects
+from django.utils.module_loading import import_string
+from catalog.models import Product
+from ecomm.fastread import get_read_plan
+from .models import Cart, CartItem
+from .serializers import CartItemSerializer, CartSerializer
+
+logger = logging.getLogger(__name__)
+
+EMPTY_TOTAL = Decimal('0.00')
+
+
+def get_cart_store(user_id):
+    return import_string(settings.CART_STORE)(user_id)
+
+
+def empty_cart(view):
+    """
+    The representation of a cart that was never written to, which has no row yet.
+    """
+    data = {'id': None, 'items': [], 'total_amount': EMPTY_TOTAL}
+    fields = view.get_serializer().fields
+    return {name: value for name, value in data.items() if name in fields}
+
+
+def upsert_cart(user_id):
+    """
+    The user's cart id, creating the cart on their first write, in one INSERT ... ON CONFLICT.
+    """
+    cart = Cart.objects.bulk_create(
+        [Cart(user_id=user_id)],
+        update_conflicts=True, unique_fields=['user'], update_fields=['updated_at'],
+    )[0]
+    return cart.pk
+
+
+def upsert_lines(cart_id, lines):
+    """
+    Insert or replace the cart's lines for {product_id: (qty, price)} in one statement.
+    """
+    CartItem.objects.bulk_create(
+        [CartItem(cart_id=cart_id, product_id=product_id, qty=qty, price=price)
+         for product_id, (qty, price) in lines.items()],
+        update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['qty', 'price'],
+    )
+
+
+class ModelCartStore:
+    """
+    Cart lines as Cart/CartItem rows. Cart responses render values() rows through a ReadPlan.
+    """
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.cart_id = None
+        self.changed = False
+
+    def get_cart(self):
+        return Cart.objects.filter(user_id=self.user_id)
+
+    def render(self, view):
+        plan = get_read_plan(view, CartSerializer)
+        if plan is None:
+            cart = self.get_cart().first()
+            if cart is None:
+                return empty_cart(view)
+            serializer = view.get_serializer(cart)
+            prefetch_related_objects([cart], *serializer.query_shape().prefetch)
+            return serializer.data
+        # one query for the cart and one for its lines, products joined in
+        rows = list(plan.values(self.get_cart()))
+        return plan.render(rows)[0] if rows else empty_cart(view)
+
+    async def arender(self, view):
+        plan = get_read_plan(view, CartSerializer)
+        if plan is None:
+            cart = await self.get_cart().afirst()
+            if cart is None:
+                return empty_cart(view)
+            serializer = view.get_serializer(cart)
+            await aprefetch_related_objects([cart], *serializer.query_shape().prefetch)
+            return serializer.data
+        rows = [row async for row in plan.values(self.get_cart())]
+        return (await plan.arender(rows))[0] if rows else empty_cart(view)
+
+    def render_lines(self, view, product_ids):
+        if not product_ids:
+            return []
+        lines = CartItem.objects.filter(cart__user_id=self.user_id, product_id__in=product_ids).order_by('id')
+        plan = get_read_plan(view, CartItemSerializer)
+        if plan is None:
+            context = view.get_serializer_context()
+            lines = CartItemSerializer(context=context).query_shape().apply(lines)
+            return CartItemSerializer(lines, many=True, context=context).data
+        return plan.render(list(plan.values(lines)))
+
+    def total(self):
+        total = self.get_cart().values_list('total', flat=True).first()
+        return EMPTY_TOTAL if total is None else total
+
+    @contextmanager
+    def mutation(self):
+        """
+        Apply the changes made inside in one transaction, then refresh the persisted totals.
+        """
+        with transaction.atomic():
+            yield
+            if self.changed:
+                carts = self.get_cart() if self.cart_id is None else Cart.objects.filter(pk=self.cart_id)
+                carts.refresh_totals()
+
+    def quantities(self, product_ids):
+        lines = CartItem.objects.filter(cart__user_id=self.user_id, product_id__in=product_ids)
+        return dict(lines.values_list('product_id', 'qty'))
+
+    def save_lines(self, lines):
+        if self.cart_id is None:
+            self.cart_id = upsert_cart(self.user_id)
+        upsert_lines(self.cart_id, lines)
+        self.changed = True
+
+    def remove(self, item_ids=(), product_ids=()):
+        """
+        Delete the lines with these ids or for these products, returning {line id: product id} of the
+        deleted lines.
+        """
+        lines = CartItem.objects.filter(Q(id__in=item_ids) | Q(product_id__in=product_ids), cart__user_id=self.user_id)
+        removed = dict(lines.order_by('id').values_list('id', 'product_id'))
+        if removed:
+            CartItem.objects.filter(id__in=removed).delete()
+        self.changed = self.changed or bool(removed)
+        return removed
+
+    def locked(self, keep_alive=False):
+        return nullcontext()
+
+    def flush(self):
+        pass
+
+    def discard(self):
+        pass
+
+
+_dirty = set()
+_dirty_lock = threading.Lock()
+_flusher = None
+
+
+def mark_dirty(user_id):
+    """
+    Queue the user's cache-held cart for the next background flush.
+    """
+    global _flusher
+    with _dirty_lock:
+        _dirty.add(user_id)
+        if _flusher is None and settings.CART_FLUSH_INTERVAL:
+            _flusher = threading.Thread(target=_flush_forever, name='cart-flusher', daemon=True)
+            _flusher.start()
+            atexit.register(flush_pending)
+
+
+def flush_pending():
+    """
+    Write every cart changed since the last flush to the database; returns how many were written.
+    """
+    with _dirty_lock:
+        user_ids = sorted(_dirty)
+        _dirty.clear()
+    written = 0
+    for user_id in user_ids:
+        store = CacheCartStore(user_id)
+        try:
+            with store.locked(keep_alive=True):
+                store.flush()
+        except Exception:
+            logger.exception('Could not flush the cart of user %s', user_id)
+            # tried again at the next flush
+            with _dirty_lock:
+                _dirty.add(user_id)
+        else:
+            written += 1
+    return written
+
+
+def _flush_forever():
+    while True:
+        time.sleep(settings.CART_FLUSH_INTERVAL)
+        try:
+            close_old_connections()
+            flush_pending()
+            close_old_connections()
+        except Exception:
+            logger.exception('Cart flush failed')
+
+
+def renew_lock(lock, token, done):
+    """
+    Extend a cart lock every third of CART_LOCK_TIMEOUT until `done` is set or the lock is no longer
+    held with `token`.
+    """
+    cache = caches[settings.CART_CACHE_ALIAS]
+    while not done.wait(settings.CART_LOCK_TIMEOUT / 3):
+        if cache.get(lock) != token or not cache.touch(lock, settings.CART_LOCK_TIMEOUT):
+            return
+
+
+class CacheCartStore:
+    """
+    Cart lines as one {'id': cart pk or None, 'lines': {product_id: (qty, price)}} entry in
+    caches[CART_CACHE_ALIAS], loaded from the database on a miss and written back by flush().
+    """
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.cache = caches[settings.CART_CACHE_ALIAS]
+        self.key = f'cart:{user_id}'
+        self.state = None
+        self.changed = False
+
+    def load(self):
+        state = self.cache.get(self.key)
+        if state is None:
+            cart_id = Cart.objects.filter(user_id=self.user_id).values_list('id', flat=True).first()
+            lines = {}
+            if cart_id is not None:
+                items = CartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'qty', 'price')
+                lines = {product_id: (qty, price) for product_id, qty, price in items}
+            state = {'id': cart_id, 'lines': lines}
+            self.cache.set(self.key, state, settings.CART_CACHE_TIMEOUT)
+        return state
+
+    def current(self):
+        return self.load() if self.state is None else self.state
+
+    def cart_items(self, serializer, lines):
+        """
+        Unsaved CartItems for {product_id: (qty, price)}, with the products `serializer` renders loaded
+        in one query; lines whose product is gone are dropped.
+        """
+        items = [
+            CartItem(id=product_id, product_id=product_id, qty=qty, price=price)
+            for product_id, (qty, price) in sorted(lines.items())
+        ]
+        product_field = serializer.fields.get('product')
+        if product_field is None or not items:
+            return items
+        products = Product.objects.filter(id__in=lines)
+        if hasattr(product_field, 'query_shape'):
+            products = product_field.query_shape().apply(products)
+        products = {product.pk: product for product in products}
+        for item in items:
+            item.product = products.get(item.product_id)
+        return [item for item in items if item.product is not None]
+
+    def render(self, view):
+        state = self.current()
+        serializer = view.get_serializer()
+        items = []
+        if 'items' in serializer.fields:
+            items = self.cart_items(serializer.fields['items'].child, state['lines'])
+        total = sum((qty * price for qty, price in state['lines'].values()), EMPTY_TOTAL)
+        cart = SimpleNamespace(id=state['id'], items=items, total=total)
+        return view.get_serializer(cart).data
+
+    async def arender(self, view):
+        return await sync_to_async(self.render)(view)
+
+    def render_lines(self, view, product_ids):
+        lines = self.current()['lines']
+        serializer = CartItemSerializer(context=view.get_serializer_context())
+        changed = {product_id: lines[product_id] for product_id in product_ids if product_id in lines}
+        items = self.cart_items(serializer, changed)
+        return CartItemSerializer(items, many=True, context=view.get_serializer_context()).data
+
+    def total(self):
+        return sum((qty * price for qty, price in self.current()['lines'].values()), EMPTY_TOTAL)
+
+    @contextmanager
+    def locked(self, keep_alive=False):
+        """
+        Hold the cart's lock. With keep_alive the lock is renewed until the block ends, for blocks that
+        may outlast CART_LOCK_TIMEOUT.
+        """
+        lock, token = f'{self.key}:lock', uuid.uuid4().hex
+        # the lock expires by itself should its holder die
+        while not self.cache.add(lock, token, settings.CART_LOCK_TIMEOUT):
+            time.sleep(0.005)
+        done = threading.Event()
+        if keep_alive:
+            threading.Thread(target=renew_lock, args=(lock, token, done), name='cart-lock', daemon=True).start()
+        try:
+            yield
+        finally:
+            done.set()
+            # had it expired, the lock may be another request's by now
+            if self.cache.get(lock) == token:
+                self.cache.delete(lock)
+
+    @contextmanager
+    def mutation(self):
+        with self.locked():
+            self.state = self.load()
+            yield
+            if self.changed:
+                self.cache.set(self.key, self.state, settings.CART_CACHE_TIMEOUT)
+                mark_dirty(self.user_id)
+
+    def quantities(self, product_ids):
+        lines = self.state['lines']
+        return {product_id: lines[product_id][0] for product_id in product_ids if product_id in lines}
+
+    def save_lines(self, lines):
+        self.state['lines'].update(lines)
+        self.changed = True
+
+    def remove(self, item_ids=(), product_ids=()):
+        lines = self.state['lines']
+        removed = {line_id: line_id for line_id in sorted({*item_ids, *product_ids}) if line_id in lines}
+        for line_id in removed:
+            del lines[line_id]
+        self.changed = self.changed or bool(removed)
+        return removed
+
+    def flush(self):
+        """
+        Make the Cart/CartItem rows match the cached cart. The caller holds the lock.
+        """
+        state = self.cache.get(self.key)
+        if state is None:
+            return
+        lines = state['lines']
+        with transaction.atomic():
+            if state['id'] is None and not lines:
+                return
+            cart_id = upsert_cart(self.user_id)
+            CartItem.objects.filter(cart_id=cart_id).exclude(product_id__in=lines).delete()
+            if lines:
+                # products deleted meanwhile took their lines with them
+                existing = set(Product.objects.filter(id__in=lines).values_list('id', flat=True))
+                upsert_lines(cart_id, {product_id: line for product_id, line in lines.items() if product_id in existing})
+            Cart.objects.filter(pk=cart_id).refresh_totals()
+        if state['id'] is None:
+            state['id'] = cart_id
+            self.cache.set(self.key, state, settings.CART_CACHE_TIMEOUT)
+
+    def discard(self):
+        """
+        Forget the cached lines after checkout emptied the cart's rows.
+        """
+        state = self.cache.get(self.key) or {'id': None}
+        self.cache.set(self.key, {'id': state['id'], 'lines': {}}, settings.CART_CACHE_TIMEOUT)
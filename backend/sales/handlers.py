@@ -0,0 +1,85 @@
+# sales/handlers.py: outbox handlers for order events (see sales/outbox.py, settings.OUTBOX_HANDLERS)
+# - order.placed payloads are {'order_id': ..., 'held': {product_id: qty}}, `held` being the stock holds
+#   checkout turned into the order (see sales/reservations.py); a handler finds nothing to do for a
+#   deleted order
+# - send_order_confirmation emails the customer; the X-Outbox-Event header lets mail pipelines drop the
+#   duplicate a retry may send
+# - record_order_analytics logs the sale to the 'sales.analytics' logger, for whatever LOGGING routes
+#   it to
+# - refresh_product_stock sets Product.stock of the ordered products to the sum of their stock slots
+#   and invalidates their cached catalog responses; checkout already did so once committed, so this
+#   only matters when that refresh failed
+# - adjust_stock_counters then moves the products' available-to-sell counters by what was ordered
+#   beyond the holds
+# - order.status_changed payloads are {'status': ..., 'order_ids': [...]}, one per batch of orders;
+#   record_status_analytics logs them to 'sales.analytics' as one line
+
+import logging
+from django.core.mail import EmailMessage
+from catalog.cache import invalidate_stock
+from catalog.models import Product
+from . import reservations
+from .models import Order, OrderItem
+
+analytics = logging.getLogger('sales.analytics')
+
+
+def get_order(event):
+    return Order.objects.select_related('customer__user').filter(pk=event.payload['order_id']).first()
+
+
+def send_order_confirmation(event):
+    order = get_order(event)
+    if order is None or not order.customer.user.email:
+        return
+    lines = [
+        f'{qty} x {name} at {price}'
+        for name, qty, price in order.items.order_by('id').values_list('product__name', 'qty', 'price')
+    ]
+    body = '\n'.join([f'Thank you for your order #{order.id}.', '', *lines, '', f'Total: {order.total}'])
+    EmailMessage(
+        subject=f'Order #{order.id} confirmed', body=body, to=[order.customer.user.email],
+        headers={'X-Outbox-Event': str(event.pk)},
+    ).send()
+
+
+def record_order_analytics(event):
+    order = get_order(event)
+    if order is None:
+        return
+    analytics.info('order placed', extra={
+        'event_id': event.pk,
+        'order_id': order.id,
+        'customer_id': order.customer_id,
+        'total': str(order.total),
+        'items': list(order.items.order_by('id').values_list('product_id', 'qty')),
+    })
+
+
+def get_ordered(event):
+    """
+    {product_id: qty} of the event's order.
+    """
+    return dict(OrderItem.objects.filter(order_id=event.payload['order_id']).values_list('product_id', 'qty'))
+
+
+def refresh_product_stock(event):
+    product_ids = sorted(get_ordered(event))
+    if not product_ids:
+        return
+    Product.objects.filter(id__in=product_ids).refresh_stock()
+    invalidate_stock(product_ids)
+
+
+def adjust_stock_counters(event):
+    # JSON object keys are strings
+    held = {int(product_id): qty for product_id, qty in event.payload.get('held', {}).items()}
+    reservations.adjust_after_checkout(get_ordered(event), held)
+
+
+def record_status_analytics(event):
+    analytics.info('orders moved to %s', event.payload['status'], extra={
+        'event_id': event.pk,
+        'status': event.payload['status'],
+        'order_ids': event.payload['order_ids'],
+    })
@@ -0,0 +1,412 @@
+import http.client
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from pathlib import Path
+from random import Random
+from statistics import quantiles
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connections
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+from catalog.models import Product
+
+User = get_user_model()
+
+BASELINE_DIR = Path(settings.BASE_DIR) / ".benchmarks"
+SCOPES = " ".join(settings.OAUTH2_PROVIDER["SCOPES"])
+SCENARIOS = [
+    "product_list", "product_search", "product_retrieve",
+    "cart_add", "cart_remove", "checkout", "order_list", "user_detail",
+]
+
+
+# gunicorn command lines for --server; the ASGI one needs uvicorn installed
+SERVERS = {
+    "wsgi": ["ecomm.wsgi:application", "--worker-class", "gthread"],
+    "asgi": ["ecomm.asgi:application", "--worker-class", "uvicorn.workers.UvicornWorker"],
+}
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def process_tree_cpu(pid):
+    """
+    CPU seconds (user + system) used so far by `pid` and its children, from /proc (Linux only).
+    """
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/stat") as stat:
+                # the command name may contain spaces; fields resume after its closing parenthesis
+                fields = stat.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as children:
+                    pending.extend(int(child) for child in children.read().split())
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / CLOCK_TICKS
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Scenarios:
+    """
+    Builds the requests for each scenario. Some scenarios first call `send` (untimed), e.g. to fill
+    the cart before a checkout. Cart additions cycle through a few products so the cart stays small.
+    """
+    def __init__(self, seed, products, search_terms):
+        self.seed = seed
+        self.rng = Random(seed)
+        self.products = products
+        self.product_ids = list(products)
+        self.search_terms = search_terms
+        self.cart_products = self.rng.sample(self.product_ids, min(5, len(self.product_ids)))
+        # the first few list pages, as far as the catalog goes
+        self.pages = max(1, min(5, len(products) // api_settings.PAGE_SIZE))
+
+    def fork(self, worker):
+        # one generator per HTTP worker, so workers never share state
+        return Scenarios(self.seed * 1000 + worker, self.products, self.search_terms)
+
+    def request(self, name, send):
+        rng = self.rng
+        if name == "product_list":
+            return "GET", f"/api/products/?page={rng.randint(1, self.pages)}", None
+        if name == "product_search":
+            return "GET", f"/api/products/?search={rng.choice(self.search_terms)}", None
+        if name == "product_retrieve":
+            return "GET", f"/api/products/{self.products[rng.choice(self.product_ids)]}/", None
+        if name == "cart_add":
+            return "POST", "/api/cart/add/", {"product_id": rng.choice(self.cart_products), "qty": 1}
+        if name == "cart_remove":
+            cart = send("POST", "/api/cart/add/", {"product_id": rng.choice(self.cart_products), "qty": 1})
+            return "POST", "/api/cart/remove/", {"item_id": cart["items"][0]["id"]}
+        if name == "checkout":
+            send("POST", "/api/cart/add/", {"product_id": rng.choice(self.product_ids), "qty": 1})
+            return "POST", "/api/cart/checkout/", None
+        if name == "order_list":
+            return "GET", "/api/orders/", None
+        if name == "user_detail":
+            return "GET", "/accounts/user/", None
+        raise CommandError(f"Unknown scenario {name}")
+
+
+def summarize(timings, errors, queries, elapsed, cpu_seconds=None):
+    timings = sorted(timings)
+    cuts = quantiles(timings, n=100, method="inclusive") if len(timings) > 1 else timings * 99
+    result = {
+        "requests": len(timings),
+        "errors": errors,
+        "p50_ms": round(cuts[49], 2),
+        "p95_ms": round(cuts[94], 2),
+        "p99_ms": round(cuts[98], 2),
+        "rps": round(len(timings) / elapsed, 1) if elapsed else 0,
+    }
+    if queries is not None:
+        result["queries_per_request"] = round(sum(queries) / len(queries), 2)
+    if cpu_seconds:
+        # requests per second for each core the server kept fully busy
+        result["rps_per_core"] = round(len(timings) / cpu_seconds, 1)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency, throughput and queries per request of the main API endpoints on the current data, "
+        "in-process (Django test client) or over HTTP with concurrent workers; --reseed first replaces the data "
+        "with a known dataset"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=["client", "http"], default="client")
+        parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+        parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+        parser.add_argument("--concurrency", type=int, default=8, help="HTTP workers (http mode)")
+        parser.add_argument("--url", help="benchmark an already running server instead of starting one (http mode)")
+        parser.add_argument(
+            "--server", choices=list(SERVERS),
+            help="http mode: run the API under gunicorn as a WSGI (gthread) or ASGI (uvicorn) server "
+            "and report requests per second per core of server CPU",
+        )
+        parser.add_argument("--server-workers", type=int, default=1, help="gunicorn worker processes (--server)")
+        parser.add_argument("--server-threads", type=int, default=8, help="threads per WSGI worker (--server wsgi)")
+        parser.add_argument(
+            "--reseed", action="store_true",
+            help="wipe the database and seed a known dataset through seed_data first (dev databases only)",
+        )
+        parser.add_argument("--products", type=int, default=10_000)
+        parser.add_argument("--customers", type=int, default=1_000)
+        parser.add_argument("--orders", type=int, default=20_000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--save", metavar="NAME", help=f"store the results as a baseline in {BASELINE_DIR}")
+        parser.add_argument("--compare", metavar="NAME", help="compare the results with a stored baseline")
+        parser.add_argument(
+            "--max-regression", type=float, default=None, metavar="PCT",
+            help="with --compare, fail when a p95 grows by more than PCT percent or queries per request grow",
+        )
+
+    def handle(self, *args, **options):
+        if options["reseed"]:
+            call_command(
+                "seed_data", products=options["products"], customers=options["customers"],
+                orders=options["orders"], seed=options["seed"], stdout=self.stdout,
+            )
+        products = dict(Product.objects.order_by("id").values_list("id", "slug"))
+        if not products:
+            raise CommandError("No products to benchmark; run seed_data or pass --reseed")
+        sample = Random(options["seed"]).sample(list(products), min(50, len(products)))
+        names = Product.objects.filter(id__in=sample).values_list("name", flat=True)
+        search_terms = [name.split()[0] for name in names]
+        scenarios = Scenarios(options["seed"], products, search_terms)
+
+        workers = options["concurrency"] if options["mode"] == "http" else 1
+        application, tokens = self.create_tokens(workers)
+        try:
+            if options["mode"] == "client":
+                results = self.run_client(scenarios, tokens[0], options)
+            else:
+                results = self.run_http(scenarios, tokens, options)
+        finally:
+            # deleting the application cascades to its tokens
+            application.delete()
+
+        report = {
+            "meta": {
+                "mode": options["mode"],
+                "server": options["server"] if options["mode"] == "http" else None,
+                "concurrency": workers,
+                "requests": options["requests"],
+                "dataset": {key: options[key] for key in ("products", "customers", "orders", "seed")},
+                "created": timezone.now().isoformat(),
+            },
+            "scenarios": results,
+        }
+        self.print_report(results)
+        if options["save"]:
+            BASELINE_DIR.mkdir(exist_ok=True)
+            path = BASELINE_DIR / f"{options['save']}.json"
+            path.write_text(json.dumps(report, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {path}"))
+        if options["compare"]:
+            self.compare(report, options["compare"], options["max_regression"])
+
+    def create_tokens(self, count):
+        """
+        One bearer token per worker, each for a different seeded customer so carts do not contend.
+        """
+        # customers with the most orders first, so the order list has something to render
+        users = list(
+            User.objects.filter(customer__isnull=False)
+            .annotate(order_count=Count("customer__orders")).order_by("-order_count", "id")[:count]
+        )
+        if len(users) < count:
+            raise CommandError(f"Need {count} customers for the benchmark, found {len(users)}")
+        application = Application.objects.create(
+            user=users[0], name=f"bench-api-{secrets.token_hex(4)}", client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_CLIENT_CREDENTIALS,
+        )
+        expires = timezone.now() + timedelta(hours=1)
+        tokens = AccessToken.objects.bulk_create([
+            AccessToken(user=user, application=application, token=secrets.token_urlsafe(30), expires=expires, scope=SCOPES)
+            for user in users
+        ])
+        return application, [token.token for token in tokens]
+
+    def run_client(self, scenarios, token, options):
+        client = APIClient(HTTP_HOST="localhost")
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        def send(method, path, body):
+            response = client.generic(method, path, json.dumps(body) if body else "", content_type="application/json")
+            if response.status_code >= 400:
+                raise CommandError(f"{method} {path} failed with {response.status_code}: {response.content[:200]}")
+            return response.json()
+
+        results = {}
+        for name in options["scenarios"]:
+            for _ in range(options["warmup"]):
+                send(*scenarios.request(name, send))
+            timings, queries, errors = [], [], 0
+            started = time.perf_counter()
+            for _ in range(options["requests"]):
+                method, path, body = scenarios.request(name, send)
+                data = json.dumps(body) if body else ""
+                with ExitStack() as stack:
+                    # read replicas included (ecomm/replicas.py)
+                    captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                    start = time.perf_counter()
+                    response = client.generic(method, path, data, content_type="application/json")
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(sum(len(ctx.captured_queries) for ctx in captured))
+                errors += response.status_code >= 400
+            results[name] = summarize(timings, errors, queries, time.perf_counter() - started)
+        return results
+
+    def run_http(self, scenarios, tokens, options):
+        server = process = None
+        if options["url"]:
+            target = urlsplit(options["url"])
+            host, port = target.hostname, target.port or 80
+        elif options["server"]:
+            process, port = self.start_server(options)
+            host = "localhost"
+        else:
+            # same approach as LiveServerTestCase: a threaded WSGI server on a free port
+            server = ThreadedWSGIServer(("localhost", 0), QuietRequestHandler, allow_reuse_address=False)
+            server.set_app(get_internal_wsgi_application())
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            host, port = "localhost", server.server_address[1]
+        lock = threading.Lock()
+
+        def worker(scenarios, token, name, count, timings, state):
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+            def send(method, path, body):
+                conn.request(method, path, json.dumps(body) if body else None, headers)
+                response = conn.getresponse()
+                payload = response.read()
+                if response.status >= 400:
+                    raise CommandError(f"{method} {path} failed with {response.status}: {payload[:200]}")
+                return json.loads(payload)
+
+            for _ in range(count):
+                method, path, body = scenarios.request(name, send)
+                start = time.perf_counter()
+                conn.request(method, path, json.dumps(body) if body else None, headers)
+                response = conn.getresponse()
+                response.read()
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    timings.append(elapsed)
+                    state["errors"] += response.status >= 400
+            conn.close()
+
+        forks = [scenarios.fork(i) for i in range(len(tokens))]
+
+        def run(name, total, timings, state):
+            threads = [
+                threading.Thread(target=worker, args=(
+                    forks[i], token, name, total // len(tokens) + (i < total % len(tokens)), timings, state,
+                ))
+                for i, token in enumerate(tokens)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        results = {}
+        try:
+            for name in options["scenarios"]:
+                run(name, options["warmup"], [], {"errors": 0})
+                timings, state = [], {"errors": 0}
+                cpu = process_tree_cpu(process.pid) if process else None
+                started = time.perf_counter()
+                run(name, options["requests"], timings, state)
+                elapsed = time.perf_counter() - started
+                if process:
+                    cpu = process_tree_cpu(process.pid) - cpu
+                results[name] = summarize(timings, state["errors"], None, elapsed, cpu)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+        return results
+
+    def start_server(self, options):
+        """
+        gunicorn serving this project on a free port, in a child process so its CPU time can be measured.
+        """
+        with socket.socket() as probe:
+            probe.bind(("localhost", 0))
+            port = probe.getsockname()[1]
+        command = [
+            sys.executable, "-m", "gunicorn", *SERVERS[options["server"]],
+            "--bind", f"localhost:{port}", "--workers", str(options["server_workers"]), "--log-level", "warning",
+        ]
+        if options["server"] == "wsgi":
+            command += ["--threads", str(options["server_threads"])]
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR)
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise CommandError(f"{options['server']} server exited with {process.returncode}")
+            try:
+                socket.create_connection(("localhost", port), timeout=1).close()
+                return process, port
+            except OSError:
+                if time.monotonic() > deadline:
+                    process.terminate()
+                    raise CommandError(f"{options['server']} server did not start")
+                time.sleep(0.1)
+
+    def print_report(self, results):
+        self.stdout.write(self.style.NOTICE(
+            f"{'scenario':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'req/s/core':>11}{'queries':>9}{'errors':>8}"
+        ))
+        for name, row in results.items():
+            queries = row.get("queries_per_request", "-")
+            per_core = row.get("rps_per_core", "-")
+            self.stdout.write(
+                f"{name:<18}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                f"{row['rps']:>9.1f}{per_core:>11}{queries:>9}{row['errors']:>8}"
+            )
+
+    def compare(self, report, name, max_regression):
+        path = BASELINE_DIR / f"{name}.json"
+        if not path.exists():
+            raise CommandError(f"No baseline at {path}")
+        baseline = json.loads(path.read_text())
+        if baseline["meta"]["mode"] != report["meta"]["mode"]:
+            raise CommandError(f"Baseline {name} was recorded in {baseline['meta']['mode']} mode")
+        self.stdout.write(self.style.NOTICE(f"Compared with {name} ({baseline['meta']['created']})"))
+        self.stdout.write(f"{'scenario':<18}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'queries':>9}")
+        regressions = []
+        for scenario, row in report["scenarios"].items():
+            base = baseline["scenarios"].get(scenario)
+            if base is None:
+                continue
+
+            def delta(key):
+                return (row[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+
+            queries = "-"
+            if "queries_per_request" in row and "queries_per_request" in base:
+                diff = row["queries_per_request"] - base["queries_per_request"]
+                queries = f"{diff:+.2f}"
+                if max_regression is not None and diff > 0:
+                    regressions.append(f"{scenario}: {diff:+.2f} queries per request")
+            self.stdout.write(
+                f"{scenario:<18}{delta('p50_ms'):>+8.1f}%{delta('p95_ms'):>+8.1f}%{delta('p99_ms'):>+8.1f}%"
+                f"{delta('rps'):>+8.1f}%{queries:>9}"
+            )
+            if max_regression is not None and delta("p95_ms") > max_regression:
+                regressions.append(f"{scenario}: p95 {delta('p95_ms'):+.1f}%")
+        if regressions:
+            raise CommandError("Regressions against baseline:\n  " + "\n  ".join(regressions))
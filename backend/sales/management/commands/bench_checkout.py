@@ -0,0 +1,102 @@
+import secrets
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APIClient
+from catalog.models import Category, Product
+from .bench_api import summarize
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure checkout throughput on one hot product with concurrent in-process workers, with a single "
+        "stock counter per product and with STOCK_SLOTS of them (see catalog/inventory.py); "
+        "the generated users, orders and product are deleted afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", nargs="+", type=int, default=[1, 8, 32])
+        parser.add_argument("--slots", nargs="+", type=int, default=None,
+                            help="stock slot counts to compare (default: 1 and STOCK_SLOTS)")
+        parser.add_argument("--checkouts", type=int, default=25, help="measured checkouts per worker")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("bench_checkout needs Postgres")
+        slot_counts = options["slots"] or sorted({1, settings.STOCK_SLOTS})
+        tag = f"bench-checkout-{secrets.token_hex(4)}"
+        category = Category.objects.create(name=tag)
+        product = Product.objects.create(name=tag, category=category, price=1, stock=0)
+        users = []
+        try:
+            users, tokens = self.create_shoppers(tag, max(options["workers"]))
+            self.stdout.write(self.style.NOTICE(
+                f"{'slots':>6}{'workers':>9}{'checkouts/s':>13}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}"
+            ))
+            for slots in slot_counts:
+                for workers in options["workers"]:
+                    with override_settings(STOCK_SLOTS=slots):
+                        # every checkout buys one unit; more than enough for all of them
+                        product.stock = workers * options["checkouts"] * 10
+                        product.save()
+                    row = self.run(product.id, tokens[:workers], options["checkouts"])
+                    self.stdout.write(
+                        f"{slots:>6}{workers:>9}{row['rps']:>13.1f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+                        f"{row['errors']:>8}"
+                    )
+        finally:
+            # users take their customers, carts and orders with them
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            category.delete()
+
+    def create_shoppers(self, tag, count):
+        users = [User.objects.create_user(username=f"{tag}-{i}") for i in range(count)]
+        application = Application.objects.create(
+            user=users[0], name=tag, client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_CLIENT_CREDENTIALS,
+        )
+        expires = timezone.now() + timedelta(hours=1)
+        tokens = AccessToken.objects.bulk_create([
+            AccessToken(user=user, application=application, token=secrets.token_urlsafe(30), expires=expires,
+                        scope="read:cart write:cart")
+            for user in users
+        ])
+        return users, [token.token for token in tokens]
+
+    def run(self, product_id, tokens, checkouts):
+        timings, state, lock = [], {"errors": 0}, threading.Lock()
+        start_line = threading.Barrier(len(tokens))
+
+        def worker(token):
+            client = APIClient(HTTP_HOST="localhost")
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            try:
+                start_line.wait()
+                for _ in range(checkouts):
+                    # filling the cart is not timed
+                    client.post("/api/cart/add/", {"product_id": product_id, "qty": 1}, format="json")
+                    start = time.perf_counter()
+                    response = client.post("/api/cart/checkout/", format="json")
+                    elapsed = (time.perf_counter() - start) * 1000
+                    with lock:
+                        timings.append(elapsed)
+                        state["errors"] += response.status_code != 200
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(token,)) for token in tokens]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(timings, state["errors"], None, time.perf_counter() - started)
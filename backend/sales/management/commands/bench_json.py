@@ -0,0 +1,65 @@
+import io
+from django.core.management.base import CommandError
+from django.db import transaction
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory
+from catalog.models import Product
+from catalog.serializers import ProductSerializer
+from ecomm.parsers import ORJSONParser
+from ecomm.renderers import ORJSONRenderer
+from sales.models import Order
+from sales.serializers import OrderSerializer
+from .bench_serializers import Command as BenchSerializersCommand
+
+# name -> (serializer class, model, path)
+PAYLOADS = {
+    "products": (ProductSerializer, Product, "/api/products/"),
+    "orders": (OrderSerializer, Order, "/api/orders/"),
+}
+
+
+class Command(BenchSerializersCommand):
+    help = (
+        "Render and parse typical /api/products/ and /api/orders/ payloads with DRF's JSONRenderer/JSONParser "
+        "and with the orjson-backed ORJSONRenderer/ORJSONParser (data is created in a transaction and rolled back)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--objects", type=int, default=1_000, help="objects in the large payloads")
+        parser.add_argument("--repeat", type=int, default=20, help="runs per case; the fastest is reported")
+
+    def handle(self, *args, **options):
+        count = options["objects"]
+        if count < 1:
+            raise CommandError("--objects must be positive")
+        with transaction.atomic():
+            ids = self.create_objects(count)
+            self.stdout.write(self.style.NOTICE(
+                f"{'payload':<22}{'KiB':>9}{'json render':>13}{'orjson':>9}{'json parse':>12}{'orjson':>9}  (ms)"
+            ))
+            for name, (serializer_class, model, path) in PAYLOADS.items():
+                request = Request(APIRequestFactory().get(path))
+                queryset = model._default_manager.filter(id__in=ids[model]).order_by("id")
+                shape = serializer_class(context={"request": request}).query_shape()
+                results = serializer_class(list(shape.apply(queryset)), many=True, context={"request": request}).data
+                for label, rows in ((f"{name} page", results[:api_settings.PAGE_SIZE]), (f"{name} x{count}", results)):
+                    self.bench(label, {"count": len(results), "next": None, "previous": None, "results": rows}, options["repeat"])
+            transaction.set_rollback(True)
+
+    def bench(self, label, data, repeat):
+        context = {"indent": None}
+        json_render, body = self.measure(repeat, lambda: JSONRenderer().render(data, "application/json", context))
+        orjson_render, fast_body = self.measure(repeat, lambda: ORJSONRenderer().render(data, "application/json", context))
+        if body != fast_body:
+            raise CommandError(f"{label}: ORJSONRenderer output differs from JSONRenderer")
+        json_parse, parsed = self.measure(repeat, lambda: JSONParser().parse(io.BytesIO(body)))
+        orjson_parse, fast_parsed = self.measure(repeat, lambda: ORJSONParser().parse(io.BytesIO(body)))
+        if parsed != fast_parsed:
+            raise CommandError(f"{label}: ORJSONParser result differs from JSONParser")
+        self.stdout.write(
+            f"{label:<22}{len(body) / 1024:>9.1f}{json_render * 1_000:>13.3f}{orjson_render * 1_000:>9.3f}"
+            f"{json_parse * 1_000:>12.3f}{orjson_parse * 1_000:>9.3f}"
+        )
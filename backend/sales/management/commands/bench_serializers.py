@@ -0,0 +1,113 @@
+import json
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from catalog.models import Category, Product, ProductImage, ProductSpecification
+from catalog.serializers import CategorySerializer, ProductSerializer
+from ecomm.fastread import ReadPlan
+from sales.models import Order, OrderItem
+from sales.serializers import OrderSerializer
+
+User = get_user_model()
+
+# name -> (serializer class, query string, model)
+CASES = {
+    "categories": (CategorySerializer, "", Category),
+    "products": (ProductSerializer, "", Product),
+    "products_expanded": (ProductSerializer, "?expand=category", Product),
+    "orders": (OrderSerializer, "", Order),
+    "orders_expanded": (OrderSerializer, "?expand=product", Order),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the same objects through the DRF serializers and through ecomm.fastread ReadPlans "
+        "and report milliseconds per 1,000 objects (data is created in a transaction and rolled back)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--objects", type=int, default=1_000, help="objects rendered per case")
+        parser.add_argument("--repeat", type=int, default=5, help="runs per case; the fastest is reported")
+        parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+
+    def handle(self, *args, **options):
+        count = options["objects"]
+        if count < 1:
+            raise CommandError("--objects must be positive")
+        with transaction.atomic():
+            ids = self.create_objects(count)
+            self.stdout.write(self.style.NOTICE(
+                f"{'case':<20}{'serializer ms/1k':>18}{'plan ms/1k':>12}{'speedup':>9}"
+            ))
+            for name in options["cases"]:
+                serializer_class, query, model = CASES[name]
+                queryset = model._default_manager.filter(id__in=ids[model]).order_by("id")
+                request = Request(APIRequestFactory().get(f"/bench/{query}"))
+                slow, slow_data = self.measure(options["repeat"], lambda: self.serialize(serializer_class, queryset, request))
+                # views compile a plan once per shape and cache it
+                plan = ReadPlan(serializer_class(context={"request": request}))
+                fast, fast_data = self.measure(options["repeat"], lambda: plan.render(list(plan.values(queryset))))
+                if json.dumps(slow_data, default=str) != json.dumps(fast_data, default=str):
+                    raise CommandError(f"{name}: the ReadPlan output differs from the serializer")
+                scale = 1_000 / count
+                self.stdout.write(
+                    f"{name:<20}{slow * scale * 1_000:>18.2f}{fast * scale * 1_000:>12.2f}{slow / fast:>8.1f}x"
+                )
+            transaction.set_rollback(True)
+
+    def create_objects(self, count):
+        """
+        `count` categories, products (two images, two specifications) and orders (three lines).
+        """
+        categories = Category.objects.bulk_create(
+            Category(name=f"Bench category {i}", slug=f"bench-category-{i}") for i in range(count)
+        )
+        products = Product.objects.bulk_create(
+            Product(
+                category=categories[i], name=f"Bench product {i}", slug=f"bench-product-{i}",
+                description="Benchmark product " * 10, price=f"{i % 500}.99", stock=i % 50,
+            )
+            for i in range(count)
+        )
+        ProductImage.objects.bulk_create(
+            ProductImage(product=product, url=f"https://example.com/{product.slug}/{j}.jpg")
+            for product in products for j in range(2)
+        )
+        ProductSpecification.objects.bulk_create(
+            ProductSpecification(product=product, name=name, value=f"{product.id}")
+            for product in products for name in ("weight", "colour")
+        )
+        user = User.objects.create_user(username=f"bench-serializers-{time.time_ns()}")
+        orders = Order.objects.bulk_create(
+            Order(customer=user.customer, status="paid", subtotal=3, total=3) for _ in range(count)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=products[(i + j) % count], qty=1, price=1)
+            for i, order in enumerate(orders) for j in range(3)
+        )
+        return {
+            Category: [category.id for category in categories],
+            Product: [product.id for product in products],
+            Order: [order.id for order in orders],
+        }
+
+    @staticmethod
+    def measure(repeat, run):
+        best, data = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, data
+
+    @staticmethod
+    def serialize(serializer_class, queryset, request):
+        # what the views do without a plan: shape the queryset, then serialize instances
+        context = {"request": request}
+        shape = serializer_class(context=context).query_shape()
+        return serializer_class(list(shape.apply(queryset)), many=True, context=context).data
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from sales.outbox import drain, purge
+
+
+class Command(BaseCommand):
+    help = (
+        "Handle the queued outbox events (see sales/outbox.py) in batches and delete old processed ones; "
+        "with --every, keep polling"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--every", type=float, default=0, help="seconds between polls; 0 drains once")
+        parser.add_argument("--batch-size", type=int, default=None, help="events claimed at a time (OUTBOX_BATCH_SIZE)")
+        parser.add_argument("--keep-days", type=float, default=7, help="days processed events are kept")
+
+    def handle(self, *args, **options):
+        every = options["every"]
+        if every < 0:
+            raise CommandError("--every must not be negative")
+        while True:
+            processed, failed = drain(options["batch_size"])
+            deleted = purge(options["keep_days"])
+            self.stdout.write(f"processed {processed} events, {failed} failed, deleted {deleted} old events")
+            if not every:
+                return
+            time.sleep(every)
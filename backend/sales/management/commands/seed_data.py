@@ -1,9 +1,13 @@
+import time
+from random import Random
+from django.contrib.auth.hashers import make_password
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 from faker import Faker
-from catalog.models import Category, Product, ProductSpecification, ProductImage
+from catalog.cache import invalidate_catalog_cache
+from catalog.models import Category, Product, ProductSpecification, ProductImage, StockSlot
 from django.contrib.auth import get_user_model
-from sales.models import Customer, Order, OrderItem, Cart, CartItem
-from random import randint, uniform, choice, sample
+from sales.models import Customer, Order, OrderItem, Cart, CartItem, OutboxEvent, StockHold
 from django.utils.text import slugify
 
 fake = Faker()
@@ -14,118 +18,184 @@ SPEC_NAMES = [
     "Color", "Weight", "Dimensions", "Material", "Manufacturer",
     "Model Number", "Battery Life", "Warranty", "Connectivity", "Display Size"
 ]
+STATUS_CHOICES = ["pending", "paid", "shipped", "completed", "cancelled"]
 
-def random_image_url():
-    return f"https://picsum.photos/seed/{randint(1, 1000)}/400/300"
+def random_image_url(rng):
+    return f"https://picsum.photos/seed/{rng.randint(1, 1000)}/400/300"
+
+def batches(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
 
 class Command(BaseCommand):
     help = "Seed the database with fake categories, products, customers, orders, and order items"
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=6)
+        parser.add_argument("--products", type=int, default=500)
+        parser.add_argument("--customers", type=int, default=25)
+        parser.add_argument("--orders", type=int, default=40)
+        parser.add_argument("--seed", type=int, default=None, help="seed for reproducible data")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = Random(options["seed"])
+        fake.seed_instance(options["seed"])
+        fake.unique.clear()
+        self.batch_size = options["batch_size"]
         self.stdout.write(self.style.NOTICE("Seeding database..."))
+        started = time.perf_counter()
+
+        self.clear()
+        with transaction.atomic():
+            categories = self.timed("categories", lambda: self.seed_categories(options["categories"]))
+            product_ids = self.timed("products", lambda: self.seed_products(options["products"], categories))
+            customer_ids = self.timed("customers", lambda: self.seed_customers(options["customers"]))
+            self.timed("orders", lambda: self.seed_orders(options["orders"], customer_ids, product_ids))
+        # bulk inserts skip the catalog save signals
+        invalidate_catalog_cache()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Seeding complete in {elapsed:.1f}s!"))
+
+    def timed(self, label, seed):
+        started = time.perf_counter()
+        result, rows = seed()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"  {label}: {rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        return result
+
+    def clear(self):
+        # Clear old data (for dev only). Ids are not reused: carts, stock counters, idempotent responses
+        # and the like are cached by user/product id and outlive the rows, so new rows get new ids.
+        # Queued outbox events name orders by id without a FK, so they go too.
+        models = [
+            CartItem, Cart, StockHold, OrderItem, Order, OutboxEvent, Customer,
+            ProductSpecification, ProductImage, StockSlot, Product, Category, User,
+        ]
+        if connection.vendor == "postgresql":
+            # TRUNCATE avoids loading every row for cascades/signals; CASCADE also clears tokens of deleted users
+            tables = ", ".join(connection.ops.quote_name(model._meta.db_table) for model in models)
+            with connection.cursor() as cursor:
+                # TRUNCATE refuses tables with deferred FK checks still pending in the current transaction;
+                # Django's FKs are all INITIALLY DEFERRED, so switching back restores the default
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                cursor.execute(f"TRUNCATE {tables} CASCADE")
+                cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+            return
+        for model in models:
+            model.objects.all().delete()
 
-        # Clear old data (for dev only)
-        OrderItem.objects.all().delete()
-        Order.objects.all().delete()
-        Customer.objects.all().delete()
-        Product.objects.all().delete()
-        ProductSpecification.objects.all().delete()
-        Category.objects.all().delete()
-        ProductImage.objects.all().delete()
-        # Clear cart data
-        CartItem.objects.all().delete()
-        Cart.objects.all().delete()
-        # Clear old auth users
-        User.objects.all().delete()
-
-        # Create Categories
+    def seed_categories(self, count):
         categories = []
-        for _ in range(6):
+        for _ in range(count):
             name = fake.unique.word().capitalize()
-            cat = Category.objects.create(
-                name=name,
-                slug=slugify(name),
-            )
-            categories.append(cat)
+            categories.append(Category(name=name, slug=slugify(name)))
+        return Category.objects.bulk_create(categories), count
+
+    def seed_products(self, count, categories):
+        product_ids, rows = [], 0
+        for start, size in batches(count, self.batch_size):
+            products = []
+            for i in range(start, start + size):
+                # Generate a random product name; the index keeps slugs unique at any scale
+                name = fake.sentence(nb_words=3).replace(".", "")
+                products.append(Product(
+                    name=name,
+                    slug=f"{slugify(name)}-{i}",
+                    description=fake.paragraph(),
+                    price=round(self.rng.uniform(20, 3000), 2),
+                    stock=self.rng.randint(10, 250),
+                    category=self.rng.choice(categories),
+                ))
+            Product.objects.bulk_create(products, batch_size=self.batch_size)
+            specs, images = [], []
+            for product in products:
+                # Seed product specifications
+                for key in self.rng.sample(SPEC_NAMES, self.rng.randint(3, 6)):
+                    specs.append(ProductSpecification(product=product, name=key, value=fake.word().capitalize()))
+                # Seed product images
+                for _ in range(3):
+                    images.append(ProductImage(product=product, url=random_image_url(self.rng)))
+            ProductSpecification.objects.bulk_create(specs, batch_size=self.batch_size)
+            ProductImage.objects.bulk_create(images, batch_size=self.batch_size)
+            product_ids.extend(product.id for product in products)
+            rows += len(products) + len(specs) + len(images)
+        return product_ids, rows
+
+    def seed_customers(self, count):
+        # Hash each password once; PBKDF2 per user would dominate large seeds
+        admin_password = make_password("testpassword")
+        password = make_password("password")
 
         # Create test users
-        User.objects.create_superuser(username='testadmin', email='testadmin@example.com', password='testpassword')
-        User.objects.create_superuser(username='testcustomer', email='testcustomer@example.com', password='testpassword')
-
-        # Create Products
-        products = []
-        for _ in range(500):
-            # Generate a random product name
-            name = fake.unique.sentence(nb_words=3).replace(".", "")
-            product = Product.objects.create(
-                name=name,
-                slug=slugify(name),
-                description=fake.paragraph(),
-                price=round(uniform(20, 3000), 2),
-                stock=randint(10, 250),
-                category=choice(categories),
-            )
-            products.append(product)
-            # Seed product specifications
-            num_specs = randint(3, 6)
-            spec_keys = sample(SPEC_NAMES, num_specs)
-            for key in spec_keys:
-                value = fake.word().capitalize()
-                ProductSpecification.objects.create(product=product, name=key, value=value)
-            # Seed product images
-            for _ in range(3):
-                ProductImage.objects.create(product=product, url=random_image_url())
+        admins = User.objects.bulk_create([
+            User(username=username, email=f"{username}@example.com", password=admin_password,
+                 is_staff=True, is_superuser=True)
+            for username in ("testadmin", "testcustomer")
+        ])
+        Customer.objects.bulk_create([Customer(user=user) for user in admins])
 
         # Create Users and associated Customers
-        customers = []
-        for _ in range(25):
-            first_name = fake.first_name()
-            last_name = fake.last_name()
-            email = fake.unique.email()
-            username = slugify(email.split('@')[0]) + str(randint(100, 999))
-            user = User.objects.create_user(
-                username=username,
-                email=email,
-                password='password',
-                first_name=first_name,
-                last_name=last_name,
-            )
-            # Populate customer profile
-            customer = Customer.objects.get(user=user)
-            customer.phone = fake.phone_number()[:20]
-            customer.street_address = fake.street_address()
-            customer.city = fake.city()
-            customer.state = fake.state()
-            customer.postal_code = fake.postcode()
-            customer.country = fake.country()
-            customer.save()
-            customers.append(customer)
-        # Promote random customers to admin
-        for cust in sample(customers, 5):
-            u = cust.user
-            u.is_staff = True
-            u.is_superuser = True
-            u.save()
-
-        # Create Orders and OrderItems
-        status_choices = ["pending", "paid", "shipped", "completed", "cancelled"]
-        for _ in range(40):
-            customer = choice(customers)
-            order = Order.objects.create(
-                customer=customer,
-                status=choice(status_choices),
-            )
-
-            # For each order, create 1-5 order items
-            num_items = randint(1, 5)
-            order_products = fake.random_elements(elements=products, length=num_items, unique=True)
-            for product in order_products:
-                qty = randint(1, 4)
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    qty=qty,
-                    price=product.price,
+        customer_ids, rows = [], len(admins) * 2
+        for start, size in batches(count, self.batch_size):
+            users = []
+            for i in range(start, start + size):
+                local, domain = fake.email().split("@")
+                users.append(User(
+                    username=f"{slugify(local)}{i}",
+                    email=f"{local}{i}@{domain}",
+                    password=password,
+                    first_name=fake.first_name(),
+                    last_name=fake.last_name(),
+                ))
+            User.objects.bulk_create(users, batch_size=self.batch_size)
+            # Populate customer profile (bulk_create skips the post_save hook that normally creates it)
+            customers = Customer.objects.bulk_create([
+                Customer(
+                    user=user,
+                    phone=fake.phone_number()[:20],
+                    street_address=fake.street_address(),
+                    city=fake.city(),
+                    state=fake.state(),
+                    postal_code=fake.postcode(),
+                    country=fake.country(),
                 )
+                for user in users
+            ], batch_size=self.batch_size)
+            customer_ids.extend(customer.id for customer in customers)
+            rows += len(users) + len(customers)
+
+        # Promote random customers to admin
+        promoted = self.rng.sample(customer_ids, min(5, len(customer_ids)))
+        User.objects.filter(customer__id__in=promoted).update(is_staff=True, is_superuser=True)
+        return customer_ids, rows
 
-        self.stdout.write(self.style.SUCCESS("Seeding complete!"))
\ No newline at end of file
+    def seed_orders(self, count, customer_ids, product_ids):
+        rows = 0
+        if not customer_ids or not product_ids:
+            return None, rows
+        prices = dict(Product.objects.values_list("id", "price"))
+        for start, size in batches(count, self.batch_size):
+            orders, lines = [], []
+            for _ in range(size):
+                # For each order, create 1-5 order items
+                picked = self.rng.sample(product_ids, min(self.rng.randint(1, 5), len(product_ids)))
+                order_lines = [(product_id, self.rng.randint(1, 4)) for product_id in picked]
+                total = sum(prices[product_id] * qty for product_id, qty in order_lines)
+                orders.append(Order(
+                    customer_id=self.rng.choice(customer_ids),
+                    status=self.rng.choice(STATUS_CHOICES),
+                    subtotal=total,
+                    total=total,
+                ))
+                lines.append(order_lines)
+            Order.objects.bulk_create(orders, batch_size=self.batch_size)
+            items = [
+                OrderItem(order=order, product_id=product_id, qty=qty, price=prices[product_id])
+                for order, order_lines in zip(orders, lines)
+                for product_id, qty in order_lines
+            ]
+            OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+            rows += len(orders) + len(items)
+        return None, rows
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from sales.reservations import sweep
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired stock holds and rebuild the available-to-sell counters of their products "
+        "(see sales/reservations.py); with --every, keep sweeping"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--every", type=float, default=0, help="seconds between sweeps; 0 sweeps once")
+
+    def handle(self, *args, **options):
+        every = options["every"]
+        if every < 0:
+            raise CommandError("--every must not be negative")
+        while True:
+            deleted = sweep()
+            self.stdout.write(f"released {deleted} expired holds")
+            if not every:
+                return
+            time.sleep(every)
@@ -1,11 +1,55 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from catalog.models import Product
 from django.contrib.auth import get_user_model
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 User = get_user_model()
 
+def line_total():
+    return ExpressionWrapper(F('qty') * F('price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+class TotalsQuerySet(models.QuerySet):
+    """
+    Shared by Order and Cart, whose line items live under the `items` relation.
+    """
+    def _items_total(self):
+        items = self.model._meta.get_field('items').related_model
+        totals = (
+            items.objects.filter(**{self.model._meta.model_name: OuterRef('pk')})
+            .order_by()
+            .values(self.model._meta.model_name)
+            .annotate(total=Sum(line_total()))
+            .values('total')
+        )
+        return Coalesce(Subquery(totals), Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+    def with_items_total(self):
+        """
+        Compute totals in the database, for rows whose persisted totals cannot be trusted.
+        """
+        return self.annotate(items_total=self._items_total())
+
+    def refresh_totals(self):
+        """
+        Recompute the persisted subtotal/total columns with a single UPDATE.
+        """
+        items_total = self._items_total()
+        return self.update(subtotal=items_total, total=items_total)
+
+
+class TotalsMixin:
+    def recalculate_totals(self):
+        subtotal = self.items.aggregate(total=Sum(line_total()))['total'] or Decimal('0')
+        self.subtotal = self.total = subtotal
+        type(self).objects.filter(pk=self.pk).update(subtotal=subtotal, total=subtotal)
+
+
 class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='customer')
     phone = models.CharField(max_length=20, blank=True)
@@ -23,7 +67,7 @@ class Customer(models.Model):
         return f"{self.user.first_name} {self.user.last_name}"
 
 
-class Order(models.Model):
+class Order(TotalsMixin, models.Model):
     STATUS_CHOICES = [
         ("pending", "Pending"),
         ("paid", "Paid"),
@@ -31,6 +75,14 @@ class Order(models.Model):
         ("completed", "Completed"),
         ("cancelled", "Cancelled"),
     ]
+    # the statuses each status may move to (see sales/transitions.py)
+    TRANSITIONS = {
+        "pending": {"paid", "cancelled"},
+        "paid": {"shipped", "cancelled"},
+        "shipped": {"completed"},
+        "completed": set(),
+        "cancelled": set(),
+    }
 
     customer = models.ForeignKey(
         Customer,
@@ -42,15 +94,37 @@ class Order(models.Model):
         choices=STATUS_CHOICES,
         default="pending",
     )
+    # denormalized from the order items, kept in sync on write
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TotalsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # order history: the user's orders newest first, optionally by status
+            models.Index(fields=["customer", "-created_at", "-id"], name="order_customer_created_idx"),
+            models.Index(fields=["customer", "status", "-created_at"], name="order_cust_status_idx"),
+        ]
+
     def __str__(self):
         return f"Order {self.id} – {self.status}"
 
+    @classmethod
+    def sources(cls, status):
+        """
+        The statuses an order can move to `status` from.
+        """
+        return sorted(source for source, targets in cls.TRANSITIONS.items() if status in targets)
+
+    def can_transition(self, status):
+        return status in self.TRANSITIONS[self.status]
+
     @property
     def total_amount(self):
-        return sum(item.subtotal for item in self.items.all())
+        return self.total
 
 
 class OrderItem(models.Model):
@@ -67,16 +141,30 @@ class OrderItem(models.Model):
         unique_together = ("order", "product")
         ordering = ['id']
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.order.recalculate_totals()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.order.recalculate_totals()
+        return result
+
     @property
     def subtotal(self):
         return self.qty * self.price
 
 
-class Cart(models.Model):
+class Cart(TotalsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
+    # denormalized from the cart items, kept in sync on write
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TotalsQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart for {self.user.username}"
 
@@ -90,6 +178,15 @@ class CartItem(models.Model):
     class Meta:
         unique_together = ('cart', 'product')
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.cart.recalculate_totals()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.cart.recalculate_totals()
+        return result
+
     @property
     def subtotal(self):
         return self.qty * self.price
@@ -98,6 +195,53 @@ class CartItem(models.Model):
         return f"{self.product.name} x{self.qty} in cart"
 
 
+class StockHold(models.Model):
+    """
+    Stock set aside for a user's cart line until `expires_at` (see sales/reservations.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_holds')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    qty = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'product')
+
+    def __str__(self):
+        return f"{self.qty} x {self.product_id} held for {self.user_id}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Work that follows a write, stored in the write's transaction and handled later by the outbox
+    worker (see sales/outbox.py).
+    """
+    topic = models.CharField(max_length=60)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # when a worker may pick it up (again)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # dotted paths of the handlers that already succeeded; retries skip them
+    completed = models.JSONField(default=list)
+    last_error = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # the worker's claim query: due events not processed or given up yet
+            models.Index(
+                fields=['available_at', 'id'], name='outbox_pending_idx',
+                condition=Q(processed_at__isnull=True, failed_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id}"
+
+
 @receiver(post_save, sender=User)
 def create_customer_profile(sender, instance, created, **kwargs):
     if created:
@@ -0,0 +1,111 @@
+# sales/outbox.py: the transactional outbox for the work that follows an order
+# - publish() inserts OutboxEvent rows in the caller's transaction (checkout publishes order.placed),
+#   so an event exists exactly when its order does and nothing slow runs before the response
+# - settings.OUTBOX_HANDLERS maps each topic to the dotted paths of its handler(event) functions
+# - drain() (manage.py process_outbox, or called in-process, e.g. by tests) claims due events in batches
+#   with FOR UPDATE SKIP LOCKED and leases them for OUTBOX_LEASE_SECONDS, so several workers can run side
+#   by side and the events of a worker that died come back once the lease runs out
+# - Each handler runs in a transaction that also records its success, so its database changes happen
+#   once; a retried event skips the handlers that succeeded. Effects outside the database (e.g. email)
+#   are at-least-once, and handlers get the event (and its id) to deduplicate them
+# - A failed event is retried after OUTBOX_RETRY_DELAY * 2^(attempts - 1) seconds, at most
+#   OUTBOX_MAX_RETRY_DELAY, and given up (failed_at) after OUTBOX_MAX_ATTEMPTS
+
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+
+def publish(topic, payloads):
+    """
+    Queue one `topic` event per payload, in one INSERT; call it inside the transaction of the write.
+    """
+    return OutboxEvent.objects.bulk_create([OutboxEvent(topic=topic, payload=payload) for payload in payloads])
+
+
+def pending():
+    return OutboxEvent.objects.filter(processed_at__isnull=True, failed_at__isnull=True)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), settings.OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim(batch_size, now=None):
+    """
+    Lease up to `batch_size` due events to this worker, oldest first.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        events = list(
+            pending().filter(available_at__lte=now).order_by('available_at', 'id')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if events:
+            lease = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(available_at=lease)
+    return events
+
+
+def process(event, now=None):
+    """
+    Run the event's handlers that have not succeeded yet; returns whether all of them have now.
+    """
+    path = None
+    try:
+        for path in settings.OUTBOX_HANDLERS.get(event.topic, []):
+            if path in event.completed:
+                continue
+            handler = import_string(path)
+            with transaction.atomic():
+                handler(event)
+                OutboxEvent.objects.filter(pk=event.pk).update(completed=[*event.completed, path])
+            event.completed.append(path)
+    except Exception as exc:
+        now = now or timezone.now()
+        event.attempts += 1
+        event.last_error = f'{path}: {exc!r}'
+        if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            event.failed_at = now
+            logger.error('Giving up on outbox event %s after %s attempts: %s', event.pk, event.attempts, event.last_error)
+        else:
+            event.available_at = now + retry_delay(event.attempts)
+            logger.warning('Outbox event %s failed, retrying at %s: %s', event.pk, event.available_at, event.last_error)
+        event.save(update_fields=['attempts', 'last_error', 'failed_at', 'available_at'])
+        return False
+    event.attempts += 1
+    event.processed_at = timezone.now()
+    event.last_error = ''
+    event.save(update_fields=['attempts', 'last_error', 'processed_at'])
+    return True
+
+
+def drain(batch_size=None, now=None):
+    """
+    Handle every due event, a batch at a time; returns (processed, failed) counts.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    processed = failed = 0
+    while True:
+        events = claim(batch_size, now)
+        if not events:
+            return processed, failed
+        for event in events:
+            if process(event, now):
+                processed += 1
+            else:
+                failed += 1
+
+
+def purge(days):
+    """
+    Delete events processed more than `days` days ago; returns how many.
+    """
+    deleted, _ = OutboxEvent.objects.filter(processed_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
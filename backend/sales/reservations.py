@@ -0,0 +1,230 @@
+# sales/reservations.py: short-lived stock holds placed when a product goes into a cart
+# - Adding to a cart holds the line's quantity for STOCK_HOLD_SECONDS (0 turns holds off); a product
+#   whose available-to-sell count cannot cover the hold is rejected before anything is written
+# - Available-to-sell (stock minus held quantities) is kept per product as a counter in
+#   caches[STOCK_CACHE_ALIAS] and changed with atomic incr/decr, so hot products never lock their
+#   Product row at add-to-cart time; each user's holds are one StockHold row per product
+# - Expired holds never count: counters are rebuilt from the unexpired holds on a miss, after they
+#   expire (STOCK_COUNTER_TIMEOUT), when a product is saved and by the sweep, which deletes expired
+#   holds; an add that finds too little left sweeps its products' expired holds and tries again, so
+#   abandoned carts do not block a product even without manage.py sweep_stock_holds running
+# - Checkout still checks and takes stock in the database (never oversells); it turns the user's holds
+#   into the stock decrement, so the counters only move by what was ordered beyond the holds, in an
+#   order.placed outbox handler (sales/handlers.py)
+# - Counters are advisory: a lost update only lets a few more or fewer holds through until the next
+#   rebuild
+# - Cache counters do not roll back with the database: reserve() gives its changes back when writing
+#   the holds fails, and undo_on_error() around the caller's transaction does when that fails
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Sum
+from django.utils import timezone
+from catalog.models import Product
+from .models import StockHold
+
+# counter changes reserve() made inside undo_on_error(), {product_id: qty taken}
+_taken = ContextVar('reservations_taken', default=None)
+
+
+def enabled():
+    return settings.STOCK_HOLD_SECONDS > 0
+
+
+def get_cache():
+    return caches[settings.STOCK_CACHE_ALIAS]
+
+
+def counter_key(product_id):
+    return f'stock:available:{product_id}'
+
+
+def reconcile(product_ids, replace=True):
+    """
+    Reset the counters of `product_ids` to stock minus the unexpired holds. With replace=False only
+    missing counters are set, so concurrent rebuilds on a miss cannot undo each other's changes.
+    """
+    stock = dict(Product.objects.filter(id__in=product_ids).order_by().values_list('id', 'stock'))
+    held = dict(
+        StockHold.objects.filter(product_id__in=stock, expires_at__gt=timezone.now()).order_by()
+        .values('product_id').annotate(total=Sum('qty')).values_list('product_id', 'total')
+    )
+    counters = {counter_key(product_id): stock[product_id] - held.get(product_id, 0) for product_id in stock}
+    cache = get_cache()
+    if replace:
+        cache.set_many(counters, settings.STOCK_COUNTER_TIMEOUT)
+    else:
+        for key, value in counters.items():
+            cache.add(key, value, settings.STOCK_COUNTER_TIMEOUT)
+
+
+def load_counters(product_ids):
+    """
+    Rebuild the missing counters of `product_ids` together, rather than one by one in take().
+    """
+    present = get_cache().get_many([counter_key(product_id) for product_id in product_ids])
+    missing = [product_id for product_id in product_ids if counter_key(product_id) not in present]
+    if missing:
+        reconcile(missing, replace=False)
+
+
+def take(product_id, qty):
+    """
+    Subtract `qty` (negative: give back) from the product's counter and return the new count.
+    """
+    cache = get_cache()
+    try:
+        return cache.decr(counter_key(product_id), qty)
+    except ValueError:
+        # no counter yet (or it expired): rebuild it, then apply the change
+        reconcile([product_id], replace=False)
+        return cache.decr(counter_key(product_id), qty)
+
+
+def give_back(taken):
+    for product_id, delta in taken.items():
+        take(product_id, -delta)
+
+
+@contextmanager
+def undo_on_error():
+    """
+    Give back the counter changes reserve() makes inside the block should the block raise, e.g. when
+    the transaction writing the holds around it fails.
+    """
+    taken = {}
+    token = _taken.set(taken)
+    try:
+        yield
+    except BaseException:
+        give_back(taken)
+        raise
+    finally:
+        _taken.reset(token)
+
+
+def take_holds(user_id, quantities):
+    """
+    Take what holding {product_id: qty} adds to the user's unexpired holds from the counters. Returns
+    ({product_id: qty taken}, ids of the products left below zero); those changes are given back.
+    """
+    held = dict(
+        StockHold.objects.filter(user_id=user_id, product_id__in=quantities, expires_at__gt=timezone.now())
+        .values_list('product_id', 'qty')
+    )
+    taken, unavailable = {}, []
+    for product_id, qty in sorted(quantities.items()):
+        delta = qty - held.get(product_id, 0)
+        if not delta:
+            continue
+        taken[product_id] = delta
+        if take(product_id, delta) < 0 and delta > 0:
+            unavailable.append(product_id)
+    if unavailable:
+        give_back(taken)
+    return taken, unavailable
+
+
+def reserve(user_id, quantities):
+    """
+    Hold {product_id: qty} (qty >= 1) for the user, replacing their earlier holds on these products.
+    Returns the ids of the products that cannot be held; then nothing is held.
+    """
+    if any(qty < 1 for qty in quantities.values()):
+        raise ValueError('Stock holds need a quantity of at least 1')
+    if not enabled() or not quantities:
+        return []
+    load_counters(quantities)
+    taken, unavailable = take_holds(user_id, quantities)
+    if unavailable and sweep(product_ids=unavailable):
+        # expired holds were still counted; try again against the rebuilt counters
+        taken, unavailable = take_holds(user_id, quantities)
+    if unavailable:
+        return unavailable
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_HOLD_SECONDS)
+    try:
+        StockHold.objects.bulk_create(
+            [StockHold(user_id=user_id, product_id=product_id, qty=qty, expires_at=expires_at)
+             for product_id, qty in quantities.items()],
+            update_conflicts=True, unique_fields=['user', 'product'], update_fields=['qty', 'expires_at'],
+        )
+    except Exception:
+        give_back(taken)
+        raise
+    pending = _taken.get()
+    if pending is not None:
+        for product_id, delta in taken.items():
+            pending[product_id] = pending.get(product_id, 0) + delta
+    return []
+
+
+def release(user_id, product_ids):
+    """
+    Give the user's holds on `product_ids` back.
+    """
+    if not enabled() or not product_ids:
+        return
+    holds = StockHold.objects.filter(user_id=user_id, product_id__in=product_ids)
+    released = list(holds.values_list('id', 'product_id', 'qty'))
+    if released:
+        StockHold.objects.filter(id__in=[hold_id for hold_id, _, _ in released]).delete()
+        for _, product_id, qty in released:
+            take(product_id, -qty)
+
+
+def convert(user_id, product_ids):
+    """
+    At checkout, inside its transaction: drop the user's holds on the ordered products and return
+    {product_id: held qty}, for adjust_after_checkout() (via the order.placed event).
+    """
+    if not enabled():
+        return {}
+    holds = StockHold.objects.filter(user_id=user_id, product_id__in=product_ids)
+    # expired holds are no longer in the counters
+    held = dict(holds.filter(expires_at__gt=timezone.now()).values_list('product_id', 'qty'))
+    holds.delete()
+    return held
+
+
+def adjust_after_checkout(ordered, held):
+    """
+    Once the order is committed (in the outbox worker): stock went down by the `ordered` quantities and
+    the `held` ones were released, so each counter moves by their difference.
+    """
+    if not enabled():
+        return
+    cache = get_cache()
+    for product_id, qty in ordered.items():
+        delta = qty - held.get(product_id, 0)
+        if delta:
+            try:
+                cache.decr(counter_key(product_id), delta)
+            except ValueError:
+                # no counter: the next reader rebuilds it from the committed rows
+                pass
+
+
+def sweep(now=None, product_ids=None):
+    """
+    Delete expired holds (of `product_ids`, all by default) and rebuild the counters of their products;
+    returns how many were deleted.
+    """
+    expired = StockHold.objects.filter(expires_at__lte=now or timezone.now())
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+    product_ids = set(expired.values_list('product_id', flat=True))
+    if not product_ids:
+        return 0
+    deleted, _ = expired.delete()
+    reconcile(product_ids)
+    return deleted
+
+
+def forget_counter(sender, instance, **kwargs):
+    """
+    post_save/post_delete receiver for Product: stock may have been edited.
+    """
+    get_cache().delete(counter_key(instance.pk))
@@ -1,17 +1,31 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Customer, Order, OrderItem, Cart, CartItem
-from catalog.serializers import ProductSerializer
+from catalog.serializers import ProductSerializer, ProductSummarySerializer
 from catalog.models import Product
+from ecomm.serializers import DynamicModelSerializer
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+class CartProductSerializer(ProductSummarySerializer):
+    # the cart page caps quantities at the available stock
+    class Meta(ProductSummarySerializer.Meta):
+        fields = ProductSummarySerializer.Meta.fields + ['stock']
+
+class LineItemSerializer(DynamicModelSerializer):
+    """
+    Line items show a product summary; ?expand=product swaps in the full ProductSerializer.
+    """
+    expandable_fields = {'product': lambda: ProductSerializer(read_only=True)}
+    field_requires = {'subtotal': ['qty', 'price']}
+    row_values = {'subtotal': lambda qty, price: qty * price}
+
+class UserSerializer(DynamicModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(DynamicModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), source='user', write_only=True
@@ -23,26 +37,41 @@ class CustomerSerializer(serializers.ModelSerializer):
             'state', 'postal_code', 'country', 'created_at'
         ]
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class OrderItemSerializer(LineItemSerializer):
+    product = ProductSummarySerializer(read_only=True)
     price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     class Meta:
         model = OrderItem
         fields = ["id", "product", "qty", "price", "subtotal"]
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     customer = CustomerSerializer(read_only=True)
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    field_requires = {'total_amount': ['total']}
+    row_values = {'total_amount': lambda total: total}
 
     class Meta:
         model = Order
-        fields = ["id", "customer", "status", "created_at", "updated_at", "items", "total_amount"]
+        fields = ["id", "customer", "status", "created_at", "updated_at", "items", "subtotal", "total", "total_amount"]
+        read_only_fields = ["subtotal", "total"]
+
+    def validate_status(self, value):
+        if self.instance is not None and value != self.instance.status and not self.instance.can_transition(value):
+            raise serializers.ValidationError(f'An order cannot go from {self.instance.status} to {value}.')
+        return value
+
+class OrderTransitionSerializer(serializers.Serializer):
+    """
+    A bulk status change: move the orders in order_ids to status (see sales/transitions.py).
+    """
+    order_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=50_000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
 
 # Serializers for Cart functionality
-class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class CartItemSerializer(LineItemSerializer):
+    product = CartProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), source='product', write_only=True)
     price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
@@ -50,13 +79,35 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id', 'product', 'product_id', 'qty', 'price', 'subtotal']
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(DynamicModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_amount = serializers.SerializerMethodField()
+    field_requires = {'total_amount': ['total']}
+    row_values = {'total_amount': lambda total: total}
 
     class Meta:
         model = Cart
         fields = ['id', 'items', 'total_amount']
 
     def get_total_amount(self, obj):
-        return sum(item.subtotal for item in obj.items.all())
\ No newline at end of file
+        return obj.total
+
+class CartOperationSerializer(serializers.Serializer):
+    """
+    One batch operation: set a product's quantity (0 removes its line), or remove a line by id.
+    """
+    product_id = serializers.IntegerField(required=False)
+    qty = serializers.IntegerField(min_value=0, required=False)
+    item_id = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if ('item_id' in attrs) == ('product_id' in attrs):
+            raise serializers.ValidationError('Give either product_id (with qty) or item_id.')
+        if 'product_id' in attrs and 'qty' not in attrs:
+            raise serializers.ValidationError('qty is required with product_id.')
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+    # add the quantities to the lines already in the cart instead of replacing them (guest cart merge)
+    merge = serializers.BooleanField(default=False)
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from catalog.models import Category, Product
+from sales.models import Order, OrderItem
+
+User = get_user_model()
+
+class OrderAdminChangelistTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="pass", email="admin@example.com")
+        self.client.force_login(self.admin)
+        cat = Category.objects.create(name="AdminCat")
+        self.prod = Product.objects.create(name="AdminProd", category=cat, price=10, stock=100)
+
+    def create_orders(self, count):
+        for i in range(count):
+            user = User.objects.create_user(username=f"admin_buyer{Order.objects.count()}", password="p")
+            order = Order.objects.create(customer=user.customer)
+            OrderItem.objects.create(order=order, product=self.prod, qty=2, price=10)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/admin/sales/order/")
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp
+
+    def test_changelist_query_count_independent_of_rows(self):
+        self.create_orders(2)
+        few, _ = self.changelist_queries()
+        self.create_orders(10)
+        many, resp = self.changelist_queries()
+        self.assertEqual(few, many)
+        self.assertContains(resp, "20.00")
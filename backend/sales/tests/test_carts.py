@@ -0,0 +1,165 @@
+import time
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APITestCase
+from catalog.models import Category, Product
+from sales import carts
+from sales.models import Cart, CartItem, Order
+
+User = get_user_model()
+
+CACHE_STORE = "sales.carts.CacheCartStore"
+
+@override_settings(CART_STORE=CACHE_STORE, CART_FLUSH_INTERVAL=0)
+class CacheCartStoreTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        carts._dirty.clear()
+        self.user = User.objects.create_user(username="cached", password="p")
+        app = Application.objects.create(user=self.user, name="cached", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        AccessToken.objects.create(user=self.user, application=app, token="cached",
+            expires=timezone.now()+timedelta(hours=1), scope="read:cart write:cart")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer cached")
+        cat = Category.objects.create(name="Cached")
+        self.products = [Product.objects.create(name=f"K{i}", category=cat, price=i + 1, stock=4) for i in range(3)]
+        for prod in self.products:
+            prod.images.create(url=f"https://img.example/{prod.id}.jpg")
+
+    def post(self, action, data, query=""):
+        resp = self.client.post(f"/api/cart/{action}/{query}", data, format="json")
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return resp.json()
+
+    def shop(self, query=""):
+        """
+        The same cart changes under whichever store is configured; returns every response.
+        """
+        p = self.products
+        responses = [self.post("add", {"product_id": p[0].id, "qty": 2}, query)]
+        responses.append(self.post("batch", {"operations": [
+            {"product_id": p[1].id, "qty": 1}, {"product_id": p[2].id, "qty": 3}]}, query))
+        item_id = next(item["id"] for item in self.client.get("/api/cart/").json()["items"]
+                       if item["product"]["id"] == p[2].id)
+        responses.append(self.post("remove", {"item_id": item_id}, query))
+        responses.append(self.client.get("/api/cart/?expand=product").json())
+        return responses
+
+    def without_line_ids(self, data):
+        """
+        Line ids are row ids in the database but product ids in a cache-held cart.
+        """
+        data = {**data}
+        data.pop("id", None)
+        data.pop("removed", None)
+        data["items"] = sorted(({**item, "id": None} for item in data["items"]), key=lambda item: item["product"]["id"])
+        return data
+
+    def test_cart_changes_write_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.shop()[-2]
+        # only the stock holds are written (see sales/reservations.py)
+        writes = [query["sql"] for query in queries if not query["sql"].startswith(("SELECT", "SAVEPOINT", "RELEASE"))
+                  and "sales_stockhold" not in query["sql"]]
+        self.assertEqual(writes, [])
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual([item["id"] for item in data["items"]], [self.products[0].id, self.products[1].id])
+        self.assertEqual(float(data["total_amount"]), 2 * 1 + 1 * 2)
+
+    def test_responses_match_model_store(self):
+        for query in ["", "?return=delta"]:
+            with self.subTest(query=query):
+                cache.clear()
+                Cart.objects.all().delete()
+                cached = self.shop(query)
+                with override_settings(CART_STORE="sales.carts.ModelCartStore"):
+                    Cart.objects.all().delete()
+                    stored = self.shop(query)
+                self.assertEqual([self.without_line_ids(data) for data in cached],
+                                 [self.without_line_ids(data) for data in stored])
+
+    def test_flush_writes_cart_rows(self):
+        self.shop()
+        self.assertEqual(carts.flush_pending(), 1)
+        self.assertEqual(dict(CartItem.objects.filter(cart__user=self.user).values_list("product_id", "qty")),
+                         {self.products[0].id: 2, self.products[1].id: 1})
+        self.assertEqual(Cart.objects.get(user=self.user).total, 4)
+        self.assertEqual(self.client.get("/api/cart/").json()["id"], Cart.objects.get(user=self.user).id)
+        self.post("remove", {"item_id": self.products[0].id})
+        self.assertEqual(carts.flush_pending(), 1)
+        self.assertEqual(list(CartItem.objects.values_list("product_id", flat=True)), [self.products[1].id])
+        self.assertEqual(carts.flush_pending(), 0)
+
+    def test_failed_flushes_are_retried(self):
+        self.shop()
+        with mock.patch.object(carts.CacheCartStore, "flush", side_effect=OperationalError("connection lost")):
+            with self.assertLogs("sales.carts", "ERROR"):
+                self.assertEqual(carts.flush_pending(), 0)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(carts.flush_pending(), 1)
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 2)
+
+    def test_flusher_thread_outlives_database_errors(self):
+        class Stop(Exception):
+            pass
+        with mock.patch("sales.carts.time.sleep", side_effect=[None, None, Stop]), \
+                mock.patch("sales.carts.flush_pending", side_effect=[OperationalError("server closed"), 1]) as flush, \
+                mock.patch("sales.carts.close_old_connections") as close, self.assertLogs("sales.carts", "ERROR"):
+            with self.assertRaises(Stop):
+                carts._flush_forever()
+        self.assertEqual(flush.call_count, 2)
+        # before each flush, and after the one that went through
+        self.assertEqual(close.call_count, 3)
+
+    @override_settings(CART_LOCK_TIMEOUT=1)
+    def test_cart_lock_is_renewed_and_only_released_by_its_holder(self):
+        store = carts.CacheCartStore(self.user.pk)
+        lock = f"{store.key}:lock"
+        with store.locked(keep_alive=True):
+            # past the lock's timeout, another request still cannot take it
+            time.sleep(1.5)
+            self.assertFalse(cache.add(lock, "other", 1))
+        self.assertIsNone(cache.get(lock))
+        with store.locked():
+            # the lock expired and another request took it
+            cache.set(lock, "other", 1)
+        self.assertEqual(cache.get(lock), "other")
+
+    def test_cart_loaded_from_rows_on_cache_miss(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.items.create(product=self.products[2], qty=1, price=3)
+        data = self.client.get("/api/cart/").json()
+        self.assertEqual(data["id"], cart.id)
+        self.assertEqual([item["id"] for item in data["items"]], [self.products[2].id])
+        with self.assertNumQueries(1):
+            # the cart comes from the cache, its products from the database
+            self.client.get("/api/cart/")
+
+    def test_checkout_flushes_and_empties_cart(self):
+        self.shop()
+        Product.objects.filter(pk=self.products[1].pk).update(stock=0)
+        resp = self.client.post("/api/cart/checkout/", format="json")
+        self.assertEqual(resp.status_code, 400)
+        # a failed checkout leaves the cart as it was
+        self.assertEqual(len(self.client.get("/api/cart/").json()["items"]), 2)
+        Product.objects.filter(pk=self.products[1].pk).update(stock=4)
+        order = self.client.post("/api/cart/checkout/", format="json").json()
+        self.assertEqual(sorted((item["product"]["id"], item["qty"]) for item in order["items"]),
+                         [(self.products[0].id, 2), (self.products[1].id, 1)])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 2)
+        self.assertEqual(self.client.get("/api/cart/").json()["items"], [])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.client.post("/api/cart/checkout/", format="json").status_code, 400)
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.post("/api/cart/remove/", {"item_id": self.products[0].id},
+                                          format="json").status_code, 400)
+        self.assertEqual(self.client.post("/api/cart/add/", {"product_id": 0}, format="json").status_code, 400)
@@ -0,0 +1,92 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from catalog.models import Product, StockSlot
+from sales.management.commands import bench_api, bench_serializers
+from sales.models import Customer, Order, OutboxEvent
+
+User = get_user_model()
+
+class SeedDataCommandTest(TestCase):
+    def test_scale_flags_and_totals(self):
+        call_command("seed_data", products=30, customers=7, orders=12, seed=1, batch_size=5, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 30)
+        # 7 customers plus testadmin and testcustomer
+        self.assertEqual(Customer.objects.count(), 9)
+        self.assertEqual(User.objects.count(), 9)
+        self.assertEqual(Order.objects.count(), 12)
+        self.assertFalse(Order.objects.with_items_total().exclude(total=F("items_total")).exists())
+        self.assertTrue(User.objects.get(username="testadmin").check_password("testpassword"))
+
+    def test_seed_is_reproducible(self):
+        names = []
+        for _ in range(2):
+            call_command("seed_data", products=5, customers=2, orders=3, seed=7, stdout=StringIO())
+            names.append(list(Product.objects.order_by("slug").values_list("name", "price")))
+        self.assertEqual(names[0], names[1])
+
+    def test_reseeding_reuses_no_ids(self):
+        call_command("seed_data", products=5, customers=2, orders=3, seed=7, stdout=StringIO())
+        seeded = {model: set(model.objects.values_list("id", flat=True)) for model in (Product, User, Order)}
+        OutboxEvent.objects.create(topic="order.placed", payload={"order_id": min(seeded[Order])})
+        call_command("seed_data", products=5, customers=2, orders=3, seed=7, stdout=StringIO())
+        # state cached by id (carts, stock counters, ...) cannot match the new rows
+        for model, ids in seeded.items():
+            self.assertFalse(model.objects.filter(id__in=ids).exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+class BenchApiCommandTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.baseline_dir = Path(tmp.name)
+
+    def test_client_run_saves_and_compares_baseline(self):
+        out = StringIO()
+        with mock.patch.object(bench_api, "BASELINE_DIR", self.baseline_dir):
+            call_command(
+                "bench_api", reseed=True, products=20, customers=3, orders=5, requests=3, warmup=1, save="base",
+                stdout=out,
+            )
+            report = json.loads((self.baseline_dir / "base.json").read_text())
+            self.assertEqual(set(report["scenarios"]), set(bench_api.SCENARIOS))
+            for row in report["scenarios"].values():
+                self.assertEqual(row["errors"], 0)
+                self.assertEqual(row["requests"], 3)
+                self.assertIn("queries_per_request", row)
+            call_command("bench_api", requests=3, warmup=0, compare="base", stdout=out)
+        self.assertIn("Compared with base", out.getvalue())
+
+class BenchSerializersCommandTest(TestCase):
+    def test_reports_every_case_and_rolls_back(self):
+        out = StringIO()
+        call_command("bench_serializers", objects=5, repeat=1, stdout=out)
+        for name in bench_serializers.CASES:
+            self.assertIn(name, out.getvalue())
+        self.assertFalse(Product.objects.exists())
+
+    def test_json_benchmark_reports_both_payloads(self):
+        out = StringIO()
+        call_command("bench_json", objects=5, repeat=1, stdout=out)
+        for name in ("products page", "orders x5"):
+            self.assertIn(name, out.getvalue())
+        self.assertFalse(Product.objects.exists())
+
+class BenchCheckoutCommandTest(TransactionTestCase):
+    def test_reports_each_run_and_cleans_up(self):
+        out = StringIO()
+        call_command("bench_checkout", workers=[1, 3], slots=[1, 4], checkouts=2, stdout=out)
+        rows = [line.split() for line in out.getvalue().splitlines()[1:]]
+        self.assertEqual([(row[0], row[1]) for row in rows], [("1", "1"), ("1", "3"), ("4", "1"), ("4", "3")])
+        # no checkout failed
+        self.assertEqual({row[-1] for row in rows}, {"0"})
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(StockSlot.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Order.objects.exists())
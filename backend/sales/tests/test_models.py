@@ -26,6 +26,32 @@ class OrderModelTest(TestCase):
         OrderItem.objects.create(order=self.order, product=prod, qty=3, price=10)
         self.assertEqual(self.order.total_amount, 30)
 
+    def test_totals_persisted_on_item_changes(self):
+        cat = Category.objects.create(name="TotalsCat")
+        first = Product.objects.create(name="First", category=cat, price=10, stock=5)
+        second = Product.objects.create(name="Second", category=cat, price=4, stock=5)
+        item = OrderItem.objects.create(order=self.order, product=first, qty=2, price=10)
+        OrderItem.objects.create(order=self.order, product=second, qty=1, price=4)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total, 24)
+        item.qty = 1
+        item.save()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).subtotal, 14)
+        item.delete()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total, 4)
+
+    def test_items_total_annotation_and_refresh(self):
+        cat = Category.objects.create(name="RefreshCat")
+        prod = Product.objects.create(name="Refresh", category=cat, price=10, stock=5)
+        OrderItem.objects.bulk_create([OrderItem(order=self.order, product=prod, qty=3, price=10)])
+        empty = Order.objects.create(customer=self.user.customer)
+        # bulk_create bypasses save(), so the persisted total is stale
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total, 0)
+        totals = dict(Order.objects.with_items_total().values_list("pk", "items_total"))
+        self.assertEqual(totals, {self.order.pk: 30, empty.pk: 0})
+        Order.objects.refresh_totals()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total, 30)
+        self.assertEqual(Order.objects.get(pk=empty.pk).total, 0)
+
 class OrderItemModelTest(TestCase):
     def test_subtotal(self):
         cat = Category.objects.create(name="TestCatItem")
@@ -49,3 +75,13 @@ class CartItemModelTest(TestCase):
         cart = Cart.objects.create(user=user)
         item = CartItem.objects.create(cart=cart, product=prod, qty=4, price=5)
         self.assertEqual(item.subtotal, 20)
+
+    def test_cart_totals_persisted(self):
+        user = User.objects.create_user(username="ci2", password="pass")
+        cat = Category.objects.create(name="CI2")
+        prod = Product.objects.create(name="ProdCI2", category=cat, price=5, stock=10)
+        cart = Cart.objects.create(user=user)
+        item = CartItem.objects.create(cart=cart, product=prod, qty=4, price=5)
+        self.assertEqual(Cart.objects.get(pk=cart.pk).total, 20)
+        item.delete()
+        self.assertEqual(Cart.objects.get(pk=cart.pk).total, 0)
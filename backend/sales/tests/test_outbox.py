@@ -0,0 +1,141 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from catalog.models import Category, Product
+from sales import outbox
+from sales.models import Order, OutboxEvent
+
+User = get_user_model()
+
+calls = []
+
+def note_handler(event):
+    calls.append(("note", event.pk))
+
+def flaky_handler(event):
+    calls.append(("flaky", event.pk))
+    if len([call for call in calls if call[0] == "flaky"]) < 2:
+        raise ConnectionError("mail server down")
+
+def broken_handler(event):
+    raise ValueError("bad payload")
+
+TEST_HANDLERS = {"test.flaky": ["sales.tests.test_outbox.note_handler", "sales.tests.test_outbox.flaky_handler"],
+                 "test.broken": ["sales.tests.test_outbox.broken_handler"]}
+
+class CheckoutOutboxTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buyer", password="p", email="buyer@example.com")
+        app = Application.objects.create(user=self.user, name="buyer", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        AccessToken.objects.create(user=self.user, application=app, token="buyer",
+            expires=timezone.now()+timedelta(hours=1), scope="read:cart write:cart")
+        self.client.defaults["HTTP_AUTHORIZATION"] = "Bearer buyer"
+        self.product = Product.objects.create(name="Boxed", category=Category.objects.create(name="B"), price=7, stock=1)
+
+    def checkout(self, qty=1):
+        self.client.post("/api/cart/add/", {"product_id": self.product.id, "qty": qty}, content_type="application/json")
+        return self.client.post("/api/cart/checkout/", content_type="application/json")
+
+    def test_checkout_publishes_order_placed(self):
+        self.assertEqual(self.checkout().status_code, 200)
+        order = Order.objects.get()
+        event = OutboxEvent.objects.get()
+        # the hold turned into the order, keyed by product id (a JSON object key)
+        self.assertEqual((event.topic, event.payload),
+                         ("order.placed", {"order_id": order.id, "held": {str(self.product.id): 1}}))
+        # nothing was sent while the customer waited
+        self.assertEqual(mail.outbox, [])
+        with self.assertLogs("sales.analytics") as logs:
+            self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(logs.records[0].order_id, order.id)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["buyer@example.com"])
+        self.assertIn(f"#{order.id}", mail.outbox[0].subject)
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(len(event.completed), 4)
+        # handled events are not handled again
+        self.assertEqual(outbox.drain(), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_stock_refresh_is_redone_by_the_worker(self):
+        with mock.patch("catalog.models.ProductQuerySet.refresh_stock", side_effect=DatabaseError("lock timeout")), \
+                self.assertLogs("sales.views", "ERROR"):
+            # the order committed, so the checkout still succeeds
+            self.assertEqual(self.checkout().status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        outbox.drain()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_failed_checkout_publishes_nothing(self):
+        self.assertEqual(self.checkout(qty=2).status_code, 400)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+@override_settings(OUTBOX_HANDLERS=TEST_HANDLERS, OUTBOX_RETRY_DELAY=10, OUTBOX_MAX_RETRY_DELAY=25, OUTBOX_MAX_ATTEMPTS=4)
+class OutboxWorkerTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_retries_back_off_and_skip_succeeded_handlers(self):
+        event, = outbox.publish("test.flaky", [{}])
+        now = timezone.now()
+        self.assertEqual(outbox.drain(now=now), (0, 1))
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.available_at, now + timedelta(seconds=10))
+        self.assertIn("mail server down", event.last_error)
+        self.assertEqual(event.completed, ["sales.tests.test_outbox.note_handler"])
+        # not due yet
+        self.assertEqual(outbox.drain(now=now + timedelta(seconds=5)), (0, 0))
+        self.assertEqual(outbox.drain(now=now + timedelta(seconds=10)), (1, 0))
+        # the handler that succeeded the first time did not run again
+        self.assertEqual(calls, [("note", event.pk), ("flaky", event.pk), ("flaky", event.pk)])
+
+    def test_gives_up_after_max_attempts(self):
+        event, = outbox.publish("test.broken", [{}])
+        now = timezone.now()
+        delays = []
+        for attempt in range(4):
+            self.assertEqual(outbox.drain(now=now), (0, 1))
+            event.refresh_from_db()
+            delays.append((event.available_at - now).total_seconds())
+            now = event.available_at
+        self.assertEqual(delays[:3], [10, 20, 25])
+        self.assertIsNotNone(event.failed_at)
+        self.assertEqual(outbox.drain(now=now + timedelta(days=1)), (0, 0))
+
+    def test_claimed_events_are_leased(self):
+        events = outbox.publish("test.flaky", [{}, {}, {}])
+        now = timezone.now()
+        self.assertEqual([event.id for event in outbox.claim(2, now)], [event.id for event in events[:2]])
+        # another worker only gets what is left
+        self.assertEqual([event.id for event in outbox.claim(2, now)], [events[2].id])
+        self.assertEqual(outbox.claim(2, now), [])
+        # until the lease runs out
+        self.assertEqual(len(outbox.claim(5, now + timedelta(minutes=5))), 3)
+
+    def test_unknown_topics_are_processed(self):
+        outbox.publish("test.unhandled", [{}])
+        self.assertEqual(outbox.drain(), (1, 0))
+
+    def test_command_drains_and_purges(self):
+        outbox.publish("test.unhandled", [{}, {}])
+        OutboxEvent.objects.create(topic="test.unhandled", processed_at=timezone.now() - timedelta(days=8))
+        out = StringIO()
+        call_command("process_outbox", batch_size=1, stdout=out)
+        self.assertIn("processed 2 events, 0 failed, deleted 1 old events", out.getvalue())
+        self.assertEqual(OutboxEvent.objects.filter(processed_at__isnull=False).count(), 2)
@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APIClient, APITestCase
+from catalog.models import Category, Product
+from sales import outbox, reservations
+from sales.carts import ModelCartStore
+from sales.models import CartItem, StockHold
+
+User = get_user_model()
+
+def shopper(name):
+    user = User.objects.create_user(username=name, password="p")
+    app = Application.objects.create(user=user, name=name, client_type=Application.CLIENT_PUBLIC,
+        authorization_grant_type=Application.GRANT_PASSWORD)
+    AccessToken.objects.create(user=user, application=app, token=name,
+        expires=timezone.now()+timedelta(hours=1), scope="read:cart write:cart")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {name}")
+    return user, client
+
+@override_settings(STOCK_HOLD_SECONDS=600)
+class StockHoldTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.alice_client = shopper("alice")
+        self.bob, self.bob_client = shopper("bob")
+        self.product = Product.objects.create(name="Scarce", category=Category.objects.create(name="S"), price=4, stock=3)
+
+    def add(self, client, qty):
+        return client.post("/api/cart/add/", {"product_id": self.product.id, "qty": qty}, format="json")
+
+    def available(self):
+        return cache.get(reservations.counter_key(self.product.id))
+
+    def test_add_holds_stock(self):
+        self.assertEqual(self.add(self.alice_client, 2).status_code, 200)
+        self.assertEqual(self.available(), 1)
+        resp = self.add(self.bob_client, 2)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), {"error": "Insufficient stock", "product_ids": [self.product.id]})
+        self.assertFalse(CartItem.objects.filter(cart__user=self.bob).exists())
+        self.assertEqual(self.available(), 1)
+        self.assertEqual(self.add(self.bob_client, 1).status_code, 200)
+        self.assertEqual(self.available(), 0)
+
+    def test_invalid_quantities_hold_nothing(self):
+        for qty in ["abc", None, 0, -3]:
+            resp = self.add(self.alice_client, qty)
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(resp.json(), {"error": "Invalid qty"})
+        self.assertFalse(StockHold.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+        self.assertIn(self.available(), [None, 3])
+        with self.assertRaises(ValueError):
+            reservations.reserve(self.alice.pk, {self.product.id: -3})
+
+    def test_failed_writes_give_the_counters_back(self):
+        self.add(self.alice_client, 1)
+        with mock.patch.object(StockHold.objects, "bulk_create", side_effect=DatabaseError("disk full")):
+            with self.assertRaises(DatabaseError):
+                self.add(self.alice_client, 3)
+        self.assertEqual(self.available(), 2)
+        with mock.patch.object(ModelCartStore, "save_lines", side_effect=DatabaseError("disk full")):
+            with self.assertRaises(DatabaseError):
+                self.add(self.bob_client, 2)
+        self.assertEqual(self.available(), 2)
+        self.assertEqual(list(StockHold.objects.values_list("user_id", "qty")), [(self.alice.pk, 1)])
+
+    def test_changing_and_removing_lines_moves_holds(self):
+        self.add(self.alice_client, 1)
+        self.add(self.alice_client, 3)
+        self.assertEqual(self.available(), 0)
+        self.add(self.alice_client, 2)
+        self.assertEqual(StockHold.objects.get(user=self.alice).qty, 2)
+        self.assertEqual(self.available(), 1)
+        item_id = CartItem.objects.get(cart__user=self.alice).id
+        self.alice_client.post("/api/cart/remove/", {"item_id": item_id}, format="json")
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(self.available(), 3)
+        self.alice_client.post("/api/cart/batch/", {"operations": [{"product_id": self.product.id, "qty": 3}]},
+                               format="json")
+        self.assertEqual(self.available(), 0)
+
+    def test_sweep_releases_expired_holds(self):
+        self.add(self.alice_client, 3)
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        # a rebuilt counter leaves the expired hold out
+        reservations.reconcile([self.product.id])
+        self.assertEqual(self.available(), 3)
+        # a counter that still includes it: the add sweeps the product's expired holds and tries again
+        cache.set(reservations.counter_key(self.product.id), 0)
+        self.assertEqual(self.add(self.bob_client, 1).status_code, 200)
+        self.assertEqual(list(StockHold.objects.values_list("user_id", "qty")), [(self.bob.pk, 1)])
+        self.assertEqual(self.available(), 2)
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command("sweep_stock_holds", stdout=out)
+        self.assertIn("released 1 expired holds", out.getvalue())
+        self.assertEqual(self.available(), 3)
+        self.assertEqual(self.add(self.bob_client, 3).status_code, 200)
+
+    def test_checkout_turns_holds_into_stock(self):
+        self.add(self.alice_client, 2)
+        self.assertEqual(self.alice_client.post("/api/cart/checkout/", format="json").status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(self.available(), 1)
+        # an expired and swept hold: checkout takes the stock from the counter too
+        self.add(self.bob_client, 1)
+        StockHold.objects.all().delete()
+        reservations.reconcile([self.product.id])
+        self.bob_client.post("/api/cart/checkout/", format="json")
+        # the counter follows in the outbox worker, which handles both checkouts' events
+        self.assertEqual(self.available(), 1)
+        self.assertEqual(outbox.drain(), (2, 0))
+        self.assertEqual(self.available(), 0)
+
+    def test_counters_follow_product_edits(self):
+        self.add(self.alice_client, 2)
+        self.product.stock = 10
+        self.product.save()
+        self.assertIsNone(self.available())
+        self.assertEqual(self.add(self.bob_client, 8).status_code, 200)
+        self.assertEqual(self.available(), 0)
+
+    @override_settings(STOCK_HOLD_SECONDS=0)
+    def test_holds_can_be_turned_off(self):
+        self.assertEqual(self.add(self.alice_client, 5).status_code, 200)
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(self.alice_client.post("/api/cart/checkout/", format="json").status_code, 400)
+
+@override_settings(STOCK_HOLD_SECONDS=600)
+class HotProductHoldTest(TransactionTestCase):
+    workers = 16
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name="Hot", category=Category.objects.create(name="H"), price=1, stock=10)
+        self.clients = [shopper(f"hot{i}")[1] for i in range(self.workers)]
+
+    def add(self, client):
+        try:
+            return client.post("/api/cart/add/", {"product_id": self.product.id, "qty": 1}, format="json").status_code
+        finally:
+            connection.close()
+
+    def test_parallel_adds_never_overhold(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            statuses = list(pool.map(self.add, self.clients))
+        self.assertEqual(statuses.count(200), 10)
+        self.assertEqual(StockHold.objects.count(), 10)
+        self.assertEqual(cache.get(reservations.counter_key(self.product.id)), 0)
+        # holds never lock the product row
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 10)
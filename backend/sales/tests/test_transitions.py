@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APIClient, APITestCase
+from sales.models import Order, OutboxEvent
+from sales.transitions import transition_orders
+
+User = get_user_model()
+
+def orders_in(customer, *statuses):
+    return [Order.objects.create(customer=customer, status=status) for status in statuses]
+
+class TransitionGraphTest(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username="graph", password="p").customer
+
+    def test_graph(self):
+        self.assertEqual(Order.sources("shipped"), ["paid"])
+        self.assertEqual(Order.sources("cancelled"), ["paid", "pending"])
+        self.assertEqual(Order.sources("pending"), [])
+        order, = orders_in(self.customer, "paid")
+        self.assertTrue(order.can_transition("shipped"))
+        self.assertFalse(order.can_transition("completed"))
+
+    def test_results_per_order(self):
+        pending, paid, shipped = orders_in(self.customer, "pending", "paid", "shipped")
+        results = transition_orders([pending.id, paid.id, shipped.id, paid.id, 0], "shipped")
+        self.assertEqual(results, {
+            pending.id: ("invalid", "pending"),
+            paid.id: ("transitioned", "shipped"),
+            shipped.id: ("unchanged", "shipped"),
+            0: ("not_found", None),
+        })
+        paid.refresh_from_db()
+        self.assertEqual(paid.status, "shipped")
+        self.assertGreater(paid.updated_at, paid.created_at)
+        self.assertEqual(Order.objects.get(pk=pending.pk).status, "pending")
+        with self.assertRaises(ValueError):
+            transition_orders([paid.id], "lost")
+
+    def test_set_based_with_batched_events(self):
+        few = orders_in(self.customer, *["paid"] * 3)
+        many = orders_in(self.customer, *["paid"] * 30)
+        with CaptureQueriesContext(connection) as small:
+            transition_orders([order.id for order in few], "shipped")
+        with CaptureQueriesContext(connection) as large:
+            transition_orders([order.id for order in many], "shipped")
+        self.assertEqual(len(small), len(large))
+        self.assertTrue(any('"status" IN' in query["sql"] and query["sql"].startswith("UPDATE") for query in large))
+        self.assertEqual(OutboxEvent.objects.filter(topic="order.status_changed").count(), 2)
+        self.assertEqual(OutboxEvent.objects.last().payload, {"status": "shipped", "order_ids": [o.id for o in many]})
+
+    @override_settings(ORDER_TRANSITION_CHUNK_SIZE=4)
+    def test_chunks(self):
+        orders = orders_in(self.customer, *["pending"] * 10)
+        results = transition_orders([order.id for order in orders], "paid")
+        self.assertEqual({result for result, _ in results.values()}, {"transitioned"})
+        self.assertEqual([len(event.payload["order_ids"]) for event in OutboxEvent.objects.all()], [4, 4, 2])
+
+class OrderTransitionApiTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username="fulfil", password="p", is_staff=True)
+        self.buyer = User.objects.create_user(username="buyer", password="p")
+        for user in [self.staff, self.buyer]:
+            app = Application.objects.create(user=user, name=user.username, client_type=Application.CLIENT_PUBLIC,
+                authorization_grant_type=Application.GRANT_PASSWORD)
+            AccessToken.objects.create(user=user, application=app, token=user.username,
+                expires=timezone.now()+timedelta(hours=1), scope="read:orders write:orders")
+        self.paid, self.pending = orders_in(self.buyer.customer, "paid", "pending")
+
+    def as_user(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {user.username}")
+
+    def test_bulk_transition(self):
+        self.as_user(self.staff)
+        resp = self.client.post("/api/orders/transition/",
+                                {"order_ids": [self.paid.id, self.pending.id], "status": "shipped"}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"status": "shipped", "transitioned": 1, "results": [
+            {"id": self.paid.id, "result": "transitioned", "status": "shipped"},
+            {"id": self.pending.id, "result": "invalid", "status": "pending"},
+        ]})
+        resp = self.client.post("/api/orders/transition/", {"order_ids": [self.paid.id], "status": "lost"}, format="json")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_staff_only(self):
+        self.as_user(self.buyer)
+        resp = self.client.post("/api/orders/transition/", {"order_ids": [self.paid.id], "status": "shipped"}, format="json")
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(Order.objects.get(pk=self.paid.pk).status, "paid")
+
+    def test_single_updates_follow_the_graph(self):
+        self.as_user(self.buyer)
+        resp = self.client.patch(f"/api/orders/{self.pending.id}/", {"status": "completed"}, format="json")
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(OutboxEvent.objects.exists())
+        resp = self.client.patch(f"/api/orders/{self.pending.id}/", {"status": "cancelled"}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(OutboxEvent.objects.get().payload, {"status": "cancelled", "order_ids": [self.pending.id]})
+
+class SingleTransitionRaceTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        buyer = User.objects.create_user(username="racer", password="p")
+        app = Application.objects.create(user=buyer, name="racer", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        AccessToken.objects.create(user=buyer, application=app, token="racer",
+            expires=timezone.now()+timedelta(hours=1), scope="read:orders write:orders")
+        self.orders = orders_in(buyer.customer, *["paid"] * 5)
+
+    def patch(self, job):
+        order_id, status = job
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer racer")
+        try:
+            return client.patch(f"/api/orders/{order_id}/", {"status": status}, format="json").status_code
+        finally:
+            connection.close()
+
+    def test_concurrent_updates_follow_the_graph(self):
+        # both leave paid, but neither can follow the other
+        jobs = [(order.id, status) for order in self.orders for status in ["shipped", "cancelled"]]
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            statuses = list(pool.map(self.patch, jobs))
+        for index in range(0, len(jobs), 2):
+            self.assertEqual(sorted(statuses[index:index + 2]), [200, 400])
+        self.assertEqual(OutboxEvent.objects.count(), len(self.orders))
+
+class OrderAdminActionTest(TestCase):
+    def test_mark_shipped_action(self):
+        admin_user = User.objects.create_superuser(username="admin", password="p", email="a@example.com")
+        paid, pending = orders_in(admin_user.customer, "paid", "pending")
+        self.client.force_login(admin_user)
+        resp = self.client.post("/admin/sales/order/", {
+            "action": "mark_shipped", "_selected_action": [paid.id, pending.id],
+        }, follow=True)
+        self.assertContains(resp, "1 order marked as shipped. 1 could not move to shipped from their status.")
+        self.assertEqual(Order.objects.get(pk=paid.pk).status, "shipped")
+        self.assertEqual(Order.objects.get(pk=pending.pk).status, "pending")
@@ -1,10 +1,18 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
 from django.contrib.auth import get_user_model
-from rest_framework.test import APITestCase
+from django.db import connection
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APITestCase
 from oauth2_provider.models import Application, AccessToken
 from django.utils import timezone
 from datetime import timedelta
 from catalog.models import Category, Product
 from sales.models import Cart, CartItem, Order, OrderItem
+from sales import reservations
+from sales.serializers import CartSerializer
 
 User = get_user_model()
 
@@ -42,6 +50,71 @@ class CartCheckoutTest(APITestCase):
         resp = self.client.post("/api/cart/checkout/", format="json")
         self.assertEqual(resp.status_code, 400)
 
+    def test_checkout_rejects_insufficient_stock(self):
+        Product.objects.filter(id=self.product.id).update(stock=2)
+        resp = self.client.post("/api/cart/checkout/", format="json")
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json().get("product_ids"), [self.product.id])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(Cart.objects.get(user=self.user).items.exists())
+
+    def test_checkout_multiple_lines(self):
+        other = Product.objects.create(name="Other", category=self.cat, price=7, stock=4)
+        self.client.post("/api/cart/add/", {"product_id": other.id, "qty": 4}, format="json")
+        resp = self.client.post("/api/cart/checkout/", format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()["items"]), 2)
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.product.stock, other.stock), (7, 0))
+
+@skipUnlessDBFeature("has_select_for_update")
+class CheckoutConcurrencyTest(TransactionTestCase):
+    workers = 16
+
+    def setUp(self):
+        cat = Category.objects.create(name="Hot")
+        self.first = Product.objects.create(name="Hot1", category=cat, price=5, stock=10)
+        self.second = Product.objects.create(name="Hot2", category=cat, price=8, stock=10)
+        self.tokens = []
+        for i in range(self.workers):
+            user = User.objects.create_user(username=f"buyer{i}", password="p")
+            app = Application.objects.create(
+                user=user, name=f"buyer_app{i}", client_type=Application.CLIENT_PUBLIC,
+                authorization_grant_type=Application.GRANT_PASSWORD
+            )
+            token = AccessToken.objects.create(
+                user=user, application=app, token=f"buyer{i}",
+                expires=timezone.now()+timedelta(hours=1), scope="write:cart read:cart"
+            )
+            cart = Cart.objects.create(user=user)
+            # alternate line order so lock ordering is exercised
+            products = [self.first, self.second] if i % 2 else [self.second, self.first]
+            for product in products:
+                CartItem.objects.create(cart=cart, product=product, qty=1, price=product.price)
+            self.tokens.append(token.token)
+
+    def checkout(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        try:
+            return client.post("/api/cart/checkout/", format="json").status_code
+        finally:
+            connection.close()
+
+    def test_parallel_checkouts_never_oversell(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            statuses = list(pool.map(self.checkout, self.tokens))
+        self.assertEqual(statuses.count(200), 10)
+        self.assertEqual(statuses.count(400), self.workers - 10)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.stock, self.second.stock), (0, 0))
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertEqual(OrderItem.objects.count(), 20)
+
 class CartFlowTest(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="u1", password="p")
@@ -73,6 +146,188 @@ class CartFlowTest(APITestCase):
         item_id = CartItem.objects.get(cart__user=self.user).id
         self.assertEqual(self.client.post("/api/cart/remove/", {"item_id": item_id}, format="json").status_code, 200)
 
+    def test_cart_lines_use_product_summary(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.write_token.token}")
+        others = [Product.objects.create(name=f"Lean {i}", category=self.cat, price=2, stock=5) for i in range(3)]
+        for prod in [self.prod, *others]:
+            self.client.post("/api/cart/add/", {"product_id": prod.id, "qty": 1}, format="json")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.read_token.token}")
+        self.client.get("/api/cart/")
+        # token cached: cart, then its lines with their products joined
+        with self.assertNumQueries(2):
+            resp = self.client.get("/api/cart/")
+        items = resp.json()["items"]
+        self.assertEqual(len(items), 4)
+        self.assertEqual(set(items[0]["product"]), {"id", "slug", "name", "thumbnail", "price", "stock"})
+        resp = self.client.get("/api/cart/?expand=product")
+        self.assertIn("specifications", resp.json()["items"][0]["product"])
+
+class CartMutationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="mut", password="p")
+        app = Application.objects.create(user=self.user, name="mut", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        AccessToken.objects.create(user=self.user, application=app, token="mut",
+            expires=timezone.now()+timedelta(hours=1), scope="read:cart write:cart")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer mut")
+        cat = Category.objects.create(name="Mut")
+        self.products = [Product.objects.create(name=f"M{i}", category=cat, price=i + 2, stock=5) for i in range(3)]
+        for prod in self.products:
+            prod.images.create(url=f"https://img.example/{prod.id}.jpg")
+
+    def add(self, prod, qty=1, query=""):
+        return self.client.post(f"/api/cart/add/{query}", {"product_id": prod.id, "qty": qty}, format="json")
+
+    def test_cart_created_on_first_write(self):
+        resp = self.client.get("/api/cart/")
+        self.assertEqual(resp.json(), {"id": None, "items": [], "total_amount": 0.0})
+        self.assertEqual(self.client.get("/api/cart/?fields=total_amount").json(), {"total_amount": 0.0})
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        self.assertEqual(self.add(self.products[0]).status_code, 200)
+        self.assertEqual(self.add(self.products[1]).status_code, 200)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+        item_ids = CartItem.objects.filter(cart__user=self.user).values_list("id", flat=True)
+        for item_id in item_ids:
+            self.client.post("/api/cart/remove/", {"item_id": item_id}, format="json")
+        emptied = self.client.get("/api/cart/").json()
+        self.assertEqual({**emptied, "id": None}, resp.json())
+
+    def test_add_upserts_line_and_totals(self):
+        self.add(self.products[0], qty=2)
+        Product.objects.filter(pk=self.products[0].pk).update(price=7)
+        data = self.add(self.products[0], qty=3).json()
+        self.assertEqual(len(data["items"]), 1)
+        self.assertEqual((data["items"][0]["qty"], data["items"][0]["price"]), (3, "7.00"))
+        self.assertEqual(Cart.objects.get(user=self.user).total, 21)
+        self.assertEqual(float(data["total_amount"]), 21)
+
+    def test_mutation_query_counts(self):
+        self.add(self.products[0])
+        # stock counters loaded, as they are for products in demand
+        reservations.reconcile([prod.id for prod in self.products])
+        # token cached: product price, savepoint, held qty, hold upsert, cart upsert, line upsert, totals,
+        # release, cart, lines
+        with self.assertNumQueries(10):
+            self.add(self.products[1])
+        item_id = CartItem.objects.get(cart__user=self.user, product=self.products[1]).id
+        # savepoint, line, delete, held qty, release hold, totals, release, cart, lines
+        with self.assertNumQueries(9):
+            self.client.post("/api/cart/remove/", {"item_id": item_id}, format="json")
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.post("/api/cart/add/", {"product_id": 0}, format="json").status_code, 400)
+        self.assertEqual(self.client.post("/api/cart/add/", {"product_id": "x"}, format="json").status_code, 400)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        other = User.objects.create_user(username="other", password="p")
+        line = Cart.objects.create(user=other).items.create(product=self.products[0], qty=1, price=2)
+        for item_id in [line.id, "x", None]:
+            with self.subTest(item_id=item_id):
+                resp = self.client.post("/api/cart/remove/", {"item_id": item_id}, format="json")
+                self.assertEqual(resp.status_code, 400)
+        self.assertTrue(CartItem.objects.filter(pk=line.pk).exists())
+
+    def test_delta_responses(self):
+        self.add(self.products[0])
+        data = self.add(self.products[1], qty=2, query="?return=delta").json()
+        self.assertEqual([item["product"]["id"] for item in data["items"]], [self.products[1].id])
+        self.assertEqual(data["removed"], [])
+        self.assertEqual(float(data["total_amount"]), 2 + 3 * 2)
+        full = self.client.get("/api/cart/").json()
+        self.assertIn(data["items"][0], full["items"])
+        item_id = data["items"][0]["id"]
+        data = self.client.post("/api/cart/remove/?return=delta", {"item_id": item_id}, format="json").json()
+        self.assertEqual(data, {"items": [], "removed": [item_id], "total_amount": 2.0})
+
+    def test_responses_match_serializer(self):
+        for prod in self.products:
+            self.add(prod, qty=2)
+        cart = Cart.objects.get(user=self.user)
+        for url in ["/api/cart/", "/api/cart/?expand=product", "/api/cart/?fields=items.qty,total_amount",
+                    "/api/cart/?omit=items.product"]:
+            with self.subTest(url=url):
+                resp = self.client.get(url)
+                context = {"request": Request(resp.wsgi_request)}
+                expected = json.loads(JSONRenderer().render(CartSerializer(cart, context=context).data))
+                data = resp.json()
+                for payload in (data, expected):
+                    payload.get("items", []).sort(key=lambda item: item.get("id", 0))
+                self.assertEqual(data, expected)
+
+class CartBatchTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="batch", password="p")
+        app = Application.objects.create(user=self.user, name="batch", client_type=Application.CLIENT_PUBLIC,
+            authorization_grant_type=Application.GRANT_PASSWORD)
+        AccessToken.objects.create(user=self.user, application=app, token="batch",
+            expires=timezone.now()+timedelta(hours=1), scope="read:cart write:cart")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer batch")
+        cat = Category.objects.create(name="Batch")
+        self.products = [Product.objects.create(name=f"B{i}", category=cat, price=i + 1, stock=9) for i in range(12)]
+
+    def batch(self, operations, query="", **data):
+        return self.client.post(f"/api/cart/batch/{query}", {"operations": operations, **data}, format="json")
+
+    def lines(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list("product_id", "qty"))
+
+    def test_sets_and_removes_lines(self):
+        p = self.products
+        self.batch([{"product_id": p[0].id, "qty": 1}, {"product_id": p[1].id, "qty": 1},
+                    {"product_id": p[2].id, "qty": 1}])
+        removed = CartItem.objects.get(cart__user=self.user, product=p[1]).id
+        resp = self.batch([{"product_id": p[0].id, "qty": 4}, {"product_id": p[3].id, "qty": 2},
+                           {"item_id": removed}, {"product_id": p[2].id, "qty": 0}])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.lines(), {p[0].id: 4, p[3].id: 2})
+        self.assertEqual(float(resp.json()["total_amount"]), 4 * 1 + 2 * 4)
+        self.assertEqual(len(resp.json()["items"]), 2)
+        self.assertEqual(Cart.objects.get(user=self.user).total, 12)
+
+    def test_merge_adds_to_existing_lines(self):
+        p = self.products
+        self.batch([{"product_id": p[0].id, "qty": 1}])
+        self.batch([{"product_id": p[0].id, "qty": 2}, {"product_id": p[1].id, "qty": 1},
+                    {"product_id": p[1].id, "qty": 1}], merge=True)
+        self.assertEqual(self.lines(), {p[0].id: 3, p[1].id: 2})
+
+    def test_query_count_independent_of_operations(self):
+        self.batch([{"product_id": self.products[0].id, "qty": 1}])
+        reservations.reconcile([prod.id for prod in self.products])
+        # token cached: prices, savepoint, held qty, hold upsert, cart upsert, line upsert, totals, release,
+        # cart, lines
+        for count in [1, 10]:
+            operations = [{"product_id": prod.id, "qty": 2} for prod in self.products[:count]]
+            with self.subTest(count=count), self.assertNumQueries(10):
+                self.batch(operations)
+        # merging reads the lines already in the cart once
+        with self.assertNumQueries(11):
+            self.batch(operations, merge=True)
+        # removals: their lines, one delete, then their holds and one delete
+        item_id = CartItem.objects.get(product=self.products[2]).id
+        with self.assertNumQueries(14):
+            self.batch([{"product_id": self.products[0].id, "qty": 3}, {"product_id": self.products[1].id, "qty": 0},
+                        {"item_id": item_id}])
+
+    def test_invalid_operations(self):
+        p = self.products
+        self.batch([{"product_id": p[0].id, "qty": 1}])
+        for operations in [[], [{"product_id": p[1].id}], [{"qty": 1}], [{"product_id": p[1].id, "qty": -1}],
+                           [{"product_id": p[1].id, "qty": 1, "item_id": 1}], "nope"]:
+            with self.subTest(operations=operations):
+                self.assertEqual(self.batch(operations).status_code, 400)
+        resp = self.batch([{"product_id": p[1].id, "qty": 1}, {"product_id": 0, "qty": 1}])
+        self.assertEqual(resp.json(), {"error": "Invalid product_id", "product_ids": [0]})
+        self.assertEqual(self.lines(), {p[0].id: 1})
+
+    def test_delta(self):
+        p = self.products
+        self.batch([{"product_id": p[0].id, "qty": 1}, {"product_id": p[1].id, "qty": 1}])
+        removed = CartItem.objects.get(cart__user=self.user, product=p[0]).id
+        data = self.batch([{"item_id": removed}, {"product_id": p[2].id, "qty": 2}], query="?return=delta").json()
+        self.assertEqual([item["product"]["id"] for item in data["items"]], [p[2].id])
+        self.assertEqual(data["removed"], [removed])
+        self.assertEqual(float(data["total_amount"]), 2 + 2 * 3)
+
 class CheckoutResponseTest(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="u2", password="p2")
@@ -117,6 +372,61 @@ class OrderViewSetTest(APITestCase):
         other = Order.objects.exclude(id=self.ord1.id).first()
         self.assertEqual(self.client.get(f"/api/orders/{other.id}/").status_code, 404)
 
+    def test_keyset_pagination(self):
+        for _ in range(4):
+            Order.objects.create(customer=self.ord1.customer, status="paid")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.t1.token}")
+        ids, url = [], "/api/orders/?cursor=&page_size=2"
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(o["id"] for o in data["results"])
+            url = data["next"]
+        expected = Order.objects.filter(customer=self.ord1.customer).order_by("-created_at", "-id")
+        self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+
+    def test_line_items_use_product_summary(self):
+        cat = Category.objects.create(name="Lean")
+        for i in range(3):
+            order = Order.objects.create(customer=self.ord1.customer, status="paid")
+            for j in range(3):
+                prod = Product.objects.create(name=f"L{i}{j}", category=cat, price=2, stock=5, description="long text")
+                prod.images.create(url=f"https://img.example/{i}{j}-a.jpg")
+                prod.images.create(url=f"https://img.example/{i}{j}-b.jpg")
+                prod.specifications.create(name="Color", value="Red")
+                OrderItem.objects.create(order=order, product=prod, qty=1, price=2)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.t1.token}")
+        self.client.get("/api/orders/")
+        # token cached: count, orders (+customer, user), items (+products with thumbnails)
+        with self.assertNumQueries(3):
+            resp = self.client.get("/api/orders/")
+        order = next(o for o in resp.json()["results"] if o["items"])
+        product = order["items"][0]["product"]
+        self.assertEqual(set(product), {"id", "slug", "name", "thumbnail", "price"})
+        self.assertTrue(product["thumbnail"].endswith("-a.jpg"))
+        # the full product on request: joined to its line, plus specifications and images
+        with self.assertNumQueries(5):
+            resp = self.client.get("/api/orders/?expand=product")
+        product = next(o for o in resp.json()["results"] if o["items"])["items"][0]["product"]
+        self.assertEqual(product["description"], "long text")
+        self.assertEqual(len(product["images"]), 2)
+
+    def test_sparse_fieldsets_shape_queries(self):
+        cat = Category.objects.create(name="Sparse")
+        prod = Product.objects.create(name="S1", category=cat, price=2, stock=5)
+        OrderItem.objects.create(order=self.ord1, product=prod, qty=2, price=2)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.t1.token}")
+        self.client.get("/api/orders/")
+        # count and orders only: no customer join, no line prefetch
+        with self.assertNumQueries(2) as ctx:
+            resp = self.client.get("/api/orders/?fields=id,status,total")
+        self.assertEqual(resp.json()["results"][0], {"id": self.ord1.id, "status": "pending", "total": "4.00"})
+        self.assertNotIn("sales_customer\".\"phone", ctx.captured_queries[1]["sql"])
+        resp = self.client.get("/api/orders/?fields=id,items.subtotal,items.product.name")
+        self.assertEqual(resp.json()["results"][0]["items"], [{"subtotal": "4.00", "product": {"name": "S1"}}])
+        resp = self.client.get("/api/orders/?omit=customer,items")
+        self.assertNotIn("customer", resp.json()["results"][0])
+        self.assertIn("total_amount", resp.json()["results"][0])
+
 class CustomerViewSetTest(APITestCase):
     def setUp(self):
         u = User.objects.create_user(username="cust", password="pass")
@@ -0,0 +1,49 @@
+# sales/transitions.py: moving many orders along Order.TRANSITIONS at once
+# - transition_orders() works through the ids in chunks of ORDER_TRANSITION_CHUNK_SIZE, each in one
+#   transaction of set-based statements: a SELECT ... FOR UPDATE of the chunk's current statuses and a
+#   single UPDATE ... WHERE id IN (...) AND status IN (the statuses allowed to move to the target)
+# - Every order gets a result: transitioned, unchanged (already in the target status), invalid (not
+#   allowed from its status) or not_found
+# - Each chunk publishes one order.status_changed outbox event listing the orders it moved, rather
+#   than one event per order (see sales/outbox.py)
+# - Used by POST /api/orders/transition/ (staff only) and the OrderAdmin actions
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from . import outbox
+from .models import Order
+
+TRANSITIONED, UNCHANGED, INVALID, NOT_FOUND = 'transitioned', 'unchanged', 'invalid', 'not_found'
+
+
+def transition_orders(order_ids, status, orders=None):
+    """
+    Move the orders in `order_ids` (among `orders`, all orders by default) to `status` where the graph
+    allows it. Returns {order_id: (result, status the order is in now, None when not found)}.
+    """
+    if status not in Order.TRANSITIONS:
+        raise ValueError(f'Unknown order status {status!r}')
+    orders = Order.objects.all() if orders is None else orders
+    sources = Order.sources(status)
+    ids = list(dict.fromkeys(order_ids))
+    results = {}
+    for start in range(0, len(ids), settings.ORDER_TRANSITION_CHUNK_SIZE):
+        chunk = ids[start:start + settings.ORDER_TRANSITION_CHUNK_SIZE]
+        with transaction.atomic():
+            # locked in id order, so concurrent bulk transitions cannot deadlock
+            current = dict(orders.filter(id__in=chunk).select_for_update().order_by('id').values_list('id', 'status'))
+            moved = sorted(order_id for order_id, previous in current.items() if previous in sources)
+            if moved:
+                Order.objects.filter(id__in=moved, status__in=sources).update(status=status, updated_at=timezone.now())
+                outbox.publish('order.status_changed', [{'status': status, 'order_ids': moved}])
+        moved = set(moved)
+        for order_id in chunk:
+            previous = current.get(order_id)
+            if previous is None:
+                results[order_id] = (NOT_FOUND, None)
+            elif order_id in moved:
+                results[order_id] = (TRANSITIONED, status)
+            else:
+                results[order_id] = (UNCHANGED if previous == status else INVALID, previous)
+    return results
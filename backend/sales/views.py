@@ -1,25 +1,66 @@
 # sales/views.py: API endpoints for Customer, Order, OrderItem, and Cart management
 # - Secured via OAuth2 scopes (read:customers/write:customers, read:orders/write:orders, read:cart/write:cart) using MethodScopedTokenHasScope
 # - Querysets filtered to request.user for Customer, Orders, and OrderItems
-# - CartViewSet offers custom cart actions (list, add, remove, checkout) scoped to request.user
+# - CartViewSet offers custom cart actions (list, add, remove, batch, checkout) scoped to request.user
+# - batch applies a list of set-qty/remove operations (or merges a guest cart with merge=true) in one
+#   transaction: one product lookup, one line upsert, one delete and one totals UPDATE
+# - Order and cart lines embed a product summary; ?expand=product returns the full product instead
+# - ?fields=/?omit= select the response shape, which also shapes the queryset (see ecomm/serializers.py)
+# - Order list/retrieve skip the serializers and render values() rows (see ecomm/fastread.py)
+# - Under ASGI, the cart list runs as an async view (see ecomm/asyncviews.py)
+# - Cart lines live in the store named by settings.CART_STORE (see sales/carts.py): Cart/CartItem rows,
+#   created on the user's first write, or the cache with periodic flushes; ?return=delta on mutations
+#   returns only the changed lines
+# - Adding to the cart holds the stock for a while and fails when none is left (see sales/reservations.py)
+# - Checkout takes stock from the products' stock slots and refreshes Product.stock from them once
+#   the order committed; the order.placed outbox handler redoes the refresh if that fails (see
+#   catalog/inventory.py, sales/handlers.py)
+# - add, remove, batch and checkout honour an Idempotency-Key header: a retried request gets the first
+#   response back instead of running twice (see ecomm/idempotency.py)
+# - Checkout publishes an order.placed outbox event in the order's transaction; the work that follows
+#   an order runs in manage.py process_outbox (see sales/outbox.py)
+# - POST /api/orders/transition/ (staff) moves orders between statuses in bulk along Order.TRANSITIONS;
+#   single updates must follow the same graph, checked against the order's row locked FOR UPDATE, so
+#   concurrent updates cannot chain into a forbidden move (see sales/transitions.py)
+# - Order GETs read from a replica when replicas are configured, unless the user just wrote (see ecomm/replicas.py)
 
+import logging
 from rest_framework.viewsets import ModelViewSet, ViewSet
-from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from accounts.authentication import CachedOAuth2Authentication
 from catalog.views import MethodScopedTokenHasScope
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from . import outbox, reservations
+from .carts import get_cart_store
+from .transitions import TRANSITIONED, transition_orders
 from .models import Customer, Order, OrderItem, Cart, CartItem
-from .serializers import CustomerSerializer, OrderSerializer, OrderItemSerializer, CartSerializer
+from .serializers import (
+    CustomerSerializer, OrderSerializer, OrderItemSerializer, CartSerializer, CartBatchSerializer,
+    OrderTransitionSerializer,
+)
 from catalog.models import Product
+from catalog.cache import invalidate_stock
+from catalog.inventory import take_stock
+from django.db import DatabaseError, transaction
+from django.db.models import Subquery, prefetch_related_objects
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
+from drf_spectacular.utils import extend_schema
+from ecomm.asyncviews import AsyncViewMixin
+from ecomm.pagination import OptionalKeysetPagination
+from ecomm.fastread import FastReadMixin
+from ecomm.idempotency import idempotent
+from ecomm.replicas import ReplicaReadMixin
+from ecomm.serializers import ShapedQuerysetMixin
 
-class CustomerViewSet(ModelViewSet):
+logger = logging.getLogger(__name__)
+
+class CustomerViewSet(ShapedQuerysetMixin, ModelViewSet):
     """
     manage the Customer profile for the authenticated user
     """
-    authentication_classes = [OAuth2Authentication]
+    authentication_classes = [CachedOAuth2Authentication]
     permission_classes = [IsAuthenticated, MethodScopedTokenHasScope]
     required_scopes = {
         'GET': ['read:customers'],
@@ -33,11 +74,12 @@ class CustomerViewSet(ModelViewSet):
         return Customer.objects.filter(user=self.request.user).order_by('id')
     serializer_class = CustomerSerializer
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(FastReadMixin, ReplicaReadMixin, ModelViewSet):
     """
     List and manipulate Orders belonging to the authenticated user
+    Pass ?cursor to switch from page numbers to keyset pagination.
     """
-    authentication_classes = [OAuth2Authentication]
+    authentication_classes = [CachedOAuth2Authentication]
     permission_classes = [IsAuthenticated, MethodScopedTokenHasScope]
     required_scopes = {
         'GET': ['read:orders'],
@@ -47,17 +89,55 @@ class OrderViewSet(ModelViewSet):
         'DELETE': ['write:orders'],
     }
     def get_queryset(self):
-        return Order.objects.select_related("customer").prefetch_related("items__product").filter(customer__user=self.request.user).order_by('-created_at')
+        # customer_id = (SELECT ...) rather than a join, so the (customer, -created_at) indexes serve
+        # the ordering
+        customer = Customer.objects.filter(user=self.request.user).values('id')
+        orders = Order.objects.filter(customer=Subquery(customer)).order_by('-created_at')
+        if self.action in ('update', 'partial_update'):
+            orders = orders.select_for_update(of=('self',))
+        return orders
     serializer_class = OrderSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = {'status': ['exact'], 'created_at': ['gte']}
     ordering_fields = ['created_at']
+    pagination_class = OptionalKeysetPagination
+
+    def update(self, request, *args, **kwargs):
+        # the order is loaded locked, so its status is validated against stays current until it is written
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        previous = serializer.instance.status
+        order = serializer.save()
+        if order.status != previous:
+            outbox.publish('order.status_changed', [{'status': order.status, 'order_ids': [order.id]}])
 
-class OrderItemViewSet(ModelViewSet):
+    @extend_schema(request=OrderTransitionSerializer)
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdminUser, MethodScopedTokenHasScope])
+    def transition(self, request):
+        """
+        Staff only: move any orders to a status in bulk, where Order.TRANSITIONS allows it, with a result per order.
+        """
+        serializer = OrderTransitionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': 'Invalid transition', 'detail': serializer.errors}, status=400)
+        status = serializer.validated_data['status']
+        results = transition_orders(serializer.validated_data['order_ids'], status)
+        return Response({
+            'status': status,
+            'transitioned': sum(result == TRANSITIONED for result, _ in results.values()),
+            'results': [
+                {'id': order_id, 'result': result, 'status': current}
+                for order_id, (result, current) in results.items()
+            ],
+        })
+
+class OrderItemViewSet(ShapedQuerysetMixin, ModelViewSet):
     """
     manage OrderItems within the authenticated user's Orders
     """
-    authentication_classes = [OAuth2Authentication]
+    authentication_classes = [CachedOAuth2Authentication]
     permission_classes = [IsAuthenticated, MethodScopedTokenHasScope]
     required_scopes = {
         'GET': ['read:orders'],
@@ -68,68 +148,180 @@ class OrderItemViewSet(ModelViewSet):
     }
     def get_queryset(self):
         # enforce consistent ordering to satisfy pagination requirements
-        return OrderItem.objects.select_related("order", "product").filter(order__customer__user=self.request.user).order_by('id')
+        return OrderItem.objects.filter(order__customer__user=self.request.user).order_by('id')
     serializer_class = OrderItemSerializer
 
-class CartViewSet(ViewSet):
+class CartViewSet(AsyncViewMixin, ViewSet):
     """
-    custom actions (list, add, remove, checkout) for the authenticated user's cart
+    custom actions (list, add, remove, batch, checkout) for the authenticated user's cart
+    Mutations accept ?return=delta to get back only the changed lines, removed line ids and the new total,
+    and an Idempotency-Key header that makes retries return the first response.
     """
-    authentication_classes = [OAuth2Authentication]
+    authentication_classes = [CachedOAuth2Authentication]
     permission_classes = [IsAuthenticated, MethodScopedTokenHasScope]
     required_scopes = {
         'GET': ['read:cart'],
         'POST': ['write:cart'],
     }
+    serializer_class = CartSerializer
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
+        return self.serializer_class(*args, **kwargs)
+
+    def get_store(self):
+        return get_cart_store(self.request.user.pk)
+
+    def mutation_response(self, store, changed=(), removed=()):
+        """
+        The whole cart, or with ?return=delta the lines of the `changed` products, the `removed` line ids
+        and the new total.
+        """
+        if self.request.query_params.get('return') != 'delta':
+            return Response(store.render(self))
+        return Response({
+            'items': store.render_lines(self, changed),
+            'removed': list(removed),
+            'total_amount': store.total(),
+        })
 
     def list(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.get_store().render(self))
+
+    async def alist(self, request):
+        return Response(await self.get_store().arender(self))
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def add(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
         product_id = request.data.get('product_id')
-        qty = int(request.data.get('qty', 1))
         try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+            qty = int(request.data.get('qty', 1))
+        except (TypeError, ValueError):
+            qty = 0
+        if qty < 1:
+            return Response({'error': 'Invalid qty'}, status=400)
+        try:
+            price = Product.objects.filter(id=product_id).values_list('price', flat=True).first()
+        except (TypeError, ValueError):
+            price = None
+        if price is None:
             return Response({'error': 'Invalid product_id'}, status=400)
-        item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product,
-            defaults={'price': product.price, 'qty': qty}
-        )
-        if not created:
-            item.qty = qty
-            item.price = product.price
-            item.save()
-        return Response(CartSerializer(cart).data)
+        product_id = int(product_id)
+        store = self.get_store()
+        # the stock counters do not roll back with the cart's transaction
+        with reservations.undo_on_error(), store.mutation():
+            unavailable = reservations.reserve(request.user.pk, {product_id: qty})
+            if unavailable:
+                return Response({'error': 'Insufficient stock', 'product_ids': unavailable}, status=400)
+            store.save_lines({product_id: (qty, price)})
+        return self.mutation_response(store, changed=[product_id])
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def remove(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        item_id = request.data.get('item_id')
         try:
-            item = CartItem.objects.get(id=item_id, cart=cart)
-            item.delete()
-        except CartItem.DoesNotExist:
+            item_id = int(request.data.get('item_id'))
+        except (TypeError, ValueError):
             return Response({'error': 'Invalid item_id'}, status=400)
-        return Response(CartSerializer(cart).data)
+        store = self.get_store()
+        with store.mutation():
+            removed = store.remove(item_ids=[item_id])
+            reservations.release(request.user.pk, list(removed.values()))
+        if not removed:
+            return Response({'error': 'Invalid item_id'}, status=400)
+        return self.mutation_response(store, removed=list(removed))
+
+    @extend_schema(request=CartBatchSerializer)
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def batch(self, request):
+        """
+        Apply several set-qty/remove operations in one transaction and return the resulting cart.
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': 'Invalid operations', 'detail': serializer.errors}, status=400)
+        merge = serializer.validated_data['merge']
+        quantities, item_ids = {}, set()
+        # later operations on the same product replace earlier ones, or add to them when merging
+        for operation in serializer.validated_data['operations']:
+            if 'item_id' in operation:
+                item_ids.add(operation['item_id'])
+            else:
+                product_id = operation['product_id']
+                quantities[product_id] = operation['qty'] + (quantities.get(product_id, 0) if merge else 0)
+        prices = dict(Product.objects.filter(id__in=quantities).order_by().values_list('id', 'price')) if quantities else {}
+        unknown = sorted(quantities.keys() - prices.keys())
+        if unknown:
+            return Response({'error': 'Invalid product_id', 'product_ids': unknown}, status=400)
+        store = self.get_store()
+        with reservations.undo_on_error(), store.mutation():
+            if merge and quantities:
+                for product_id, qty in store.quantities(quantities).items():
+                    quantities[product_id] += qty
+            lines = {product_id: (qty, prices[product_id]) for product_id, qty in quantities.items() if qty}
+            unavailable = reservations.reserve(request.user.pk, {product_id: qty for product_id, (qty, _) in lines.items()})
+            if unavailable:
+                return Response({'error': 'Insufficient stock', 'product_ids': unavailable}, status=400)
+            if lines:
+                store.save_lines(lines)
+            removed = {}
+            zeroed = [product_id for product_id, qty in quantities.items() if not qty]
+            if item_ids or zeroed:
+                removed = store.remove(item_ids=sorted(item_ids), product_ids=zeroed)
+                reservations.release(request.user.pk, list(removed.values()))
+        return self.mutation_response(store, changed=list(lines), removed=list(removed))
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def checkout(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        if not cart.items.exists():
-            return Response({'error': 'Cart is empty'}, status=400)
-        customer = request.user.customer
-        order = Order.objects.create(customer=customer, status='pending')
-        for item in cart.items.all():
-            OrderItem.objects.create(order=order, product=item.product, qty=item.qty, price=item.price)
-            # decrement product stock
-            product = item.product
-            product.stock -= item.qty
-            product.save()
-        cart.items.all().delete()
-        serializer = OrderSerializer(order)
-        return Response(serializer.data)
\ No newline at end of file
+        store = self.get_store()
+        # checkout may wait on stock slot row locks for longer than the lock's timeout
+        with store.locked(keep_alive=True):
+            # the order is built from the cart's rows
+            store.flush()
+            response = self.place_order(request)
+            if response.status_code == 200:
+                store.discard()
+        return response
+
+    def place_order(self, request):
+        """
+        Turn the cart's rows into an order, taking the stock, and empty the cart; all or nothing.
+        """
+        with transaction.atomic():
+            items = list(CartItem.objects.filter(cart__user=request.user).order_by('product_id'))
+            if not items:
+                return Response({'error': 'Cart is empty'}, status=400)
+            # stock comes from the products' stock slots, not their rows (see catalog/inventory.py)
+            product_ids = [item.product_id for item in items]
+            unavailable = take_stock({item.product_id: item.qty for item in items})
+            if unavailable:
+                transaction.set_rollback(True)
+                return Response({'error': 'Insufficient stock', 'product_ids': unavailable}, status=400)
+            held = reservations.convert(request.user.pk, product_ids)
+            customer = request.user.customer
+            subtotal = sum(item.subtotal for item in items)
+            order = Order.objects.create(customer=customer, status='pending', subtotal=subtotal, total=subtotal)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=item.product_id, qty=item.qty, price=item.price)
+                for item in items
+            ])
+            CartItem.objects.filter(cart__user=request.user).delete()
+            Cart.objects.filter(user=request.user).update(subtotal=0, total=0)
+            # stock accounting, confirmation, analytics and the like follow in the outbox worker
+            outbox.publish('order.placed', [{'order_id': order.id, 'held': held}])
+        # the product rows are only locked for this short UPDATE, after the order committed; should it
+        # fail, the order stands and the order.placed handler refreshes the stock instead
+        try:
+            Product.objects.filter(id__in=product_ids).refresh_stock()
+            invalidate_stock(product_ids)
+        except DatabaseError:
+            logger.exception('Refreshing the stock of order %s failed', order.id)
+        serializer = OrderSerializer(order, context={'request': request})
+        prefetch_related_objects([order], *serializer.query_shape().prefetch)
+        return Response(serializer.data)
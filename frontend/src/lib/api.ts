@@ -121,13 +121,37 @@ export async function removeFromCart(itemId: number, token?: string) {
   return data;
 }
 
+export type CartOperation = { product_id: number; qty: number } | { item_id: number };
+
+// Apply several cart changes in one request: set a product's qty (0 removes it) or remove a line by id.
+// With merge, quantities are added to the lines already in the cart (e.g. a guest cart at login).
+export async function updateCart(operations: CartOperation[], merge: boolean = false, token?: string) {
+  const res = await fetch(`${API_BASE}/cart/batch/`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...getAuthHeaders(token),
+    },
+    body: JSON.stringify({ operations, merge }),
+  });
+  let data: any;
+  try { data = await res.json(); } catch { data = null; }
+  if (!res.ok) {
+    const msg = data?.error || data?.detail || `Failed to update cart (${res.status})`;
+    throw new Error(msg);
+  }
+  return data;
+}
+
 // Checkout cart
-export async function checkoutCart(token?: string) {
+// Pass the same idempotencyKey when retrying, so a checkout that did go through is not placed twice
+export async function checkoutCart(token?: string, idempotencyKey?: string) {
   const res = await fetch(`${API_BASE}/cart/checkout/`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
       ...getAuthHeaders(token),
+      ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}),
     },
   });
   let data: any;